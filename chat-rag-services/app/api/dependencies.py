@@ -1,7 +1,9 @@
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
+from app.db.async_graph import AsyncNeo4jGraph
 from app.db.graph_db import GraphDBDataAccess
+from app.db.schema import create_vector_index
 from app.services.chat import QAEngine
 from langchain_community.graphs import Neo4jGraph
 
@@ -25,7 +27,13 @@ async def initialize_deps(app: FastAPI):
     global graph_db_dao
 
     db = Neo4jGraph(sanitize=True)
-    qa_engine = QAEngine(db)
+    create_vector_index(db)
+    # the chat requests query with the async driver, so they don't block
+    # the event loop while they wait on Neo4j
+    async_db = AsyncNeo4jGraph()
+    qa_engine = QAEngine(async_db)
     graph_db_dao = GraphDBDataAccess(db)
 
     yield
+
+    await async_db.close()
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from app.models.chat import ChatRequest
 from app.api.dependencies import get_engine
 from app.services.processor.completions import QAEngine
-from app.services.chat import get_chat_completions
+from app.services.chat import get_chat_completions, stream_chat_completions
 
 router = APIRouter()
 
@@ -10,7 +11,20 @@ router = APIRouter()
 @router.post("/completions")
 async def get_completion(req: ChatRequest, qa_engine: QAEngine = Depends(get_engine)):
     try:
-        result = get_chat_completions(qa_engine, req.questions, req.session)
+        result = await get_chat_completions(qa_engine, req.questions, req.session)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/completions/stream")
+async def stream_completion(
+    req: ChatRequest, qa_engine: QAEngine = Depends(get_engine)
+):
+    # when the client disconnects, starlette cancels the generator, which
+    # cancels the LLM request it is waiting on
+    return StreamingResponse(
+        stream_chat_completions(qa_engine, req.questions, req.session),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
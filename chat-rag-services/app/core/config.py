@@ -8,6 +8,7 @@ class Settings(BaseSettings):
     EMBEDDING_DIMENSION: int = 768
     CHAT_SEARCH_KWARG_SCORE_THRESHOLD: float = 0.7
     CHAT_EMBEDDING_FILTER_SCORE_THRESHOLD: float = 0.10
+    CHAT_EMBEDDING_BATCH_SIZE: int = 5
 
     ANTHROPIC_MODEL_NAME: str = os.getenv(
         "ANTHROPIC_MODEL_NAME", "claude-3-5-sonnet@20240620"
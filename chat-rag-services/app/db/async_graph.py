@@ -0,0 +1,55 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional
+from neo4j import AsyncGraphDatabase, Driver, GraphDatabase
+
+
+class AsyncNeo4jGraph:
+    """Neo4jGraph on the async driver, for the chat requests: a query waits on
+    the event loop instead of holding it. Takes its settings from the same
+    NEO4J_* environment variables.
+
+    `sync_query` serves the sync methods of the LangChain interfaces built on
+    it, on a sync driver opened on first use (the async driver only runs on
+    the event loop it was first used on)."""
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        database: Optional[str] = None,
+    ):
+        self._url = url or os.environ["NEO4J_URI"]
+        self._auth = (
+            username or os.environ["NEO4J_USERNAME"],
+            password or os.environ["NEO4J_PASSWORD"],
+        )
+        self._driver = AsyncGraphDatabase.driver(self._url, auth=self._auth)
+        self._sync_driver: Optional[Driver] = None
+        self._sync_lock = threading.Lock()
+        self._database = database or os.getenv("NEO4J_DATABASE", "neo4j")
+
+    async def query(
+        self, query: str, params: Dict[str, Any] = {}
+    ) -> List[Dict[str, Any]]:
+        records, _, _ = await self._driver.execute_query(
+            query, params, database_=self._database
+        )
+        return [record.data() for record in records]
+
+    def sync_query(
+        self, query: str, params: Dict[str, Any] = {}
+    ) -> List[Dict[str, Any]]:
+        with self._sync_lock:
+            if self._sync_driver is None:
+                self._sync_driver = GraphDatabase.driver(self._url, auth=self._auth)
+        records, _, _ = self._sync_driver.execute_query(
+            query, params, database_=self._database
+        )
+        return [record.data() for record in records]
+
+    async def close(self) -> None:
+        await self._driver.close()
+        if self._sync_driver is not None:
+            self._sync_driver.close()
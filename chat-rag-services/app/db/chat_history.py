@@ -0,0 +1,95 @@
+from typing import List, Sequence, Tuple, Union
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, messages_from_dict
+from app.db.async_graph import AsyncNeo4jGraph
+
+
+class AsyncNeo4jChatMessageHistory(BaseChatMessageHistory):
+    """Neo4jChatMessageHistory on AsyncNeo4jGraph, same nodes and queries: a
+    Session node with a LAST_MESSAGE relationship to the newest of its Message
+    nodes, which are chained by NEXT. The sync methods send the same queries
+    through AsyncNeo4jGraph.sync_query.
+
+    The Session node is merged when messages are added rather than on
+    creation, so reading the history of a new session costs a single query.
+    """
+
+    def __init__(
+        self,
+        session_id: Union[str, int],
+        graph: AsyncNeo4jGraph,
+        node_label: str = "Session",
+        window: int = 3,
+    ):
+        if not session_id:
+            raise ValueError("Please ensure that the session_id parameter is provided")
+
+        self._graph = graph
+        self._session_id = session_id
+        self._node_label = node_label
+        self._window = window
+
+    async def aget_messages(self) -> List[BaseMessage]:
+        records = await self._graph.query(*self._get_messages_query())
+        return messages_from_dict([record["result"] for record in records])
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        records = self._graph.sync_query(*self._get_messages_query())
+        return messages_from_dict([record["result"] for record in records])
+
+    async def aadd_messages(self, messages: Sequence[BaseMessage]) -> None:
+        await self._graph.query(*self._add_messages_query(messages))
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self._graph.sync_query(*self._add_messages_query(messages))
+
+    def add_message(self, message: BaseMessage) -> None:
+        self.add_messages([message])
+
+    async def aclear(self) -> None:
+        await self._graph.query(*self._clear_query())
+
+    def clear(self) -> None:
+        self._graph.sync_query(*self._clear_query())
+
+    def _get_messages_query(self) -> Tuple[str, dict]:
+        return (
+            f"MATCH (s:`{self._node_label}`)-[:LAST_MESSAGE]->(last_message) "
+            "WHERE s.id = $session_id MATCH p=(last_message)<-[:NEXT*0.."
+            f"{self._window * 2}]-() WITH p, length(p) AS length "
+            "ORDER BY length DESC LIMIT 1 UNWIND reverse(nodes(p)) AS node "
+            "RETURN {data:{content: node.content}, type:node.type} AS result",
+            {"session_id": self._session_id},
+        )
+
+    def _add_messages_query(self, messages: Sequence[BaseMessage]) -> Tuple[str, dict]:
+        # one query for all of them, the subquery runs once per message so
+        # every message sees the one appended before it
+        return (
+            f"MERGE (s:`{self._node_label}` {{id: $session_id}}) "
+            "WITH s UNWIND $messages AS message "
+            "CALL { WITH s, message "
+            "OPTIONAL MATCH (s)-[lm:LAST_MESSAGE]->(last_message) "
+            "CREATE (s)-[:LAST_MESSAGE]->(new:Message) "
+            "SET new += message "
+            "WITH new, lm, last_message WHERE last_message IS NOT NULL "
+            "CREATE (last_message)-[:NEXT]->(new) "
+            "DELETE lm }",
+            {
+                "session_id": self._session_id,
+                "messages": [
+                    {"type": message.type, "content": message.content}
+                    for message in messages
+                ],
+            },
+        )
+
+    def _clear_query(self) -> Tuple[str, dict]:
+        return (
+            f"MATCH (s:`{self._node_label}`)-[:LAST_MESSAGE]->(last_message) "
+            "WHERE s.id = $session_id MATCH p=(last_message)<-[:NEXT]-() "
+            "WITH p, length(p) AS length ORDER BY length DESC LIMIT 1 "
+            "UNWIND nodes(p) as node DETACH DELETE node",
+            {"session_id": self._session_id},
+        )
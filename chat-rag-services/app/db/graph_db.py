@@ -70,17 +70,3 @@ class GraphDBDataAccess:
         logging.info(f"Deleting document {file_name} with result {result}")
 
         return result
-
-    def create_vector_index(self):
-        self.graph.query(
-            """
-            CREATE VECTOR INDEX vector IF NOT EXISTS FOR (c:Chunk) ON (c.embedding)
-            OPTIONS {
-                indexConfig: {
-                    `vector.dimensions`: $dimension,
-                    `vector.similarity_function`: 'cosine'
-                }
-            }
-            """,
-            {"dimension": 768},  # TODO: Change this to a config value
-        )
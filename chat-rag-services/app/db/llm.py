@@ -1,18 +1,65 @@
+import asyncio
+from typing import List
+from google.api_core.exceptions import (
+    Aborted,
+    DeadlineExceeded,
+    InternalServerError,
+    ResourceExhausted,
+    ServiceUnavailable,
+)
+from langchain_core.language_models.llms import create_base_retry_decorator
 from langchain_google_vertexai import VertexAIEmbeddings
 from langchain_google_vertexai.model_garden import ChatAnthropicVertex
 from langchain_openai import AzureChatOpenAI
+from vertexai.language_models import TextEmbeddingInput
 from app.core.config import settings
 
 
+class AsyncVertexAIEmbeddings(VertexAIEmbeddings):
+    """VertexAIEmbeddings, whose async methods call the async API of the
+    Vertex SDK instead of the sync one in a thread, with the same retries."""
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._aembed(texts, "RETRIEVAL_DOCUMENT")
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self._aembed([text], "RETRIEVAL_QUERY"))[0]
+
+    async def _aembed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        retry = create_base_retry_decorator(
+            error_types=[
+                ResourceExhausted,
+                ServiceUnavailable,
+                Aborted,
+                DeadlineExceeded,
+                InternalServerError,
+            ],
+            max_retries=self.max_retries,
+        )
+        get_embeddings = retry(self.client.get_embeddings_async)
+        if self.model_version.task_type_supported:
+            texts = [TextEmbeddingInput(text=t, task_type=task_type) for t in texts]
+
+        # the smallest batch size of the sync API, every region accepts it
+        size = settings.CHAT_EMBEDDING_BATCH_SIZE
+        batches = await asyncio.gather(
+            *[
+                get_embeddings(texts[start : start + size])
+                for start in range(0, len(texts), size)
+            ]
+        )
+        return [embedding.values for batch in batches for embedding in batch]
+
+
 class LLMModel:
     _embedding_instance = None
     _llm_instance_anthropic = None
     _llm_instance_openai = None
 
     @classmethod
-    def get_embedding_model(cls) -> VertexAIEmbeddings:
+    def get_embedding_model(cls) -> AsyncVertexAIEmbeddings:
         if cls._embedding_instance is None:
-            cls._embedding_instance = VertexAIEmbeddings(
+            cls._embedding_instance = AsyncVertexAIEmbeddings(
                 model="textembedding-gecko@003"
             )
             # dimension = 768
@@ -0,0 +1,86 @@
+"""The vector index the chat retrieval searches, created at startup.
+
+    python -m app.db.schema [--check]
+
+The rest of the graph schema (constraints, full-text indexes and the schema
+version) is owned by file-ingestion-service, see its src/client/schema.py.
+Keep the statement below the same as its `create_vector_index`.
+"""
+
+import argparse
+import logging
+from typing import Optional
+from dotenv import load_dotenv
+from langchain_community.graphs import Neo4jGraph
+from app.core.config import settings
+
+VECTOR_INDEX = "vector"
+
+
+def create_vector_index(
+    graph: Neo4jGraph, dimension: int = settings.EMBEDDING_DIMENSION
+) -> None:
+    """Creates the vector index unless it exists, and raises when it has other
+    dimensions than the embeddings."""
+    graph.query(
+        f"""
+        CREATE VECTOR INDEX {VECTOR_INDEX} IF NOT EXISTS
+        FOR (c:Chunk) ON (c.embedding)
+        OPTIONS {{
+            indexConfig: {{
+                `vector.dimensions`: $dimension,
+                `vector.similarity_function`: 'cosine'
+            }}
+        }}
+        """,
+        {"dimension": dimension},
+    )
+    problem = vector_index_problem(graph, dimension)
+    if problem:
+        raise Exception(problem)
+
+
+def get_vector_dimension(graph: Neo4jGraph) -> Optional[int]:
+    for index in graph.query("SHOW INDEXES YIELD name, options"):
+        if index["name"] == VECTOR_INDEX:
+            return index["options"]["indexConfig"]["vector.dimensions"]
+    return None
+
+
+def vector_index_problem(
+    graph: Neo4jGraph, dimension: int = settings.EMBEDDING_DIMENSION
+) -> Optional[str]:
+    actual = get_vector_dimension(graph)
+    if actual is None:
+        return f"Vector index {VECTOR_INDEX} is missing"
+    if actual != dimension:
+        return (
+            f"Vector index {VECTOR_INDEX} has {actual} dimensions, "
+            f"the embeddings have {dimension}"
+        )
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="report a missing or mismatched index without changing anything",
+    )
+    args = parser.parse_args()
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    graph = Neo4jGraph()
+    if not args.check:
+        create_vector_index(graph)
+    problem = vector_index_problem(graph)
+    if problem:
+        print(f"schema: {problem}")
+        raise SystemExit(1)
+    print(f"schema: vector index {VECTOR_INDEX} is ok")
+
+
+if __name__ == "__main__":
+    main()
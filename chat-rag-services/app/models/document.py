@@ -17,3 +17,4 @@ class DocumentNode:
     total_pages: int = 0
     total_chunks: int = 0
     processed_chunk: int = 0
+    content_hash: str = None
@@ -1,16 +1,17 @@
-from typing import Dict, Any
-from langchain_community.chat_message_histories import Neo4jChatMessageHistory
+import json
+from typing import AsyncIterator, Dict, Any
+from app.db.chat_history import AsyncNeo4jChatMessageHistory
 from app.services.processor.completions import QAEngine
 from app.services.processor.qa_tools import summarize_history
 
 
-def get_chat_completions(
+async def get_chat_completions(
     qa_engine: QAEngine, question: str, session_id: str
 ) -> Dict[str, Any]:
     try:
-        history = Neo4jChatMessageHistory(graph=qa_engine.db, session_id=session_id)
-        resp, metadata = qa_engine.get_answer(question, history)
-        # summarize_history(history)
+        history = AsyncNeo4jChatMessageHistory(session_id, qa_engine.db)
+        resp, metadata = await qa_engine.aget_answer(question, history)
+        # await summarize_history(history)
 
         return {
             "session_id": session_id,
@@ -20,3 +21,24 @@ def get_chat_completions(
     except Exception as e:
         error_name = type(e).__name__
         raise Exception(f"Error: {error_name} - {str(e)}")
+
+
+async def stream_chat_completions(
+    qa_engine: QAEngine, question: str, session_id: str
+) -> AsyncIterator[str]:
+    """The answer of `get_chat_completions` as server-sent events. Once the
+    stream started the status can't change anymore, errors are sent as an
+    "error" event."""
+    try:
+        history = AsyncNeo4jChatMessageHistory(session_id, qa_engine.db)
+        async for event, data in qa_engine.astream_answer(question, history):
+            if event == "done":
+                data = {"session_id": session_id, **data}
+            yield server_sent_event(event, data)
+    except Exception as e:
+        error_name = type(e).__name__
+        yield server_sent_event("error", {"detail": f"Error: {error_name} - {str(e)}"})
+
+
+def server_sent_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -1,39 +1,74 @@
-from typing import Any, Dict, List, Set, Tuple
-from langchain_community.graphs import Neo4jGraph
+from typing import Any, AsyncIterator, Dict, List, Set, Tuple
 from langchain_core.chat_history import BaseChatMessageHistory
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from app.db.async_graph import AsyncNeo4jGraph
 from app.db.llm import LLMModel
 from app.services.processor.context_retriever import DataRetriever
 from app.models.templates import CHAT_SYSTEM_TEMPLATE
 
 
 class QAEngine:
-    def __init__(self, db: Neo4jGraph, llm: LLMModel = LLMModel):
+    def __init__(self, db: AsyncNeo4jGraph, llm: LLMModel = LLMModel):
         self.db = db
         self.llm = llm
-        self.data_retriever = DataRetriever(graphdb_client=self.db)
+        self.data_retriever = DataRetriever(graphdb_client=self.db, llm_model=self.llm)
 
-    def get_answer(self, question: str, history: BaseChatMessageHistory):
-        history.add_message(HumanMessage(content=question))
-
-        context_document = self.data_retriever.get_data(history)
+    async def aget_answer(self, question: str, history: BaseChatMessageHistory):
+        """The answer and its sources. The question and the answer are added
+        to the history together, once the answer is there."""
+        messages, context_document = await self._aget_context(question, history)
         added_context, sources = self._format_context_docs(context_document)
 
         rag_chain = self._get_rag_chain()
-        result = rag_chain.invoke(
-            {
-                # "messages": history.messages[:-1],
-                "messages": history.messages,
-                "context": added_context,
-                "input": question,
-            }
+        result = await rag_chain.ainvoke(
+            {"messages": messages, "context": added_context, "input": question}
         )
         chunk_list = self._parse_source_docs(docs=context_document)
-        history.add_ai_message(AIMessage(content=result.content))
+        await history.aadd_messages(
+            [HumanMessage(content=question), AIMessage(content=result.content)]
+        )
 
         return result.content, {"sources": sources, "chunk_details": chunk_list}
 
+    async def astream_answer(
+        self, question: str, history: BaseChatMessageHistory
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Like `aget_answer`, as (event, data) pairs: "sources" once the
+        context is retrieved, a "token" for every piece of the answer and
+        "done" with the whole answer. A stream that is cancelled (the client
+        went away) leaves the history as it was."""
+        messages, context_document = await self._aget_context(question, history)
+        added_context, sources = self._format_context_docs(context_document)
+        metadata = {
+            "sources": list(sources),
+            "chunk_details": self._parse_source_docs(docs=context_document),
+        }
+        yield "sources", metadata
+
+        rag_chain = self._get_rag_chain()
+        tokens = []
+        async for chunk in rag_chain.astream(
+            {"messages": messages, "context": added_context, "input": question}
+        ):
+            if chunk.content:
+                tokens.append(chunk.content)
+                yield "token", {"content": chunk.content}
+
+        answer = "".join(tokens)
+        await history.aadd_messages(
+            [HumanMessage(content=question), AIMessage(content=answer)]
+        )
+        yield "done", {"message": answer, "info": metadata}
+
+    async def _aget_context(
+        self, question: str, history: BaseChatMessageHistory
+    ) -> Tuple[List[BaseMessage], List[Document]]:
+        messages = await history.aget_messages()
+        messages = messages + [HumanMessage(content=question)]
+        return messages, await self.data_retriever.aget_data(messages)
+
     def _format_context_docs(self, docs: List[Dict[str, Any]]) -> Tuple[str, set]:
         take = 5
         sorted_docs = sorted(
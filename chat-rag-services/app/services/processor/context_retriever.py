@@ -1,26 +1,33 @@
-from langchain_community.graphs import Neo4jGraph
+from typing import List, Tuple
 from langchain_text_splitters import TokenTextSplitter
-from langchain_community.vectorstores.neo4j_vector import Neo4jVector
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.retrievers.document_compressors import (
     EmbeddingsFilter,
     DocumentCompressorPipeline,
 )
 from langchain.retrievers import ContextualCompressionRetriever
-from langchain_core.vectorstores import VectorStoreRetriever
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnableBranch
-from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage
 
+from app.db.async_graph import AsyncNeo4jGraph
 from app.db.llm import LLMModel
 from app.core.config import settings
+from app.db.schema import VECTOR_INDEX
 from app.models.templates import QUESTION_TRANSFORM_TEMPLATE, VECTOR_GRAPH_SEARCH_QUERY
 
 
 class DataRetriever:
     def __init__(
         self,
-        graphdb_client: Neo4jGraph,
+        graphdb_client: AsyncNeo4jGraph,
         llm_model: LLMModel = LLMModel,
         search_k: int = settings.CHAT_SEARCH_KWARG_K,
         score_threshold: float = settings.CHAT_SEARCH_KWARG_SCORE_THRESHOLD,
@@ -30,48 +37,76 @@ class DataRetriever:
         self.search_k = search_k
         self.score_threshold = score_threshold
 
-        try:
-            self.vector_db = Neo4jVector.from_existing_index(
-                embedding=self.llm_model.get_embedding_model(),
-                index_name="vector",
-                retrieval_query=VECTOR_GRAPH_SEARCH_QUERY,
-                graph=self.graphdb_client,
-            )
-        except Exception as e:
-            self.graphdb_client.query(
-                """
-                CREATE VECTOR INDEX vector IF NOT EXISTS FOR (c:Chunk) ON (c.embedding)
-                OPTIONS {
-                    indexConfig: {
-                        `vector.dimensions`: $dimension,
-                        `vector.similarity_function`: 'cosine'
-                    }
-                }
-                """,
-                {"dimension": 768},  # TODO: Change this to a config value
-            )
-            self.vector_db = Neo4jVector.from_existing_index(
-                embedding=self.llm_model.get_embedding_model(),
-                index_name="vector",
-                retrieval_query=VECTOR_GRAPH_SEARCH_QUERY,
-                graph=self.graphdb_client,
-            )
-
         self.vector_retriever = self._get_vector_retriever()
         self.document_retriever_chain = DocumentRetrieverChain(
             llm=self.llm_model, retriever=self.vector_retriever
         ).create_chain()
 
     def _get_vector_retriever(self):
-        search_kwargs = {"k": self.search_k, "score_threshold": self.score_threshold}
-        return self.vector_db.as_retriever(search_kwargs=search_kwargs)
+        # the vector index is created at startup, see app/db/schema.py
+        return Neo4jVectorRetriever(
+            graph=self.graphdb_client,
+            embeddings=self.llm_model.get_embedding_model(),
+            index_name=VECTOR_INDEX,
+            retrieval_query=VECTOR_GRAPH_SEARCH_QUERY,
+            k=self.search_k,
+        )
+
+    async def aget_data(self, messages: List[BaseMessage]):
+        return await self.document_retriever_chain.ainvoke({"messages": messages})
+
 
-    def get_data(self, history: BaseChatMessageHistory):
-        return self.document_retriever_chain.invoke({"messages": history.messages})
+class Neo4jVectorRetriever(BaseRetriever):
+    """The retriever of Neo4jVector.from_existing_index(...).as_retriever(),
+    querying with the async driver and embedding the query with the async
+    API (`invoke` uses the sync ones). Like that one with the default
+    "similarity" search, it returns the k best chunks whatever their score."""
+
+    graph: AsyncNeo4jGraph
+    embeddings: Embeddings
+    index_name: str
+    retrieval_query: str
+    k: int = 4
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        embedding = self.embeddings.embed_query(query)
+        return self._to_documents(self.graph.sync_query(*self._search(embedding)))
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        embedding = await self.embeddings.aembed_query(query)
+        return self._to_documents(await self.graph.query(*self._search(embedding)))
+
+    def _search(self, embedding: List[float]) -> Tuple[str, dict]:
+        return (
+            "CALL db.index.vector.queryNodes($index, $k, $embedding) "
+            "YIELD node, score " + self.retrieval_query,
+            {"index": self.index_name, "k": self.k, "embedding": embedding},
+        )
+
+    @staticmethod
+    def _to_documents(results: List[dict]) -> List[Document]:
+        return [
+            Document(
+                page_content=result["text"],
+                metadata={
+                    key: value
+                    for key, value in result["metadata"].items()
+                    if value is not None
+                },
+            )
+            for result in results
+        ]
 
 
 class DocumentRetrieverChain:
-    def __init__(self, llm: LLMModel, retriever: VectorStoreRetriever):
+    def __init__(self, llm: LLMModel, retriever: BaseRetriever):
         self.llm = llm
         self.retriever = retriever
 
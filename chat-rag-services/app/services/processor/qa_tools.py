@@ -1,10 +1,14 @@
 from app.db.llm import LLMModel
 from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import HumanMessage
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 
 
-def summarize_history(history: BaseChatMessageHistory, llm: LLMModel = LLMModel):
-    if not history.messages:
+async def summarize_history(
+    history: BaseChatMessageHistory, llm: LLMModel = LLMModel
+):
+    messages = await history.aget_messages()
+    if not messages:
         return
 
     prompt = ChatPromptTemplate.from_messages(
@@ -18,8 +22,9 @@ def summarize_history(history: BaseChatMessageHistory, llm: LLMModel = LLMModel)
     )
 
     chain = prompt | llm.get_chat_anthropic()
-    summary = chain.invoke({"chat_history": history.messages})
+    summary = await chain.ainvoke({"chat_history": messages})
 
-    history.clear()
-    history.add_user_message("Current conversation summary till now")
-    history.add_message(summary)
+    await history.aclear()
+    await history.aadd_messages(
+        [HumanMessage(content="Current conversation summary till now"), summary]
+    )
@@ -0,0 +1,94 @@
+"""Concurrent chat benchmark with offline stand-ins for the models and Neo4j.
+
+    python -m benchmarks.chat [--chats 1 40] [--llm-latency 0.5]
+        [--embedding-latency 0.1] [--db-latency 0.05] [--stream]
+
+Runs every number of chats at once on one event loop, each in its own
+session, through `get_chat_completions` (or `stream_chat_completions` with
+`--stream`) with the fakes of `benchmarks.fakes`. Reports the wall time,
+chats/s and the mean and slowest chat. As long as nothing blocks the event
+loop, 40 chats take about as long as one.
+"""
+
+import argparse
+import asyncio
+import time
+from typing import List
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings, FakeGraph, FakeLLMModel
+from app.services.chat import get_chat_completions, stream_chat_completions
+from app.services.processor.completions import QAEngine
+
+
+async def run_chat(engine: QAEngine, session_id: str, stream: bool) -> float:
+    started = time.perf_counter()
+    question = "Where is Carcosa?"
+    if stream:
+        async for event in stream_chat_completions(engine, question, session_id):
+            if event.startswith("event: error"):
+                raise Exception(event)
+    else:
+        await get_chat_completions(engine, question, session_id)
+    return time.perf_counter() - started
+
+
+async def run_once(chats: int, options: dict) -> dict:
+    graph = FakeGraph(options["db_latency"])
+    embeddings = FakeEmbeddings(options["embedding_latency"])
+    chat = FakeChatModel(latency=options["llm_latency"])
+    engine = QAEngine(graph, llm=FakeLLMModel(embeddings, chat))
+
+    started = time.perf_counter()
+    latencies: List[float] = await asyncio.gather(
+        *(
+            run_chat(engine, f"benchmark-{i}", options["stream"])
+            for i in range(chats)
+        )
+    )
+    elapsed = time.perf_counter() - started
+    return {
+        "chats": chats,
+        "seconds": elapsed,
+        "chats_per_second": chats / elapsed,
+        "mean_chat_seconds": sum(latencies) / chats,
+        "max_chat_seconds": max(latencies),
+        "queries": dict(graph.queries),
+        "embedding_calls": embeddings.calls,
+    }
+
+
+def report(result: dict) -> None:
+    print(
+        f"{result['chats']} chats in {result['seconds']:.2f}s, "
+        f"{result['chats_per_second']:.1f} chats/s, "
+        f"{result['mean_chat_seconds']:.2f}s per chat on average, "
+        f"{result['max_chat_seconds']:.2f}s at most"
+    )
+    print(
+        f"  queries {result['queries']}, "
+        f"embedding calls {result['embedding_calls']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, nargs="+", default=[1, 40])
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--embedding-latency", type=float, default=0.1)
+    parser.add_argument("--db-latency", type=float, default=0.05)
+    parser.add_argument(
+        "--stream", action="store_true", help="stream the answers as events"
+    )
+    args = parser.parse_args()
+
+    options = {
+        "llm_latency": args.llm_latency,
+        "embedding_latency": args.embedding_latency,
+        "db_latency": args.db_latency,
+        "stream": args.stream,
+    }
+    for chats in args.chats:
+        report(asyncio.run(run_once(chats, options)))
+
+
+if __name__ == "__main__":
+    main()
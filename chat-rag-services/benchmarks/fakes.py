@@ -0,0 +1,116 @@
+"""Offline stand-ins for the Vertex AI and OpenAI models and Neo4j, for the
+benchmarks.
+
+Every call waits a fixed latency on the event loop, like a remote call on the
+async clients would, and the sync calls block for it, so a code path that
+blocks the loop shows up as chats that no longer overlap.
+"""
+
+import asyncio
+import time
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, List
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from app.db.async_graph import AsyncNeo4jGraph
+
+ANSWER = "Carcosa is the city where the King in Yellow is played."
+CHUNK_TEXT = "Carcosa lies on the shore of the lake of Hali. " * 40
+
+
+class FakeGraph(AsyncNeo4jGraph):
+    """Answers the vector search with `k` chunks and every other query with
+    nothing (so every session starts without history), counting the queries
+    by their first clause."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.queries = Counter()
+
+    async def query(
+        self, query: str, params: Dict[str, Any] = {}
+    ) -> List[Dict[str, Any]]:
+        await asyncio.sleep(self.latency)
+        return self._answer(query, params)
+
+    def sync_query(
+        self, query: str, params: Dict[str, Any] = {}
+    ) -> List[Dict[str, Any]]:
+        time.sleep(self.latency)
+        return self._answer(query, params)
+
+    async def close(self) -> None:
+        pass
+
+    def _answer(self, query: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        self.queries[query.split()[0]] += 1
+        if "queryNodes" not in query:
+            return []
+        return [
+            {
+                "text": CHUNK_TEXT,
+                "score": 0.9,
+                "metadata": {
+                    "source": "benchmark.pdf",
+                    "length": len(CHUNK_TEXT),
+                    "chunkdetails": [{"id": f"chunk{i}", "score": 0.9}],
+                },
+            }
+            for i in range(params["k"])
+        ]
+
+
+class FakeEmbeddings(Embeddings):
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        time.sleep(self.latency)
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return [[1.0, 0.0] for _ in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeChatModel(FakeListChatModel):
+    """Always gives ANSWER after `latency`, streamed a character at a time."""
+
+    latency: float = 0.0
+    responses: List[str] = [ANSWER]
+
+    async def _agenerate(self, *args, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return await super()._agenerate(*args, **kwargs)
+
+    async def _astream(self, *args, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        async for chunk in super()._astream(*args, **kwargs):
+            yield chunk
+
+
+class FakeLLMModel:
+    """Drop-in for LLMModel, handing out the fakes."""
+
+    def __init__(self, embeddings: FakeEmbeddings, chat: FakeChatModel):
+        self.embeddings = embeddings
+        self.chat = chat
+
+    def get_embedding_model(self) -> FakeEmbeddings:
+        return self.embeddings
+
+    def get_chat_anthropic(self) -> FakeChatModel:
+        return self.chat
+
+    def get_chat_openai(self) -> FakeChatModel:
+        return self.chat
@@ -1,21 +1,46 @@
+import asyncio
+import logging
 import os
-import shutil
-import requests
-import src.controller as controller
+import uuid
+import zipfile
+import httpx
 from contextlib import asynccontextmanager
+from urllib.parse import urlparse
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from fastapi import BackgroundTasks, Depends, FastAPI, File, HTTPException, UploadFile
+from typing import List, Optional
+from fastapi import Depends, FastAPI, File, Form, HTTPException, Response, UploadFile
 from langchain_community.graphs import Neo4jGraph
-from src.config import TEMP_STORAGE
 from src.client.llm import LLMModel
 from src.client.graph_db import GraphDBDataAccess
+from src.client.job_queue import JobQueue
+from src.client.remote_file import download_remote_file
+from src.client.schema import SchemaManager
+from src.client.spool import (
+    FileTooLargeError,
+    SpooledFile,
+    spool_to_storage,
+    spool_zip_members,
+)
+from src.config import (
+    BATCH_ARCHIVE_MAX_BYTES,
+    BATCH_FILE_MAX_BYTES,
+    BATCH_MAX_FILES,
+    DOWNLOAD_CHUNK_SIZE,
+    TEMP_STORAGE,
+    UPLOAD_MAX_BYTES,
+)
+from src.metrics import CONTENT_TYPE_LATEST, is_multiprocess, render_metrics
+from src.models.job import JOB_CANCELLED
+from src.utils import delete_directory, delete_file
+from src.worker import WorkerPool, delete_job_files
 
 
 load_dotenv()
 
 db = None
 llm_model = None
+job_queue = None
 
 
 def get_db():
@@ -28,13 +53,31 @@ def get_llm_model():
     return llm_model
 
 
+def get_job_queue():
+    global job_queue
+    return job_queue
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global db
     global llm_model
-    db = GraphDBDataAccess(Neo4jGraph())
+    global job_queue
+    if not is_multiprocess():
+        logging.warning(
+            "PROMETHEUS_MULTIPROC_DIR is not set, /metrics only reports the API "
+            "process and not the ingestion workers"
+        )
+    graph = Neo4jGraph()
+    SchemaManager(graph).apply()
+    db = GraphDBDataAccess(graph)
     llm_model = LLMModel()
+    job_queue = JobQueue()
+
+    worker_pool = WorkerPool()
+    worker_pool.start()
     yield
+    worker_pool.stop()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -45,62 +88,255 @@ async def read_root():
     return {"Hello": "World"}
 
 
-def extract_file_task(db, llm_model, filename):
-    try:
-        result = controller.extract_pdf_document(db, llm_model, filename, filename)
-        os.remove(filename)
-    except Exception as e:
-        print(f"INTERNAL SERVER ERROR. Detail : \n{str(e)}")
+async def iter_upload(file: UploadFile):
+    while chunk := await file.read(DOWNLOAD_CHUNK_SIZE):
+        yield chunk
+
+
+async def enqueue_spooled_file(
+    spooled: SpooledFile,
+    file_name: str,
+    db: GraphDBDataAccess,
+    job_queue: JobQueue,
+    notification_callback: Optional[str] = None,
+):
+    """Queues the spooled file, unless the same bytes were already ingested
+    or are already waiting for / going through a worker."""
+    document = await asyncio.to_thread(db.find_document_by_content_hash, spooled.sha256)
+    if document is not None:
+        delete_file(spooled.file_path)
+        return {
+            "message": "File already extracted",
+            "file_name": document.file_name,
+            "content_hash": spooled.sha256,
+        }
+
+    job, queued = await asyncio.to_thread(
+        job_queue.enqueue_unless_active,
+        spooled.file_path,
+        file_name,
+        spooled.sha256,
+        notification_callback,
+    )
+    if not queued:
+        delete_file(spooled.file_path)
+        return {"message": "File extraction already queued", "job_id": job.id}
+    return {"message": "File extraction queued", "job_id": job.id}
 
 
 @app.post("/extract")
 async def file_extraction(
-    background_tasks: BackgroundTasks, file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    db: GraphDBDataAccess = Depends(get_db),
+    job_queue: JobQueue = Depends(get_job_queue),
 ):
+    if not file.filename:
+        await file.close()
+        raise HTTPException(status_code=400, detail="The upload has no file name")
+
+    suffix = os.path.splitext(file.filename)[1] or ".pdf"
     try:
-        with open(file.filename, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        spooled = await spool_to_storage(iter_upload(file), suffix, UPLOAD_MAX_BYTES)
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     finally:
-        file.file.close()
+        await file.close()
 
-    background_tasks.add_task(
-        extract_file_task, get_db(), get_llm_model(), file.filename
-    )
-    return {"message": "File extraction started in the background"}
+    return await enqueue_spooled_file(spooled, file.filename, db, job_queue)
+
+
+async def spool_batch_upload(file: UploadFile, storage: str) -> List[tuple]:
+    """Spools one file of a batch upload, or the PDFs of a zip archive, into
+    `storage` and returns them as `(file_name, SpooledFile)`."""
+    suffix = os.path.splitext(file.filename)[1].lower() or ".pdf"
+    max_bytes = BATCH_ARCHIVE_MAX_BYTES if suffix == ".zip" else BATCH_FILE_MAX_BYTES
+    try:
+        spooled = await spool_to_storage(iter_upload(file), suffix, max_bytes, storage)
+    finally:
+        await file.close()
+    if suffix != ".zip":
+        return [(file.filename, spooled)]
+
+    try:
+        members = await spool_zip_members(
+            spooled.file_path, max_bytes=BATCH_FILE_MAX_BYTES, storage=storage
+        )
+    finally:
+        delete_file(spooled.file_path)
+    # the archive name keeps the names unique across archives
+    archive_name = os.path.splitext(file.filename)[0]
+    return [(f"{archive_name}/{name}", member) for name, member in members]
+
+
+@app.post("/extract-batch")
+async def batch_extraction(
+    files: List[UploadFile] = File(...),
+    notification_callback: Optional[str] = Form(None),
+    db: GraphDBDataAccess = Depends(get_db),
+    job_queue: JobQueue = Depends(get_job_queue),
+):
+    """Queues many files, or zip archives of PDFs, as one job: their chunks go
+    through a single pipeline run, so many small documents share their
+    embedding requests and database transactions."""
+    # the files of a batch get a directory of their own, so they are never
+    # shared with (and deleted under) another job
+    storage = os.path.join(TEMP_STORAGE, f"batch_{uuid.uuid4().hex}")
+    if any(not file.filename for file in files):
+        raise HTTPException(status_code=400, detail="An upload has no file name")
+
+    spooled_files = []
+    try:
+        for file in files:
+            spooled_files.extend(await spool_batch_upload(file, storage))
+    except (FileTooLargeError, zipfile.BadZipFile) as e:
+        delete_directory(storage)
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        delete_directory(storage)
+        raise
+
+    file_names = [file_name for file_name, _ in spooled_files]
+    error = None
+    if not spooled_files:
+        error = "No PDF files in the upload"
+    elif len(spooled_files) > BATCH_MAX_FILES:
+        error = f"{len(spooled_files)} files, the limit is {BATCH_MAX_FILES} per batch"
+    elif len(set(file_names)) < len(file_names):
+        duplicates = sorted({name for name in file_names if file_names.count(name) > 1})
+        error = f"Duplicate file names: {duplicates}"
+    if error is not None:
+        delete_directory(storage)
+        raise HTTPException(status_code=400, detail=error)
+
+    # identical files are only ingested once, and not at all when they were
+    # already extracted or are queued in another job
+    batch = {}
+    skipped = []
+    for file_name, spooled in spooled_files:
+        if spooled.sha256 in batch:
+            delete_file(spooled.file_path)
+            skipped.append({"file_name": file_name, "reason": "duplicate in batch"})
+            continue
+        document = await asyncio.to_thread(
+            db.find_document_by_content_hash, spooled.sha256
+        )
+        if document is not None:
+            delete_file(spooled.file_path)
+            skipped.append(
+                {
+                    "file_name": file_name,
+                    "reason": "already extracted",
+                    "document": document.file_name,
+                }
+            )
+            continue
+        batch[spooled.sha256] = {
+            "file_path": spooled.file_path,
+            "file_name": file_name,
+            "content_hash": spooled.sha256,
+        }
+
+    job = None
+    if batch:
+        job, active_jobs = await asyncio.to_thread(
+            job_queue.enqueue_batch,
+            list(batch.values()),
+            notification_callback,
+            storage,
+        )
+        for content_hash, active_job in active_jobs.items():
+            file = batch.pop(content_hash)
+            delete_file(file["file_path"])
+            skipped.append(
+                {
+                    "file_name": file["file_name"],
+                    "reason": "already queued",
+                    "job_id": active_job.id,
+                }
+            )
+
+    if job is None:
+        delete_directory(storage)
+        return {"message": "All files already extracted or queued", "skipped": skipped}
+
+    return {
+        "message": "Batch extraction queued",
+        "job_id": job.id,
+        "files": [file["file_name"] for file in batch.values()],
+        "skipped": skipped,
+    }
+
+
+@app.get("/jobs")
+async def list_jobs(
+    status: Optional[str] = None,
+    limit: int = 100,
+    job_queue: JobQueue = Depends(get_job_queue),
+):
+    jobs = await asyncio.to_thread(job_queue.list, status, limit)
+    return [job.to_dict() for job in jobs]
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, job_queue: JobQueue = Depends(get_job_queue)):
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.to_dict()
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, job_queue: JobQueue = Depends(get_job_queue)):
+    """Cancels a queued job, or stops a running one: its worker cancels the
+    graph extraction calls in flight within a few seconds."""
+    job = await asyncio.to_thread(job_queue.cancel, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    if job.status != JOB_CANCELLED:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is already {job.status}")
+    if job.started_at is None:
+        delete_job_files(job)
+    return job.to_dict()
 
 
 class RemoteFileExtractionRequest(BaseModel):
     file_uri: str
-    notification_callback: str
+    notification_callback: Optional[str] = None
 
 
 @app.post("/extraction-remote-file")
 async def remotefile_extraction(
     req: RemoteFileExtractionRequest,
     db: GraphDBDataAccess = Depends(get_db),
-    llm_model=Depends(get_llm_model),
+    job_queue: JobQueue = Depends(get_job_queue),
 ):
-    print("extracting file_uri", req.file_uri)
+    logging.info(f"Queueing extraction of {req.file_uri}")
+    file_name = os.path.basename(urlparse(req.file_uri).path)
+    suffix = os.path.splitext(file_name)[1] or ".pdf"
     try:
-        # Download the file
-        response = requests.get(req.file_uri)
-        response.raise_for_status()
-        file_name = os.path.basename(req.file_uri)
-        file_path = os.path.join(TEMP_STORAGE, file_name)
-        with open(file_path, "wb") as f:
-            f.write(response.content)
-
-        result = controller.extract_pdf_document(db, llm_model, file_path, file_name)
-
-        # delete document after processing
-        os.remove(file_path)
-
-        return result
-    except requests.RequestException as e:
-        return HTTPException(
+        spooled = await download_remote_file(req.file_uri, suffix)
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except httpx.HTTPError as e:
+        raise HTTPException(
             status_code=400, detail=f"FILE NOT FOUND. Detail : \n{str(e)}"
         )
-    except Exception as e:
-        return HTTPException(
-            status_code=500, detail=f"INTERNAL SERVER ERROR. Detail : \n{str(e)}"
-        )
+
+    return await enqueue_spooled_file(
+        spooled, file_name, db, job_queue, req.notification_callback
+    )
+
+
+@app.get("/metrics")
+async def metrics(job_queue: JobQueue = Depends(get_job_queue)):
+    """Prometheus metrics of the API process and the ingestion workers."""
+    content = await asyncio.to_thread(render_metrics, job_queue)
+    return Response(content, media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/jobs/{job_id}/progress")
+async def get_job_progress(job_id: str, job_queue: JobQueue = Depends(get_job_queue)):
+    progress = await asyncio.to_thread(job_queue.get_progress, job_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return progress
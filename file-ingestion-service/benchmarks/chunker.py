@@ -0,0 +1,79 @@
+"""Compares TokenChunker with the per-page TokenTextSplitter it replaced.
+
+    python -m benchmarks.chunker [file.pdf] [--copies N] [--repeat N]
+
+The PDF (by default the bundled sample book) is concatenated `--copies` times
+to get a large document. Parsing is done once up front so only cleaning and
+splitting are timed. Exits with status 1 when the chunks differ.
+"""
+
+import argparse
+import time
+import fitz
+from langchain.docstore.document import Document
+from src.processor.chunker import TokenChunker
+from src.utils import iter_chunks, iter_clean_documents
+
+
+def load_pages(file_path: str, copies: int):
+    pages = []
+    with fitz.open(file_path) as doc:
+        for _ in range(copies):
+            for page in doc:
+                pages.append(
+                    Document(
+                        page_content=page.get_text(),
+                        metadata={"page": len(pages), "total_pages": len(doc) * copies},
+                    )
+                )
+    return pages
+
+
+def run(name: str, split, pages, repeat: int):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = [(c.page_content, c.metadata["page_number"]) for c in split(pages)]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(
+        f"{name:<20} {best:8.3f}s {len(pages) / best:10.0f} pages/s "
+        f"{len(chunks) / best:10.0f} chunks/s"
+    )
+    return chunks, best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", nargs="?", default="tests/data/The King in Yellow.pdf")
+    parser.add_argument("--copies", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = load_pages(args.file, args.copies)
+    print(f"{len(pages)} pages, {sum(len(p.page_content) for p in pages)} characters")
+
+    expected, baseline = run(
+        "TokenTextSplitter",
+        lambda pages: iter_chunks(iter_clean_documents(pages)),
+        pages,
+        args.repeat,
+    )
+    chunker = TokenChunker()
+    actual, elapsed = run("TokenChunker", chunker.iter_chunks, pages, args.repeat)
+    print(f"speedup: {baseline / elapsed:.2f}x")
+
+    if actual != expected:
+        mismatch = next(
+            (i for i, (a, e) in enumerate(zip(actual, expected)) if a != e),
+            min(len(actual), len(expected)),
+        )
+        print(
+            f"chunks differ: {len(actual)} vs {len(expected)}, first mismatch at {mismatch}"
+        )
+        raise SystemExit(1)
+    print(f"{len(actual)} chunks, identical boundaries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""Offline stand-ins for the Vertex AI models and Neo4j, for the benchmarks.
+
+They are deterministic (the same text always gives the same embedding and the
+same entities) and can add a fixed latency to every call and fail a share of
+the calls, to see how the pipeline behaves with slow or flaky backends.
+"""
+
+import asyncio
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import List, Optional
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from src.client.graph_db import GraphDBDataAccess
+
+_NAME = re.compile(r"\b[A-Z][a-z]{2,}\b")
+_TYPES = ["Person", "Place", "Organization", "Concept"]
+
+
+class FakeBackendError(Exception):
+    pass
+
+
+class FakeRateLimitError(FakeBackendError):
+    status_code = 429
+
+
+class _Faults:
+    def __init__(self, latency: float, error_rate: float, seed: int):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def fail(self) -> bool:
+        with self._lock:
+            self.calls += 1
+            if self._random.random() < self.error_rate:
+                self.errors += 1
+                return True
+            return False
+
+
+class FakeEmbeddings:
+    """Has the `embed` method EmbeddingGenerator calls on VertexAIEmbeddings."""
+
+    def __init__(
+        self,
+        dimension: int = 768,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.dimension = dimension
+        self.faults = _Faults(latency, error_rate, seed)
+
+    def embed(self, texts: List[str], batch_size: int = 0, **kwargs) -> List[List[float]]:
+        time.sleep(self.faults.latency)
+        if self.faults.fail():
+            raise FakeBackendError("embedding request failed")
+        return [self._vector(text) for text in texts]
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha1(text.encode()).digest()[:8], "big")
+        rng = random.Random(seed)
+        return [rng.uniform(-1, 1) for _ in range(self.dimension)]
+
+
+class FakeChatModel:
+    """Answers the structured output calls of LLMGraphTransformer with the
+    capitalized words of the text as entities, linked in a chain.
+
+    With a `quota`, calls beyond that many at the same time are rejected with
+    a 429 straight away, like a provider enforcing its concurrency quota.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        max_entities: int = 8,
+        quota: Optional[int] = None,
+        seed: int = 0,
+    ):
+        self.max_entities = max_entities
+        self.quota = quota
+        self.faults = _Faults(latency, error_rate, seed)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.rate_limited = 0
+        self.characters = 0  # of the texts extracted from
+        self._lock = threading.Lock()
+
+    def with_structured_output(self, schema, include_raw: bool = False):
+        def respond(prompt) -> dict:
+            if self.faults.fail():
+                raise FakeBackendError("chat request failed")
+            text = prompt.to_messages()[-1].content
+            with self._lock:
+                self.characters += len(text)
+            parsed = schema(**self._graph(text))
+            if include_raw:
+                return {"raw": AIMessage(content=""), "parsed": parsed}
+            return parsed
+
+        def invoke(prompt) -> dict:
+            self._enter()
+            try:
+                time.sleep(self.faults.latency)
+                return respond(prompt)
+            finally:
+                self._exit()
+
+        async def ainvoke(prompt) -> dict:
+            self._enter()
+            try:
+                await asyncio.sleep(self.faults.latency)
+                return respond(prompt)
+            finally:
+                self._exit()
+
+        return RunnableLambda(invoke, afunc=ainvoke)
+
+    def _enter(self) -> None:
+        with self._lock:
+            if self.quota is not None and self.in_flight >= self.quota:
+                self.rate_limited += 1
+                raise FakeRateLimitError("too many concurrent requests")
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _exit(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def _graph(self, text: str) -> dict:
+        names = list(dict.fromkeys(_NAME.findall(text)))[: self.max_entities]
+        nodes = [
+            {
+                "id": name,
+                "type": _TYPES[len(name) % len(_TYPES)],
+                "properties": [{"key": "description", "value": f"{name} in the text"}],
+            }
+            for name in names
+        ]
+        relationships = [
+            {
+                "source_node_id": source["id"],
+                "source_node_type": source["type"],
+                "target_node_id": target["id"],
+                "target_node_type": target["type"],
+                "type": "RELATED_TO",
+            }
+            for source, target in zip(nodes, nodes[1:])
+        ]
+        return {"nodes": nodes, "relationships": relationships}
+
+
+class FakeLLMModel:
+    """Drop-in for LLMModel."""
+
+    def __init__(self, embeddings: FakeEmbeddings, chat: FakeChatModel):
+        self.embeddings = embeddings
+        self.chat = chat
+
+    def get_embedding_model(self) -> FakeEmbeddings:
+        return self.embeddings
+
+    def get_chat_model(self) -> FakeChatModel:
+        return self.chat
+
+
+class RecordingGraph:
+    """Drop-in for Neo4jGraph that runs nothing, it waits `latency` for every
+    query. The queries are counted by `RecordingDataAccess`."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.stats = defaultdict(lambda: {"queries": 0, "rows": 0, "seconds": 0.0})
+        self._lock = threading.Lock()
+
+    def query(self, query: str, params: Optional[dict] = None) -> List[dict]:
+        time.sleep(self.latency)
+        return []
+
+    def record(self, operation: str, params: Optional[dict], seconds: float) -> None:
+        rows = max(
+            [len(value) for value in (params or {}).values() if isinstance(value, list)],
+            default=1,
+        )
+        with self._lock:
+            stats = self.stats[operation]
+            stats["queries"] += 1
+            stats["rows"] += rows
+            stats["seconds"] += seconds
+
+    def total_queries(self) -> int:
+        return sum(stats["queries"] for stats in self.stats.values())
+
+
+class RecordingDataAccess(GraphDBDataAccess):
+    """GraphDBDataAccess that counts the queries it sends to a RecordingGraph,
+    by operation, with the rows they carried and the time they took."""
+
+    graph: RecordingGraph
+
+    def _query(
+        self, operation: str, query: str, params: Optional[dict] = None
+    ) -> List[dict]:
+        started = time.perf_counter()
+        try:
+            return super()._query(operation, query, params)
+        finally:
+            self.graph.record(operation, params, time.perf_counter() - started)
@@ -0,0 +1,308 @@
+"""End-to-end ingestion benchmark with offline stand-ins for the models and Neo4j.
+
+    python -m benchmarks.ingestion [--pages 10 100 500] [--llm-latency 0.5]
+        [--llm-quota 8] [--batch 50] [--save results.json]
+        [--compare baseline.json]
+
+Generates PDFs of the given page counts and runs each of them through
+`controller.process_pdf` (so `DocumentProcessor.process_document`) with the
+fakes of `benchmarks.fakes`, in a fresh process so the peak RSS is its own.
+With `--batch N`, N different PDFs of every size are also run as one batch
+upload (`DocumentProcessor.process_batch`).
+Reports pages/s, chunks/s, the mean latency of every stage per batch, the peak
+RSS and the queries sent by operation. With `--compare`, exits with status 1 when
+a run is more than `--tolerance` slower than the baseline or sends more
+queries.
+"""
+
+import argparse
+import json
+import random
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Iterator, List, Optional
+import fitz
+from benchmarks.fakes import (
+    FakeChatModel,
+    FakeEmbeddings,
+    FakeLLMModel,
+    RecordingDataAccess,
+    RecordingGraph,
+)
+from src import controller
+from src.config import (
+    BATCH_CHUNK_BATCH_SIZE,
+    GRAPH_TOKEN_BUDGET,
+    TEMP_STORAGE,
+    VECTOR_EMBEDDING_DIMENSION,
+)
+from src.models.document import BatchDocument
+from src.processor.document import DocumentProcessor
+from src.processor.embedding import EmbeddingGenerator
+from src.processor.graph import GraphGenerator
+from src.processor.knn import KNNGraphBuilder
+from src.processor.progress import ProgressReporter
+
+WORDS = (
+    "the of and to in a was that it his he with as had for you at on not but be "
+    "her by which this from have they were him all one so what said there would "
+    "city night king yellow mask play stranger street river window light house"
+).split()
+NAMES = (
+    "Hastur Carcosa Cassilda Camilla Hildred Castaigne Wilde Constance Vance "
+    "Louis Boris Genevieve Jack Tessie Paris Brittany Yvonne Sylvia Trent Alec"
+).split()
+
+
+def generate_pdf(
+    pages: int, out_dir: Path, words_per_page: int = 350, seed: int = 0
+) -> Path:
+    """A PDF of `pages` pages of random words and names, the same for the same
+    size and seed. Like in books, some pages are full and some are the end of
+    a chapter."""
+    suffix = f"_{seed}" if seed else ""
+    file_path = out_dir / f"benchmark_{pages}_pages{suffix}.pdf"
+    if file_path.exists():
+        return file_path
+
+    rng = random.Random(pages * 1_000_003 + seed if seed else pages)
+    with fitz.open() as doc:
+        for _ in range(pages):
+            length = words_per_page if rng.random() < 0.7 else rng.randint(10, words_per_page)
+            words = [
+                rng.choice(NAMES) if rng.random() < 0.05 else rng.choice(WORDS)
+                for _ in range(length)
+            ]
+            page = doc.new_page()
+            page.insert_textbox(page.rect + (36, 36, -36, -36), " ".join(words), fontsize=9)
+        doc.save(file_path)
+    return file_path
+
+
+def run_once(file_path: str, options: dict) -> dict:
+    graph, embeddings, chat, dp = _pipeline(options)
+    file_name = Path(file_path).name
+    progress = ProgressReporter(file_name, dp.db_dao)
+    error = None
+    started = time.perf_counter()
+    try:
+        controller.process_pdf(dp, file_path, file_name, progress)
+    except Exception as e:
+        error = str(e)
+    elapsed = time.perf_counter() - started
+    return _result(file_name, elapsed, error, progress, graph, embeddings, chat)
+
+
+def run_batch(file_paths: List[str], options: dict) -> dict:
+    """Like `run_once` for all the files together, as a batch upload runs them."""
+    graph, embeddings, chat, dp = _pipeline(options)
+    file_name = f"batch_of_{len(file_paths)}"
+    progress = ProgressReporter(file_name)
+
+    def read_documents() -> Iterator[BatchDocument]:
+        for file_path in file_paths:
+            document = BatchDocument(Path(file_path).name)
+            document.chunks = controller.stream_pdf_chunks(
+                document, file_path, progress
+            )
+            yield document
+
+    error = None
+    started = time.perf_counter()
+    try:
+        documents = dp.process_batch(
+            read_documents(), progress, options["batch_chunk_size"]
+        )
+        errors = [str(document.error) for document in documents if document.error]
+        error = "; ".join(errors) or None
+    except Exception as e:
+        error = str(e)
+    elapsed = time.perf_counter() - started
+    return _result(file_name, elapsed, error, progress, graph, embeddings, chat)
+
+
+def _pipeline(options: dict) -> tuple:
+    graph = RecordingGraph(options["db_latency"])
+    db = RecordingDataAccess(graph)
+    embeddings = FakeEmbeddings(
+        VECTOR_EMBEDDING_DIMENSION, options["embedding_latency"], options["error_rate"]
+    )
+    chat = FakeChatModel(
+        options["llm_latency"], options["error_rate"], quota=options["llm_quota"]
+    )
+    llm = FakeLLMModel(embeddings, chat)
+    graph_generator = GraphGenerator(llm, token_budget=options["graph_token_budget"])
+    dp = DocumentProcessor(
+        db, graph_generator, EmbeddingGenerator(llm), knn_builder=KNNGraphBuilder(db)
+    )
+    return graph, embeddings, chat, dp
+
+
+def _result(
+    file_name: str,
+    elapsed: float,
+    error: Optional[str],
+    progress: ProgressReporter,
+    graph: RecordingGraph,
+    embeddings: FakeEmbeddings,
+    chat: FakeChatModel,
+) -> dict:
+    snapshot = progress.snapshot()
+    return {
+        "file_name": file_name,
+        "pages": snapshot["pages_read"],
+        "chunks": snapshot["chunks_read"],
+        "seconds": elapsed,
+        "pages_per_second": snapshot["pages_read"] / elapsed,
+        "chunks_per_second": snapshot["chunks_read"] / elapsed,
+        "stages": {
+            name: {
+                "batches": stage["batches"],
+                "seconds_per_batch": stage["seconds"] / stage["batches"],
+            }
+            for name, stage in snapshot["stages"].items()
+            if stage["batches"]
+        },
+        # kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "queries": graph.total_queries(),
+        "queries_by_method": dict(graph.stats),
+        "llm_calls": chat.faults.calls,
+        "llm_errors": chat.faults.errors,
+        "llm_rate_limited": chat.rate_limited,
+        "llm_max_in_flight": chat.max_in_flight,
+        "llm_characters": chat.characters,
+        "llm_limiter": snapshot["llm"],
+        "embedding_calls": embeddings.faults.calls,
+        "embedding_errors": embeddings.faults.errors,
+        "error": error,
+    }
+
+
+def report(result: dict) -> None:
+    print(
+        f"{result['file_name']}: {result['pages']} pages, {result['chunks']} chunks "
+        f"in {result['seconds']:.2f}s, {result['pages_per_second']:.1f} pages/s, "
+        f"{result['chunks_per_second']:.1f} chunks/s, "
+        f"peak RSS {result['peak_rss_mb']:.0f} MB"
+    )
+    if result["error"]:
+        print(f"  failed: {result['error']}")
+    print(
+        f"  LLM calls {result['llm_calls']} ({result['llm_errors']} failed, "
+        f"{result['llm_rate_limited']} rate limited, "
+        f"at most {result['llm_max_in_flight']} at once, "
+        f"{result['llm_characters'] / max(result['llm_calls'], 1):.0f} characters per call), "
+        f"embedding calls {result['embedding_calls']} ({result['embedding_errors']} failed)"
+    )
+    if result["llm_limiter"]:
+        print(f"  LLM limiter {result['llm_limiter']}")
+    for name, stage in result["stages"].items():
+        print(
+            f"  {name:<18} {stage['batches']:6} batches "
+            f"{stage['seconds_per_batch'] * 1000:10.1f} ms/batch"
+        )
+    print(f"  {result['queries']} queries")
+    for method, stats in sorted(result["queries_by_method"].items()):
+        print(
+            f"  {method:<30} {stats['queries']:6} queries {stats['rows']:8} rows "
+            f"{stats['seconds']:8.2f}s"
+        )
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    """Returns the regressions of `results` against the baseline runs."""
+    baseline_runs = {run["file_name"]: run for run in baseline}
+    regressions = []
+    for result in results:
+        expected = baseline_runs.get(result["file_name"])
+        if expected is None:
+            continue
+        if result["pages_per_second"] < expected["pages_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{result['file_name']}: {result['pages_per_second']:.1f} pages/s, "
+                f"was {expected['pages_per_second']:.1f}"
+            )
+        if result["queries"] > expected["queries"]:
+            regressions.append(
+                f"{result['file_name']}: {result['queries']} queries, "
+                f"was {expected['queries']}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument("--embedding-latency", type=float, default=0.0)
+    parser.add_argument("--db-latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--llm-quota", type=int, help="concurrent LLM calls before they get 429s"
+    )
+    parser.add_argument("--graph-token-budget", type=int, default=GRAPH_TOKEN_BUDGET)
+    parser.add_argument(
+        "--batch",
+        type=int,
+        metavar="FILES",
+        help="also run FILES PDFs of every size as one batch upload",
+    )
+    parser.add_argument("--batch-chunk-size", type=int, default=BATCH_CHUNK_BATCH_SIZE)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    options = {
+        "llm_latency": args.llm_latency,
+        "embedding_latency": args.embedding_latency,
+        "db_latency": args.db_latency,
+        "error_rate": args.error_rate,
+        "llm_quota": args.llm_quota,
+        "graph_token_budget": args.graph_token_budget,
+        "batch_chunk_size": args.batch_chunk_size,
+    }
+    out_dir = Path(TEMP_STORAGE)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    results = []
+    for pages in args.pages:
+        file_path = generate_pdf(pages, out_dir)
+        # a process per run, so every run has its own peak RSS
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            result = pool.submit(run_once, str(file_path), options).result()
+        report(result)
+        results.append(result)
+
+        if args.batch:
+            file_paths = [
+                str(generate_pdf(pages, out_dir, seed=seed))
+                for seed in range(args.batch)
+            ]
+            with ProcessPoolExecutor(
+                max_workers=1, mp_context=get_context("spawn")
+            ) as pool:
+                result = pool.submit(run_batch, file_paths, options).result()
+            result["file_name"] += f"_{pages}_pages"
+            report(result)
+            results.append(result)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
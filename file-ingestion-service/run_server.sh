@@ -1 +1,5 @@
+# every process of the service writes its metrics there, see src/metrics.py
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-metrics}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 uvicorn --host 0.0.0.0 --port 8001 app:app --reload
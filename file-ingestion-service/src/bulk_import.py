@@ -0,0 +1,203 @@
+"""Initial corpus loads, without going through the API and one MERGE at a time.
+
+    python -m src.bulk_import export <pdf_dir> <out_dir>
+    python -m src.bulk_import load <out_dir> [--url file:///]
+    python -m src.bulk_import schema <out_dir>
+
+`export` runs every PDF of the directory through the usual chunk, embed and
+extract pipeline but writes the graph to CSV files (see CSVGraphWriter), then
+prints the matching `neo4j-admin database import full` command. Either run
+that command on an empty database and then `schema`, or copy the files to the
+Neo4j import directory and run `load`, which loads them with LOAD CSV. Both
+end by creating the indexes and the vector index.
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import shlex
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List
+from dotenv import load_dotenv
+from langchain_community.graphs import Neo4jGraph
+from src import controller
+from src.config import (
+    BULK_IMPORT_BATCH_SIZE,
+    BULK_IMPORT_DOCUMENTS,
+    VECTOR_EMBEDDING_DIMENSION,
+)
+from src.client.cache import EmbeddingCache, GraphDocumentCache
+from src.client.csv_graph import MANIFEST_FILE, CSVGraphWriter
+from src.client.graph_db import GraphDBDataAccess
+from src.client.llm import LLMModel
+from src.client.schema import SchemaManager
+from src.processor.cpu_stage import CPUStageExecutor
+from src.processor.document import DocumentProcessor
+from src.processor.embedding import EmbeddingGenerator
+from src.processor.graph import NODE_PROPERTIES, GraphGenerator
+from src.processor.progress import ProgressReporter
+
+
+def export(input_dir: str, out_dir: str, documents: int = BULK_IMPORT_DOCUMENTS):
+    input_path = Path(input_dir)
+    files = sorted(input_path.rglob("*.pdf"))
+
+    # identical files are only exported once
+    unique_files = {}
+    for file_path in files:
+        unique_files.setdefault(_sha256(file_path), file_path)
+    print(f"Exporting {len(unique_files)} documents ({len(files)} files)")
+
+    llm = LLMModel()
+    failed = []
+    started = time.time()
+    with CSVGraphWriter(out_dir, NODE_PROPERTIES) as writer, CPUStageExecutor() as cpu:
+        dp = DocumentProcessor(
+            writer,
+            GraphGenerator(llm, cache=GraphDocumentCache()),
+            EmbeddingGenerator(llm, cache=EmbeddingCache()),
+            incremental=False,
+        )
+
+        def export_file(content_hash: str, file_path: Path):
+            file_name = file_path.relative_to(input_path).as_posix()
+            try:
+                controller.process_pdf(
+                    dp,
+                    str(file_path),
+                    file_name,
+                    ProgressReporter(file_name, writer),
+                    content_hash,
+                    cpu,
+                )
+                print(f"Exported {file_name}")
+            except Exception:
+                logging.exception(f"Failed to export {file_name}")
+                failed.append(file_name)
+
+        with ThreadPoolExecutor(max_workers=documents) as pool:
+            list(pool.map(export_file, unique_files.keys(), unique_files.values()))
+
+    print(
+        f"Exported {len(unique_files) - len(failed)} documents to {out_dir} "
+        f"in {time.time() - started:.0f}s, {len(failed)} failed: {failed}"
+    )
+    print("To import them into an empty database:")
+    print(admin_import_command(out_dir))
+
+
+def admin_import_command(out_dir: str, database: str = "neo4j") -> str:
+    manifest = _read_manifest(out_dir)
+    args = ["neo4j-admin", "database", "import", "full", database]
+    args += ["--array-delimiter=;", "--skip-duplicate-nodes"]
+    for node in manifest["nodes"]:
+        args.append(f"--nodes={':'.join(node['labels'])}={node['file']}")
+    for rel in manifest["relationships"]:
+        args.append(f"--relationships={rel['type']}={rel['file']}")
+    return " ".join(shlex.quote(arg) for arg in args)
+
+
+def load(out_dir: str, url: str, batch_size: int = BULK_IMPORT_BATCH_SIZE):
+    """Loads the exported files with LOAD CSV. `url` is where Neo4j sees the
+    directory, e.g. file:/// when the files were copied to its import folder."""
+    manifest = _read_manifest(out_dir)
+    db = GraphDBDataAccess(Neo4jGraph())
+    create_schema(db, manifest, vector_index=False)
+
+    # nodes first, the relationships match them
+    for node in manifest["nodes"]:
+        _timed(
+            node["file"],
+            db.load_csv_nodes,
+            url + node["file"],
+            node["labels"],
+            node["key"],
+            _read_header(out_dir, node["file"]),
+            batch_size,
+        )
+    for rel in manifest["relationships"]:
+        _timed(
+            rel["file"],
+            db.load_csv_relationships,
+            url + rel["file"],
+            rel["type"],
+            rel["start"],
+            rel["end"],
+            _read_header(out_dir, rel["file"]),
+            batch_size,
+        )
+
+    create_schema(db, manifest)
+
+
+def create_schema(db: GraphDBDataAccess, manifest: dict, vector_index: bool = True):
+    dimension = manifest["vector_dimension"] or VECTOR_EMBEDDING_DIMENSION
+    # the vector index is built last, indexing the embeddings while they are
+    # loaded is slower
+    SchemaManager(db.graph, dimension).apply(vector_index)
+    for node in manifest["nodes"]:
+        if node["labels"][0] not in ["Document", "Chunk"]:
+            db.ensure_entity_index(node["labels"][0])
+
+
+def _timed(name: str, load_file, *args):
+    started = time.time()
+    load_file(*args)
+    print(f"Loaded {name} in {time.time() - started:.0f}s")
+
+
+def _read_manifest(out_dir: str) -> dict:
+    with open(Path(out_dir) / MANIFEST_FILE) as f:
+        return json.load(f)
+
+
+def _read_header(out_dir: str, file_name: str) -> List[str]:
+    with open(Path(out_dir) / file_name, newline="", encoding="utf-8") as f:
+        return next(csv.reader(f))
+
+
+def _sha256(file_path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="write the graph to CSV files")
+    export_parser.add_argument("input_dir")
+    export_parser.add_argument("out_dir")
+    export_parser.add_argument("--documents", type=int, default=BULK_IMPORT_DOCUMENTS)
+
+    load_parser = commands.add_parser("load", help="load the CSV files with LOAD CSV")
+    load_parser.add_argument("out_dir")
+    load_parser.add_argument("--url", default="file:///")
+    load_parser.add_argument("--batch-size", type=int, default=BULK_IMPORT_BATCH_SIZE)
+
+    schema_parser = commands.add_parser(
+        "schema", help="create the indexes after a neo4j-admin import"
+    )
+    schema_parser.add_argument("out_dir")
+
+    args = parser.parse_args()
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "export":
+        export(args.input_dir, args.out_dir, args.documents)
+    elif args.command == "load":
+        load(args.out_dir, args.url, args.batch_size)
+    else:
+        create_schema(GraphDBDataAccess(Neo4jGraph()), _read_manifest(args.out_dir))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from langchain.docstore.document import Document
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+from src.config import (
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    EMBEDDING_CACHE_PATH,
+    GRAPH_CACHE_MAX_ENTRIES,
+    GRAPH_CACHE_PATH,
+)
+from src.metrics import GRAPH_CACHE_REQUESTS
+from src.utils import batch
+
+# stay below SQLite's limit of host parameters per statement
+_SQLITE_BATCH_SIZE = 500
+
+
+class SQLiteLRUCache:
+    """A bounded key/value store in a SQLite file. Every process opening the
+    same path shares the entries; once the store grows past `max_entries` the
+    least recently used ones are evicted.
+    """
+
+    def __init__(self, path: str, table: str, max_entries: int):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}_last_used ON {table} (last_used)"
+            )
+
+    @contextmanager
+    def _connection(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        found = {}
+        with self._connection() as conn:
+            for _, _, keys_batch in batch(set(keys), _SQLITE_BATCH_SIZE):
+                placeholders = ",".join("?" * len(keys_batch))
+                rows = conn.execute(
+                    f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders})",
+                    keys_batch,
+                ).fetchall()
+                found.update(rows)
+                if rows:
+                    conn.execute(
+                        f"UPDATE {self.table} SET last_used = ? WHERE key IN ({placeholders})",
+                        [time.time(), *keys_batch],
+                    )
+        return found
+
+    def put_many(self, items: Dict[str, bytes]) -> None:
+        if not items:
+            return
+
+        now = time.time()
+        with self._connection() as conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, last_used) VALUES (?, ?, ?)",
+                [(key, value, now) for key, value in items.items()],
+            )
+            (count,) = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+            if count > self.max_entries:
+                conn.execute(
+                    f"""
+                    DELETE FROM {self.table} WHERE key IN (
+                        SELECT key FROM {self.table} ORDER BY last_used LIMIT ?
+                    )
+                    """,
+                    (count - self.max_entries,),
+                )
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache. Chunk ids are the SHA-1 of the chunk
+    text, so an entry is keyed by (model name, task type, chunk id) and stored
+    as packed float32.
+    """
+
+    def __init__(
+        self,
+        path: str = EMBEDDING_CACHE_PATH,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+    ):
+        self.store = SQLiteLRUCache(path, "embeddings", max_entries)
+
+    @staticmethod
+    def _key(model_name: str, task_type: str, chunk_id: str) -> str:
+        return f"{model_name}:{task_type}:{chunk_id}"
+
+    def get_many(
+        self, model_name: str, task_type: str, chunk_ids: List[str]
+    ) -> Dict[str, List[float]]:
+        keys = {
+            self._key(model_name, task_type, chunk_id): chunk_id for chunk_id in chunk_ids
+        }
+        found = self.store.get_many(keys)
+        return {keys[key]: array("f", value).tolist() for key, value in found.items()}
+
+    def put_many(
+        self, model_name: str, task_type: str, embeddings: Dict[str, List[float]]
+    ) -> None:
+        self.store.put_many(
+            {
+                self._key(model_name, task_type, chunk_id): array("f", emb).tobytes()
+                for chunk_id, emb in embeddings.items()
+            }
+        )
+
+
+class GraphDocumentCache:
+    """Memoizes LLM graph extraction. An entry is keyed by the ids of the
+    combined chunks together with the extraction config, and holds the
+    extracted nodes and relationships.
+    """
+
+    def __init__(
+        self,
+        path: str = GRAPH_CACHE_PATH,
+        max_entries: int = GRAPH_CACHE_MAX_ENTRIES,
+    ):
+        self.store = SQLiteLRUCache(path, "graph_documents", max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(chunk_ids: List[str], config: dict) -> str:
+        payload = json.dumps({"chunk_ids": chunk_ids, **config}, sort_keys=True)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def get(self, key: str, source: Document) -> Optional[GraphDocument]:
+        value = self.store.get_many([key]).get(key)
+        # counted on /metrics across processes, the instance counts are only
+        # for the log line of the document
+        GRAPH_CACHE_REQUESTS.labels("miss" if value is None else "hit").inc()
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return _load_graph_document(value, source)
+
+    def put(self, key: str, graph_document: GraphDocument) -> None:
+        self.store.put_many({key: _dump_graph_document(graph_document)})
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def _dump_node(node: Node) -> dict:
+    return {"id": node.id, "type": node.type, "properties": node.properties}
+
+
+def _dump_graph_document(graph_document: GraphDocument) -> bytes:
+    data = {
+        "nodes": [_dump_node(node) for node in graph_document.nodes],
+        "relationships": [
+            {
+                "source": _dump_node(rel.source),
+                "target": _dump_node(rel.target),
+                "type": rel.type,
+                "properties": rel.properties,
+            }
+            for rel in graph_document.relationships
+        ],
+    }
+    return json.dumps(data, default=str).encode()
+
+
+def _load_graph_document(value: bytes, source: Document) -> GraphDocument:
+    data = json.loads(value)
+    return GraphDocument(
+        nodes=[Node(**node) for node in data["nodes"]],
+        relationships=[
+            Relationship(
+                source=Node(**rel["source"]),
+                target=Node(**rel["target"]),
+                type=rel["type"],
+                properties=rel["properties"],
+            )
+            for rel in data["relationships"]
+        ],
+        source=source,
+    )
@@ -0,0 +1,317 @@
+import csv
+import json
+import threading
+from pathlib import Path
+from typing import Dict, List
+from src.config import ENTITY_LABEL, FIRST_CHUNK, NEXT_CHUNK
+from src.models.chunk import ChunkEmbedding, ChunkNode, ChunkRelationship
+from src.models.document import DocumentNode
+
+MANIFEST_FILE = "manifest.json"
+
+DOCUMENT_COLUMNS = [
+    ("file_name", "file_name:ID(Document)"),
+    ("status", "status"),
+    ("created_at", "created_at:localdatetime"),
+    ("updated_at", "updated_at:localdatetime"),
+    ("node_count", "node_count:int"),
+    ("relationship_count", "relationship_count:int"),
+    ("total_pages", "total_pages:int"),
+    ("total_chunks", "total_chunks:int"),
+    ("processed_chunk", "processed_chunk:int"),
+    ("content_hash", "content_hash"),
+]
+CHUNK_COLUMNS = [
+    ("id", "id:ID(Chunk)"),
+    ("text", "text"),
+    ("position", "position:int"),
+    ("length", "length:int"),
+    ("file_name", "file_name"),
+    ("content_offset", "content_offset:int"),
+    ("page_number", "page_number:int"),
+    ("start_time", "start_time:float"),
+    ("end_time", "end_time:float"),
+]
+
+
+class CSVGraphWriter:
+    """Stands in for GraphDBDataAccess during a bulk import: the document
+    processor runs unchanged, but instead of merging into Neo4j every node and
+    relationship is appended to CSV files in the `neo4j-admin database import`
+    layout (typed headers, one ID space per label, `;` as array delimiter).
+
+    Nodes and relationships are written once even when several documents
+    contain them. Entities get one file and one ID space per label, their
+    relationships one file per (source label, type, target label). The list of
+    files, with the labels, types and keys needed to load them, is written to
+    `manifest.json` on `close`.
+    """
+
+    def __init__(self, out_dir: str, entity_properties: List[str]):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.entity_properties = entity_properties
+        self.vector_dimension = None
+
+        self._lock = threading.Lock()
+        self._files = {}
+        self._manifest = {"nodes": [], "relationships": []}
+        self._documents: Dict[str, dict] = {}
+        # chunk rows wait for their embedding and their entities, by document
+        self._pending_chunks: Dict[str, Dict[str, ChunkNode]] = {}
+        self._chunk_embeddings: Dict[str, List[float]] = {}
+        self._extracted_chunks = set()
+        # hashes of what was written already
+        self._written = set()
+        self._entity_spaces: Dict[str, str] = {}
+        self._relationship_files: Dict[tuple, str] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            for file_name in list(self._pending_chunks):
+                self._flush_chunks(file_name)
+            for file, _ in self._files.values():
+                file.close()
+            self._files = {}
+            self._manifest["vector_dimension"] = self.vector_dimension
+            with open(self.out_dir / MANIFEST_FILE, "w") as f:
+                json.dump(self._manifest, f, indent=2)
+
+    # GraphDBDataAccess interface used by DocumentProcessor and EntityLinker
+
+    def add_document(self, node: DocumentNode) -> None:
+        with self._lock:
+            self._documents.setdefault(node.file_name, node.fill_default().to_dict())
+            self._pending_chunks.setdefault(node.file_name, {})
+
+    def update_document(self, node: DocumentNode) -> None:
+        with self._lock:
+            document = self._documents.setdefault(node.file_name, {})
+            document.update(node.to_dict_not_default())
+            if node.status in ["Completed", "Failed"]:
+                self._flush_chunks(node.file_name)
+                self._write_row(
+                    "documents.csv",
+                    [header for _, header in DOCUMENT_COLUMNS],
+                    [document.get(key) for key, _ in DOCUMENT_COLUMNS],
+                    node={"labels": ["Document"], "key": "file_name"},
+                )
+                del self._documents[node.file_name]
+
+    def get_document_chunks(self, file_name: str) -> dict:
+        return {}
+
+    def insert_chunk_graph(
+        self,
+        batch_data: List[ChunkNode],
+        relationships: List[ChunkRelationship],
+    ) -> None:
+        with self._lock:
+            for chunk in batch_data:
+                pending = self._pending_chunks.setdefault(chunk.file_name, {})
+                if not self._seen(("Chunk", chunk.id)):
+                    pending[chunk.id] = chunk
+                if not self._seen(("PART_OF", chunk.id, chunk.file_name)):
+                    self._write_chunk_relationship(
+                        "part_of.csv", "PART_OF", chunk.id, chunk.file_name
+                    )
+
+            for rel in relationships:
+                if rel.type == FIRST_CHUNK:
+                    if not self._seen((FIRST_CHUNK, rel.file_name, rel.current_chunk_id)):
+                        self._write_row(
+                            "first_chunk.csv",
+                            [":START_ID(Document)", ":END_ID(Chunk)"],
+                            [rel.file_name, rel.current_chunk_id],
+                            relationship={
+                                "type": FIRST_CHUNK,
+                                "start": {"label": "Document", "key": "file_name"},
+                                "end": {"label": "Chunk", "key": "id"},
+                            },
+                        )
+                elif rel.type == NEXT_CHUNK:
+                    key = (NEXT_CHUNK, rel.previous_chunk_id, rel.current_chunk_id)
+                    if not self._seen(key):
+                        self._write_row(
+                            "next_chunk.csv",
+                            [":START_ID(Chunk)", ":END_ID(Chunk)"],
+                            [rel.previous_chunk_id, rel.current_chunk_id],
+                            relationship={
+                                "type": NEXT_CHUNK,
+                                "start": {"label": "Chunk", "key": "id"},
+                                "end": {"label": "Chunk", "key": "id"},
+                            },
+                        )
+
+    def insert_chunk_embeddings(
+        self, embeddings: Dict[str, List[ChunkEmbedding]]
+    ) -> None:
+        with self._lock:
+            for file_name, embedding in embeddings.items():
+                pending = self._pending_chunks.get(file_name, {})
+                for chunk_embedding in embedding:
+                    self.vector_dimension = len(chunk_embedding.embedding)
+                    if chunk_embedding.chunk_id in pending:
+                        self._chunk_embeddings[chunk_embedding.chunk_id] = (
+                            chunk_embedding.embedding
+                        )
+                        self._write_chunk_if_done(pending, chunk_embedding.chunk_id)
+
+    def mark_chunks_extracted(self, chunk_ids: Dict[str, List[str]]) -> None:
+        with self._lock:
+            for file_name, ids in chunk_ids.items():
+                pending = self._pending_chunks.get(file_name, {})
+                for chunk_id in ids:
+                    if chunk_id in pending:
+                        self._extracted_chunks.add(chunk_id)
+                        self._write_chunk_if_done(pending, chunk_id)
+
+    def merge_entities(self, label: str, rows: List[dict]) -> None:
+        with self._lock:
+            space = self._entity_space(label)
+            for row in rows:
+                if self._seen((space, row["id"])):
+                    continue
+                properties = row.get("properties") or {}
+                self._write_row(
+                    f"entities_{space}.csv",
+                    [f"id:ID({space})"] + self.entity_properties,
+                    [row["id"]] + [properties.get(p) for p in self.entity_properties],
+                    node={"labels": [label, ENTITY_LABEL], "key": "id"},
+                )
+
+    def merge_entity_relationships(
+        self, source_label: str, type: str, target_label: str, rows: List[dict]
+    ) -> None:
+        with self._lock:
+            source_space = self._entity_space(source_label)
+            target_space = self._entity_space(target_label)
+            for row in rows:
+                key = (source_space, row["source"], type, target_space, row["target"])
+                if self._seen(key):
+                    continue
+                self._write_row(
+                    self._relationship_file(source_space, type, target_space),
+                    [f":START_ID({source_space})", f":END_ID({target_space})"],
+                    [row["source"], row["target"]],
+                    relationship={
+                        "type": type,
+                        "start": {"label": source_label, "key": "id"},
+                        "end": {"label": target_label, "key": "id"},
+                    },
+                )
+
+    def link_chunks_to_entities(self, label: str, rows: List[dict]) -> None:
+        with self._lock:
+            space = self._entity_space(label)
+            for row in rows:
+                if self._seen(("HAS_ENTITY", row["chunk_id"], space, row["id"])):
+                    continue
+                self._write_row(
+                    f"has_entity_{space}.csv",
+                    [":START_ID(Chunk)", f":END_ID({space})"],
+                    [row["chunk_id"], row["id"]],
+                    relationship={
+                        "type": "HAS_ENTITY",
+                        "start": {"label": "Chunk", "key": "id"},
+                        "end": {"label": label, "key": "id"},
+                    },
+                )
+
+    # helpers, called with the lock held
+
+    def _seen(self, key: tuple) -> bool:
+        # hashes instead of the keys themselves keep millions of them in memory
+        key_hash = hash(key)
+        if key_hash in self._written:
+            return True
+        self._written.add(key_hash)
+        return False
+
+    def _entity_space(self, label: str) -> str:
+        # labels can hold any character, the ID spaces and file names cannot
+        if label not in self._entity_spaces:
+            self._entity_spaces[label] = f"Entity{len(self._entity_spaces)}"
+        return self._entity_spaces[label]
+
+    def _relationship_file(self, source_space: str, type: str, target_space: str):
+        key = (source_space, type, target_space)
+        if key not in self._relationship_files:
+            self._relationship_files[key] = (
+                f"relationships_{len(self._relationship_files)}.csv"
+            )
+        return self._relationship_files[key]
+
+    def _write_chunk_if_done(self, pending: Dict[str, ChunkNode], chunk_id: str):
+        if (
+            chunk_id in self._chunk_embeddings
+            and chunk_id in self._extracted_chunks
+        ):
+            self._write_chunk(pending.pop(chunk_id))
+
+    def _flush_chunks(self, file_name: str) -> None:
+        for chunk in self._pending_chunks.pop(file_name, {}).values():
+            self._write_chunk(chunk)
+
+    def _write_chunk(self, chunk: ChunkNode) -> None:
+        values = chunk.to_dict()
+        embedding = self._chunk_embeddings.pop(chunk.id, None)
+        extracted = "true" if chunk.id in self._extracted_chunks else None
+        self._extracted_chunks.discard(chunk.id)
+        self._write_row(
+            "chunks.csv",
+            [header for _, header in CHUNK_COLUMNS]
+            + ["embedding:float[]", "extracted:boolean"],
+            [values[key] for key, _ in CHUNK_COLUMNS]
+            + [";".join(map(str, embedding)) if embedding else None, extracted],
+            node={"labels": ["Chunk"], "key": "id"},
+        )
+
+    def _write_chunk_relationship(
+        self, file_name: str, type: str, chunk_id: str, document: str
+    ) -> None:
+        self._write_row(
+            file_name,
+            [":START_ID(Chunk)", ":END_ID(Document)"],
+            [chunk_id, document],
+            relationship={
+                "type": type,
+                "start": {"label": "Chunk", "key": "id"},
+                "end": {"label": "Document", "key": "file_name"},
+            },
+        )
+
+    def _write_row(
+        self,
+        file_name: str,
+        header: List[str],
+        values: list,
+        node: dict = None,
+        relationship: dict = None,
+    ) -> None:
+        if file_name not in self._files:
+            file = open(self.out_dir / file_name, "w", newline="", encoding="utf-8")
+            writer = csv.writer(file)
+            writer.writerow(header)
+            self._files[file_name] = (file, writer)
+            if node is not None:
+                self._manifest["nodes"].append({"file": file_name, **node})
+            else:
+                self._manifest["relationships"].append(
+                    {"file": file_name, **relationship}
+                )
+        self._files[file_name][1].writerow(
+            ["" if value is None else _csv_value(value) for value in values]
+        )
+
+
+def _csv_value(value) -> str:
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
@@ -1,25 +1,41 @@
 import logging
-from typing import Any, Dict, List
+import time
+from typing import Dict, List, Optional
 from langchain_community.graphs import Neo4jGraph
-from langchain_community.graphs.graph_document import GraphDocument
-from src.config import KNN_MIN_SCORE
+from src.config import CHUNK_BATCH_SIZE, ENTITY_LABEL, KNN_MIN_SCORE
 from src.models.chunk import (
     ChunkEmbedding,
-    ChunkGraphDocumentPair,
     ChunkNode,
     ChunkRelationship,
+    ChunkSimilarity,
+    StoredChunk,
 )
+from src.metrics import NEO4J_QUERIES, NEO4J_QUERY_SECONDS
 from src.models.document import DocumentNode
 from src.config import FIRST_CHUNK, NEXT_CHUNK
+from src.utils import batch
 
 
 class GraphDBDataAccess:
     def __init__(self, graph: Neo4jGraph):
         self.graph = graph
+        self._indexed_labels = set()
+
+    def _query(
+        self, operation: str, query: str, params: Optional[dict] = None
+    ) -> List[dict]:
+        # counted and timed under the name of the operation that sends it
+        started = time.perf_counter()
+        try:
+            return self.graph.query(query, params or {})
+        finally:
+            NEO4J_QUERIES.labels(operation).inc()
+            NEO4J_QUERY_SECONDS.labels(operation).inc(time.perf_counter() - started)
 
     def add_document(self, node: DocumentNode) -> None:
         try:
-            self.graph.query(
+            self._query(
+                "add_document",
                 """
                 MERGE (d:Document {file_name: $file_name})
                 ON CREATE SET d = $props
@@ -31,7 +47,8 @@ class GraphDBDataAccess:
 
     def update_document(self, node: DocumentNode):
         try:
-            self.graph.query(
+            self._query(
+                "update_document",
                 """
                 MERGE (d:Document {file_name: $file_name})
                 ON MATCH SET d += $props
@@ -42,7 +59,8 @@ class GraphDBDataAccess:
             logging.error(f"Error upserting source node: {str(e)}")
 
     def get_documents(self) -> List[DocumentNode]:
-        result = self.graph.query(
+        result = self._query(
+            "get_documents",
             """
             MATCH (d:Document)
             RETURN d
@@ -53,7 +71,8 @@ class GraphDBDataAccess:
         return [DocumentNode(**record["d"]) for record in result]
 
     def get_document(self, file_name: str) -> List[DocumentNode]:
-        result = self.graph.query(
+        result = self._query(
+            "get_document",
             """
             MATCH (d:Document {file_name: $file_name})
             RETURN d
@@ -62,14 +81,127 @@ class GraphDBDataAccess:
         )
         return DocumentNode(**result[0]["d"])
 
+    def find_document_by_content_hash(
+        self, content_hash: str
+    ) -> Optional[DocumentNode]:
+        result = self._query(
+            "find_document_by_content_hash",
+            """
+            MATCH (d:Document {content_hash: $content_hash})
+            WHERE d.status = 'Completed'
+            RETURN d
+            LIMIT 1
+            """,
+            {"content_hash": content_hash},
+        )
+        return DocumentNode(**result[0]["d"]) if result else None
+
+    def get_document_chunks(self, file_name: str) -> Dict[str, StoredChunk]:
+        result = self._query(
+            "get_document_chunks",
+            """
+            MATCH (d:Document {file_name: $file_name})<-[:PART_OF]-(c:Chunk)
+            OPTIONAL MATCH (p:Chunk)-[:NEXT_CHUNK]->(c)
+            WHERE (p)-[:PART_OF]->(d)
+            RETURN c.id AS id, c.position AS position,
+                c.content_offset AS content_offset, c.page_number AS page_number,
+                p.id AS previous_id, exists { (d)-[:FIRST_CHUNK]->(c) } AS is_first,
+                c.embedding IS NOT NULL AS embedded,
+                coalesce(c.extracted, exists { (c)-[:HAS_ENTITY]->() }) AS extracted
+            """,
+            {"file_name": file_name},
+        )
+        return {record["id"]: StoredChunk(**record) for record in result}
+
+    def get_document_graph_counts(self, file_name: str) -> tuple[int, int]:
+        result = self._query(
+            "get_document_graph_counts",
+            """
+            MATCH (d:Document {file_name: $file_name})<-[:PART_OF]-(:Chunk)-[:HAS_ENTITY]->(e)
+            WITH DISTINCT e
+            OPTIONAL MATCH (e)-[r]->(t)
+            WHERE NOT t:Chunk AND NOT t:Document
+            RETURN count(DISTINCT e) AS node_count, count(r) AS relationship_count
+            """,
+            {"file_name": file_name},
+        )
+        if not result:
+            return 0, 0
+        return result[0]["node_count"], result[0]["relationship_count"]
+
+    def unlink_chunks(
+        self, file_name: str, relationships: List[ChunkRelationship]
+    ) -> None:
+        """Removes the current FIRST_CHUNK/NEXT_CHUNK links pointing at the
+        chunks of the given relationships, so they can be written again.
+        """
+        self._query(
+            "unlink_chunks",
+            """
+            MATCH (d:Document {file_name: $file_name})
+            UNWIND $relationships AS rel
+            MATCH (c:Chunk {id: rel.current_chunk_id})-[:PART_OF]->(d)
+            CALL {
+                WITH d, c
+                OPTIONAL MATCH (p:Chunk)-[r:NEXT_CHUNK]->(c)
+                WHERE (p)-[:PART_OF]->(d)
+                DELETE r
+            }
+            CALL {
+                WITH d, rel
+                WITH d, rel WHERE rel.type = $FIRST_CHUNK
+                OPTIONAL MATCH (d)-[r:FIRST_CHUNK]->()
+                DELETE r
+            }
+            """,
+            {
+                "file_name": file_name,
+                "relationships": [rel.to_dict() for rel in relationships],
+                "FIRST_CHUNK": FIRST_CHUNK,
+            },
+        )
+
+    def delete_chunks(self, file_name: str, chunk_ids: List[str]) -> int:
+        """Detaches the chunks from the document, deletes the ones no other
+        document uses and garbage-collects the entities left without chunks.
+        """
+        result = self._query(
+            "delete_chunks",
+            """
+            MATCH (d:Document {file_name: $file_name})
+            UNWIND $chunk_ids AS chunk_id
+            MATCH (c:Chunk {id: chunk_id})-[r:PART_OF]->(d)
+            DELETE r
+            WITH c WHERE NOT (c)-[:PART_OF]->()
+            OPTIONAL MATCH (c)-[:HAS_ENTITY]->(e)
+            WITH c, collect(e) AS entities
+            DETACH DELETE c
+            WITH entities
+            UNWIND entities AS e
+            WITH DISTINCT e
+            WHERE NOT (e)<-[:HAS_ENTITY]-()
+            DETACH DELETE e
+            RETURN count(*) AS deleted_entities
+            """,
+            {"file_name": file_name, "chunk_ids": chunk_ids},
+        )
+        deleted_entities = result[0]["deleted_entities"] if result else 0
+        logging.info(
+            f"Removed {len(chunk_ids)} chunks and {deleted_entities} orphaned "
+            f"entities from document {file_name}"
+        )
+        return deleted_entities
+
     def update_knn_graph(self) -> None:
-        index = self.graph.query(
+        index = self._query(
+            "update_knn_graph",
             "SHOW INDEXES YIELD * WHERE type = 'VECTOR' AND name = 'vector'"
         )
 
         if index:
             logging.info("Updating KNN graph")
-            self.graph.query(
+            self._query(
+                "update_knn_graph",
                 """
                 MATCH (c:Chunk)
                 WHERE c.embedding IS NOT NULL AND count { (c)-[:SIMILAR]-() } < 5
@@ -83,8 +215,58 @@ class GraphDBDataAccess:
         else:
             logging.info("Vector index does not exist. KNN graph not updated.")
 
+    def update_chunks_knn(
+        self, chunk_ids: List[str], top_k: int, min_score: float
+    ) -> int:
+        """Links the given chunks to their nearest neighbours in the vector index."""
+        result = self._query(
+            "update_chunks_knn",
+            """
+            UNWIND $chunk_ids AS chunk_id
+            MATCH (c:Chunk {id: chunk_id})
+            WHERE c.embedding IS NOT NULL
+            CALL db.index.vector.queryNodes('vector', $k, c.embedding) YIELD node, score
+            WITH c, node, score
+            WHERE node <> c AND score >= $score
+            MERGE (c)-[rel:SIMILAR]-(node)
+            SET rel.score = score
+            RETURN count(rel) AS relationships
+            """,
+            {"chunk_ids": chunk_ids, "k": top_k + 1, "score": min_score},
+        )
+        return result[0]["relationships"] if result else 0
+
+    def get_document_chunk_embeddings(
+        self, file_name: str
+    ) -> tuple[List[str], List[List[float]]]:
+        result = self._query(
+            "get_document_chunk_embeddings",
+            """
+            MATCH (c:Chunk)-[:PART_OF]->(:Document {file_name: $file_name})
+            WHERE c.embedding IS NOT NULL
+            RETURN c.id AS id, c.embedding AS embedding
+            """,
+            {"file_name": file_name},
+        )
+        return [row["id"] for row in result], [row["embedding"] for row in result]
+
+    def insert_similar_relationships(self, similarities: List[ChunkSimilarity]) -> None:
+        for _, _, rows in batch(similarities, CHUNK_BATCH_SIZE):
+            self._query(
+                "insert_similar_relationships",
+                """
+                UNWIND $rows AS row
+                MATCH (a:Chunk {id: row.source_id})
+                MATCH (b:Chunk {id: row.target_id})
+                MERGE (a)-[rel:SIMILAR]-(b)
+                SET rel.score = row.score
+                """,
+                {"rows": [row.to_dict() for row in rows]},
+            )
+
     def delete_document(self, file_name: str) -> tuple:
-        result = self.graph.query(
+        result = self._query(
+            "delete_document",
             """
             MATCH (d:Document {file_name: $file_name})
             WITH collect(d) AS documents
@@ -106,105 +288,225 @@ class GraphDBDataAccess:
 
         return result
 
-    def create_vector_index(self, dimension: int) -> None:
-        self.graph.query(
-            """
-            CREATE VECTOR INDEX vector IF NOT EXISTS FOR (c:Chunk) ON (c.embedding)
-            OPTIONS {
-                indexConfig: {
-                    `vector.dimensions`: $dimension,
-                    `vector.similarity_function`: 'cosine'
-                }
-            }
-            """,
-            {"dimension": dimension},
-        )
+    def insert_chunk_embeddings(self, embeddings: Dict[str, List[ChunkEmbedding]]):
+        """Writes the embeddings of the chunks of one or more documents, by file
+        name, in a single query."""
+        data = [
+            dict(chunk.to_dict(), file_name=file_name)
+            for file_name, embedding in embeddings.items()
+            for chunk in embedding
+        ]
 
-    def insert_chunk_embeddings(self, file_name: str, embedding: List[ChunkEmbedding]):
-        data = [chunk.to_dict() for chunk in embedding]
-
-        self.graph.query(
+        self._query(
+            "insert_chunk_embeddings",
             """
             UNWIND $data AS row
-            MATCH (d:Document {file_name: $file_name})
+            MATCH (d:Document {file_name: row.file_name})
             MERGE (c:Chunk {id: row.chunk_id})
             SET c.embedding = row.embedding
             MERGE (c)-[:PART_OF]->(d)
             """,
-            params={"file_name": file_name, "data": data},
+            params={"data": data},
+        )
+
+    def mark_chunks_extracted(self, chunk_ids: Dict[str, List[str]]) -> None:
+        """Flags the chunks, by file name, whose entities are all written, so a
+        re-upload does not extract them again (a chunk can have no entity)."""
+        ids = [chunk_id for ids in chunk_ids.values() for chunk_id in ids]
+        self._query(
+            "mark_chunks_extracted",
+            """
+            UNWIND $ids AS id
+            MATCH (c:Chunk {id: id})
+            SET c.extracted = true
+            """,
+            {"ids": ids},
+        )
+
+    def merge_entities(self, label: str, rows: List[dict]) -> None:
+        """Merges the entities of one label on their id. Properties are only
+        set on creation."""
+        self.ensure_entity_index(label)
+        self._query(
+            "merge_entities",
+            f"""
+            UNWIND $rows AS row
+            MERGE (n:`{label}` {{id: row.id}})
+            ON CREATE SET n += row.properties
+            SET n:`{ENTITY_LABEL}`
+            """,
+            {"rows": rows},
         )
 
-    def add_graph_documents(
+    def merge_entity_relationships(
+        self, source_label: str, type: str, target_label: str, rows: List[dict]
+    ) -> None:
+        self._query(
+            "merge_entity_relationships",
+            f"""
+            UNWIND $rows AS row
+            MATCH (source:`{source_label}` {{id: row.source}})
+            MATCH (target:`{target_label}` {{id: row.target}})
+            MERGE (source)-[rel:`{type}`]->(target)
+            ON CREATE SET rel += row.properties
+            """,
+            {"rows": rows},
+        )
+
+    def link_chunks_to_entities(self, label: str, rows: List[dict]) -> None:
+        self._query(
+            "link_chunks_to_entities",
+            f"""
+            UNWIND $rows AS row
+            MATCH (c:Chunk {{id: row.chunk_id}})
+            MATCH (n:`{label}` {{id: row.id}})
+            MERGE (c)-[:HAS_ENTITY]->(n)
+            """,
+            {"rows": rows},
+        )
+
+    def load_csv_nodes(
         self,
-        graph_documents: List[GraphDocument],
-        include_source: bool = False,
-        baseEntityLabel: bool = False,
+        url: str,
+        labels: List[str],
+        key: str,
+        header: List[str],
+        batch_size: int,
     ) -> None:
-        self.graph.add_graph_documents(graph_documents, include_source, baseEntityLabel)
-
-    def add_relationships_between_chunk_and_entities(
-        self, datas: List[ChunkGraphDocumentPair]
-    ):
-        batch_data = []
-        for data in datas:
-            for node in data.graph_document.nodes:
-                query_data = {
-                    "chunk_id": data.chunk_id,
-                    "node_type": node.type,
-                    "node_id": node.id,
-                }
-                batch_data.append(query_data)
-
-        if batch_data:
-            unwind_query = """
-                        UNWIND $batch_data AS data
-                        MATCH (c:Chunk {id: data.chunk_id})
-                        CALL apoc.merge.node([data.node_type], {id: data.node_id}) YIELD node AS n
-                        MERGE (c)-[:HAS_ENTITY]->(n)
-                        """
-            self.graph.query(unwind_query, {"batch_data": batch_data})
-        else:
-            logging.info(
-                "Attempt in calling add_relationships_between_chunk_and_entities with empty data"
-            )
+        """Merges the nodes of a CSV file in the bulk import layout (see
+        CSVGraphWriter) on their first label and `key`."""
+        key_column = next(column for column in header if _csv_name(column) == key)
+        assignments = [f"n:`{label}`" for label in labels[1:]] + [
+            f"n.`{_csv_name(column)}` = {_csv_value(column)}"
+            for column in header
+            if column != key_column
+        ]
+        self._query(
+            "load_csv_nodes",
+            f"""
+            LOAD CSV WITH HEADERS FROM $url AS row
+            CALL {{
+                WITH row
+                MERGE (n:`{labels[0]}` {{`{key}`: row.`{key_column}`}})
+                {"SET " + ", ".join(assignments) if assignments else ""}
+            }} IN TRANSACTIONS OF {batch_size} ROWS
+            """,
+            {"url": url},
+        )
+
+    def load_csv_relationships(
+        self,
+        url: str,
+        type: str,
+        start: dict,
+        end: dict,
+        header: List[str],
+        batch_size: int,
+    ) -> None:
+        """Merges the relationships of a CSV file in the bulk import layout
+        between nodes matched on their label and key."""
+        self._query(
+            "load_csv_relationships",
+            f"""
+            LOAD CSV WITH HEADERS FROM $url AS row
+            CALL {{
+                WITH row
+                MATCH (a:`{start["label"]}` {{`{start["key"]}`: row.`{header[0]}`}})
+                MATCH (b:`{end["label"]}` {{`{end["key"]}`: row.`{header[1]}`}})
+                MERGE (a)-[:`{type}`]->(b)
+            }} IN TRANSACTIONS OF {batch_size} ROWS
+            """,
+            {"url": url},
+        )
+
+    def ensure_entity_index(self, label: str) -> None:
+        # entities are merged on their own label, which needs its own index
+        if label in self._indexed_labels:
+            return
+        self._query(
+            "ensure_entity_index",
+            f"CREATE INDEX IF NOT EXISTS FOR (n:`{label}`) ON (n.id)",
+        )
+        self._indexed_labels.add(label)
 
     def insert_chunk_graph(
         self,
         batch_data: List[ChunkNode],
         relationships: List[ChunkRelationship],
     ) -> None:
-        query = """
-        UNWIND $batch_data AS data
-        MERGE (c:Chunk {id: data.id})
-        SET c.text = data.text, c.position = data.position, c.length = data.length, 
-            c.file_name = data.file_name, c.content_offset = data.content_offset,
-            c.page_number = CASE WHEN data.page_number IS NOT NULL THEN data.page_number END,
-            c.start_time = CASE WHEN data.start_time IS NOT NULL THEN data.start_time END,
-            c.end_time = CASE WHEN data.end_time IS NOT NULL THEN data.end_time END
-        WITH data, c
-        MATCH (d:Document {file_name: data.file_name})
-        MERGE (c)-[:PART_OF]->(d)
-        WITH d
-        UNWIND $relationships AS rel
-        MATCH (c1:Chunk {id: rel.current_chunk_id}), (c2:Chunk {id: rel.previous_chunk_id})
-        CALL {
-            WITH d, c1, rel
-            WITH d, c1, rel WHERE rel.type = $FIRST_CHUNK
-            MERGE (d)-[:FIRST_CHUNK]->(c1)
-        }
-        CALL {
-            WITH c1, c2, rel
-            WITH c1, c2, rel WHERE rel.type = $NEXT_CHUNK
-            MERGE (c2)-[:NEXT_CHUNK]->(c1)
-        }
+        """Writes the chunk nodes, then the FIRST_CHUNK and NEXT_CHUNK links, each
+        in a linear pass committed every CHUNK_BATCH_SIZE rows.
         """
+        started = time.perf_counter()
 
-        self.graph.query(
-            query,
-            params={
-                "batch_data": [data.to_dict() for data in batch_data],
-                "relationships": [rel.to_dict() for rel in relationships],
-                "FIRST_CHUNK": FIRST_CHUNK,
-                "NEXT_CHUNK": NEXT_CHUNK,
-            },
+        for _, _, nodes in batch(batch_data, CHUNK_BATCH_SIZE):
+            self._query(
+                "insert_chunk_graph",
+                """
+                UNWIND $batch_data AS data
+                MERGE (c:Chunk {id: data.id})
+                SET c.text = data.text, c.position = data.position, c.length = data.length,
+                    c.file_name = data.file_name, c.content_offset = data.content_offset,
+                    c.page_number = CASE WHEN data.page_number IS NOT NULL THEN data.page_number END,
+                    c.start_time = CASE WHEN data.start_time IS NOT NULL THEN data.start_time END,
+                    c.end_time = CASE WHEN data.end_time IS NOT NULL THEN data.end_time END
+                WITH data, c
+                MATCH (d:Document {file_name: data.file_name})
+                MERGE (c)-[:PART_OF]->(d)
+                """,
+                params={"batch_data": [data.to_dict() for data in nodes]},
+            )
+
+        first_chunks = [rel.to_dict() for rel in relationships if rel.type == FIRST_CHUNK]
+        for _, _, rels in batch(first_chunks, CHUNK_BATCH_SIZE):
+            self._query(
+                "insert_chunk_graph",
+                """
+                UNWIND $relationships AS rel
+                MATCH (d:Document {file_name: rel.file_name})
+                MATCH (c:Chunk {id: rel.current_chunk_id})
+                MERGE (d)-[:FIRST_CHUNK]->(c)
+                """,
+                params={"relationships": rels},
+            )
+
+        next_chunks = [rel.to_dict() for rel in relationships if rel.type == NEXT_CHUNK]
+        for _, _, rels in batch(next_chunks, CHUNK_BATCH_SIZE):
+            self._query(
+                "insert_chunk_graph",
+                """
+                UNWIND $relationships AS rel
+                MATCH (c1:Chunk {id: rel.current_chunk_id})
+                MATCH (c2:Chunk {id: rel.previous_chunk_id})
+                MERGE (c2)-[:NEXT_CHUNK]->(c1)
+                """,
+                params={"relationships": rels},
+            )
+
+        rows = len(batch_data) + len(relationships)
+        elapsed = time.perf_counter() - started
+        logging.info(
+            f"Inserted {rows} chunk graph rows in {elapsed:.2f}s "
+            f"({rows / elapsed if elapsed > 0 else 0:.0f} rows/s)"
         )
+
+
+def _csv_name(column: str) -> str:
+    return column.split(":")[0]
+
+
+def _csv_value(column: str) -> str:
+    """Cypher expression converting a typed column of the import header."""
+    value = f"row.`{column}`"
+    type = column.split(":")[1] if ":" in column else "string"
+    if type == "int":
+        return f"toInteger({value})"
+    if type == "float":
+        return f"toFloat({value})"
+    if type == "localdatetime":
+        return f"localdatetime({value})"
+    if type == "boolean":
+        return f"toBoolean({value})"
+    if type == "float[]":
+        return f"[x IN split({value}, ';') | toFloat(x)]"
+    return value
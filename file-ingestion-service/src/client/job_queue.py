@@ -0,0 +1,444 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from src.config import (
+    JOB_HEARTBEAT_TIMEOUT,
+    JOB_MAX_ATTEMPTS,
+    JOB_QUEUE_PATH,
+    TEMP_STORAGE,
+)
+from src.models.job import (
+    JOB_CANCELLED,
+    JOB_DONE,
+    JOB_FAILED,
+    JOB_KIND_BATCH,
+    JOB_KIND_DOCUMENT,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    Job,
+)
+
+
+class JobQueue:
+    """A persistent ingestion job queue in a SQLite file. The API process
+    enqueues jobs and any number of worker processes claim them, so queued
+    jobs survive a restart of either.
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_PATH):
+        self.path = path
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    file_name TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    progress TEXT,
+                    notification_callback TEXT,
+                    content_hash TEXT,
+                    kind TEXT NOT NULL DEFAULT '{JOB_KIND_DOCUMENT}',
+                    worker_id TEXT,
+                    heartbeat_at REAL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)"
+            )
+            # the content hashes of the files of batch jobs, document jobs keep
+            # theirs in jobs.content_hash
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS batch_files (
+                    job_id TEXT NOT NULL,
+                    content_hash TEXT NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS batch_files_content_hash "
+                "ON batch_files (content_hash)"
+            )
+
+    @contextmanager
+    def _connection(self):
+        # autocommit mode, transactions are opened explicitly where needed
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(
+        self,
+        file_path: str,
+        file_name: str,
+        notification_callback: Optional[str] = None,
+        content_hash: Optional[str] = None,
+        kind: str = JOB_KIND_DOCUMENT,
+    ) -> Job:
+        job = _new_job(file_path, file_name, notification_callback, content_hash, kind)
+        with self._connection() as conn:
+            _insert_job(conn, job)
+        return job
+
+    def enqueue_unless_active(
+        self,
+        file_path: str,
+        file_name: str,
+        content_hash: str,
+        notification_callback: Optional[str] = None,
+    ) -> Tuple[Job, bool]:
+        """Queues a document job unless a queued or running job already has
+        the same content, in one transaction so two uploads of the same file
+        can't both be queued. Returns the new job, or the active one, and
+        whether it was queued."""
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                active_job = _find_active(conn, content_hash)
+                if active_job is not None:
+                    conn.execute("COMMIT")
+                    return active_job, False
+
+                job = _new_job(
+                    file_path, file_name, notification_callback, content_hash
+                )
+                _insert_job(conn, job)
+                conn.execute("COMMIT")
+                return job, True
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def enqueue_batch(
+        self,
+        files: List[dict],
+        notification_callback: Optional[str] = None,
+        storage: str = TEMP_STORAGE,
+    ) -> Tuple[Optional[Job], Dict[str, Job]]:
+        """Queues a batch job for the `files` (see `write_batch_manifest`)
+        whose content no queued or running job has already, in one
+        transaction like `enqueue_unless_active`. Returns the job, None when
+        no file was left, and the active jobs by content hash of the files
+        left out."""
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                active_jobs = {}
+                for file in files:
+                    active_job = _find_active(conn, file["content_hash"])
+                    if active_job is not None:
+                        active_jobs[file["content_hash"]] = active_job
+                files = [f for f in files if f["content_hash"] not in active_jobs]
+                if not files:
+                    conn.execute("COMMIT")
+                    return None, active_jobs
+
+                # written before the job exists, no worker can claim it early
+                manifest_path = write_batch_manifest(files, storage)
+                job = _new_job(
+                    manifest_path,
+                    f"batch of {len(files)} files",
+                    notification_callback,
+                    kind=JOB_KIND_BATCH,
+                )
+                _insert_job(conn, job)
+                conn.executemany(
+                    "INSERT INTO batch_files (job_id, content_hash) VALUES (?, ?)",
+                    [(job.id, file["content_hash"]) for file in files],
+                )
+                conn.execute("COMMIT")
+                return job, active_jobs
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def claim(self, worker_id: Optional[str] = None) -> Optional[Job]:
+        """Atomically moves the oldest queued job to running, owned by
+        `worker_id` (this process by default), and returns it."""
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? "
+                    "ORDER BY created_at LIMIT 1",
+                    (JOB_QUEUED,),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                job = _row_to_job(row)
+                job.status = JOB_RUNNING
+                job.started_at = time.time()
+                job.attempts += 1
+                job.worker_id = worker_id or current_worker_id()
+                job.heartbeat_at = job.started_at
+                conn.execute(
+                    "UPDATE jobs SET status = ?, started_at = ?, attempts = ?, "
+                    "worker_id = ?, heartbeat_at = ? WHERE id = ?",
+                    (
+                        job.status,
+                        job.started_at,
+                        job.attempts,
+                        job.worker_id,
+                        job.heartbeat_at,
+                        job.id,
+                    ),
+                )
+                conn.execute("COMMIT")
+                return job
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def heartbeat(self, job: Job) -> bool:
+        """Records that the worker of the running job is alive. Returns False
+        when the job isn't running on that worker anymore: cancelled, or
+        requeued because its heartbeat was late."""
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? "
+                "WHERE id = ? AND status = ? AND worker_id = ?",
+                (time.time(), job.id, JOB_RUNNING, job.worker_id),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job: Job, result: dict) -> None:
+        self._finish(job, JOB_DONE, result=json.dumps(result, default=str))
+
+    def fail(self, job: Job, error: str) -> None:
+        self._finish(job, JOB_FAILED, error=error)
+
+    def _finish(self, job: Job, status: str, result=None, error=None) -> None:
+        # only while the job is still the worker's: a cancelled job stays
+        # cancelled, and a requeued one belongs to whoever runs it next
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ? "
+                "WHERE id = ? AND status = ? AND worker_id = ?",
+                (
+                    status,
+                    time.time(),
+                    result,
+                    error,
+                    job.id,
+                    JOB_RUNNING,
+                    job.worker_id,
+                ),
+            )
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancels a queued or running job and returns it. A running job is
+        stopped by its worker, which checks `is_cancelled` while it runs."""
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? "
+                "AND status IN (?, ?)",
+                (JOB_CANCELLED, time.time(), job_id, JOB_QUEUED, JOB_RUNNING),
+            )
+        return self.get(job_id)
+
+    def is_cancelled(self, job_id: str) -> bool:
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT status FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return row is not None and row["status"] == JOB_CANCELLED
+
+    def update_progress(self, job_id: str, progress: dict) -> None:
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET progress = ? WHERE id = ?",
+                (json.dumps(progress), job_id),
+            )
+
+    def get_progress(self, job_id: str) -> Optional[dict]:
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT status, progress FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "status": row["status"],
+            "progress": json.loads(row["progress"]) if row["progress"] else None,
+        }
+
+    def requeue_stale(
+        self,
+        timeout: float = JOB_HEARTBEAT_TIMEOUT,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+    ) -> List[Job]:
+        """Puts running jobs whose worker stopped sending heartbeats (it died,
+        or the service was killed) back in the queue, and fails those already
+        started `max_attempts` times. Returns the failed ones."""
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                stale = [
+                    _row_to_job(row)
+                    for row in conn.execute(
+                        "SELECT * FROM jobs WHERE status = ? "
+                        "AND coalesce(heartbeat_at, 0) < ?",
+                        (JOB_RUNNING, now - timeout),
+                    ).fetchall()
+                ]
+                failed = []
+                for job in stale:
+                    if job.attempts >= max_attempts:
+                        failed.append(job)
+                        job.status = JOB_FAILED
+                        job.finished_at = now
+                        job.error = (
+                            f"Gave up after {job.attempts} attempts, "
+                            "its worker stopped every time"
+                        )
+                        conn.execute(
+                            "UPDATE jobs SET status = ?, finished_at = ?, error = ? "
+                            "WHERE id = ?",
+                            (job.status, job.finished_at, job.error, job.id),
+                        )
+                    else:
+                        conn.execute(
+                            "UPDATE jobs SET status = ?, started_at = NULL, "
+                            "worker_id = NULL, heartbeat_at = NULL WHERE id = ?",
+                            (JOB_QUEUED, job.id),
+                        )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        requeued = len(stale) - len(failed)
+        if requeued:
+            logging.info(f"Requeued {requeued} jobs whose worker stopped")
+        return failed
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return _row_to_job(row) if row else None
+
+    def find_active(self, content_hash: str) -> Optional[Job]:
+        """Returns a queued or running job for the same file content, if any."""
+        with self._connection() as conn:
+            return _find_active(conn, content_hash)
+
+    def count_by_status(self) -> Dict[str, int]:
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT status, count(*) AS jobs FROM jobs GROUP BY status"
+            ).fetchall()
+        return {row["status"]: row["jobs"] for row in rows}
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[Job]:
+        query = "SELECT * FROM jobs"
+        params = []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+
+        with self._connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [_row_to_job(row) for row in rows]
+
+
+def current_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def write_batch_manifest(files: List[dict], storage: str = TEMP_STORAGE) -> str:
+    """Writes the `file_path`, `file_name` and `content_hash` of the files of a
+    batch job to the JSON file the job points to, next to the files, and
+    returns its path."""
+    Path(storage).mkdir(parents=True, exist_ok=True)
+    manifest_path = str(Path(storage) / f"batch_{uuid.uuid4().hex}.json")
+    with open(manifest_path, "w") as f:
+        json.dump({"files": files}, f)
+    return manifest_path
+
+
+def read_batch_manifest(manifest_path: str) -> List[dict]:
+    with open(manifest_path) as f:
+        return json.load(f)["files"]
+
+
+def _new_job(
+    file_path: str,
+    file_name: str,
+    notification_callback: Optional[str] = None,
+    content_hash: Optional[str] = None,
+    kind: str = JOB_KIND_DOCUMENT,
+) -> Job:
+    return Job(
+        id=uuid.uuid4().hex,
+        status=JOB_QUEUED,
+        file_name=file_name,
+        file_path=file_path,
+        created_at=time.time(),
+        notification_callback=notification_callback,
+        content_hash=content_hash,
+        kind=kind,
+    )
+
+
+def _insert_job(conn: sqlite3.Connection, job: Job) -> None:
+    conn.execute(
+        "INSERT INTO jobs (id, status, file_name, file_path, created_at, "
+        "notification_callback, content_hash, kind) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            job.id,
+            job.status,
+            job.file_name,
+            job.file_path,
+            job.created_at,
+            job.notification_callback,
+            job.content_hash,
+            job.kind,
+        ),
+    )
+
+
+def _find_active(conn: sqlite3.Connection, content_hash: str) -> Optional[Job]:
+    # a document job with the content, or a batch job with a file that has it
+    row = conn.execute(
+        "SELECT * FROM jobs WHERE status IN (?, ?) AND (content_hash = ? OR id IN "
+        "(SELECT job_id FROM batch_files WHERE content_hash = ?)) "
+        "ORDER BY created_at LIMIT 1",
+        (JOB_QUEUED, JOB_RUNNING, content_hash, content_hash),
+    ).fetchone()
+    return _row_to_job(row) if row else None
+
+
+def _row_to_job(row: sqlite3.Row) -> Job:
+    data = dict(row)
+    for column in ["result", "progress"]:
+        data[column] = json.loads(data[column]) if data[column] else None
+    return Job(**data)
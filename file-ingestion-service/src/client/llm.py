@@ -1,5 +1,6 @@
 from langchain_google_vertexai import VertexAIEmbeddings
 from langchain_google_vertexai.model_garden import ChatAnthropicVertex
+from src.config import CHAT_MODEL, EMBEDDING_MODEL
 
 
 class LLMModel:
@@ -9,9 +10,7 @@ class LLMModel:
     @classmethod
     def get_embedding_model(cls) -> VertexAIEmbeddings:
         if cls._embedding_instance is None:
-            cls._embedding_instance = VertexAIEmbeddings(
-                model="textembedding-gecko@003"
-            )
+            cls._embedding_instance = VertexAIEmbeddings(model=EMBEDDING_MODEL)
             # dimension = 768
             # cls._embedding_instance = (embeddings, dimension)
         return cls._embedding_instance
@@ -20,7 +19,7 @@ class LLMModel:
     def get_chat_model(cls) -> ChatAnthropicVertex:
         if cls._llm_instance is None:
             llm = ChatAnthropicVertex(
-                model_name="claude-3-5-sonnet@20240620",
+                model_name=CHAT_MODEL,
                 project="global-river-423404-p3",
                 location="us-east5",
             )
@@ -0,0 +1,28 @@
+import httpx
+from src.config import DOWNLOAD_CHUNK_SIZE, REMOTE_FILE_MAX_BYTES, REMOTE_FILE_TIMEOUT
+from src.client.spool import FileTooLargeError, SpooledFile, spool_to_storage
+
+
+async def download_remote_file(
+    file_uri: str,
+    suffix: str = ".pdf",
+    max_bytes: int = REMOTE_FILE_MAX_BYTES,
+    timeout: float = REMOTE_FILE_TIMEOUT,
+) -> SpooledFile:
+    """Streams the remote file into the temp storage without blocking the
+    event loop. Raises FileTooLargeError past `max_bytes` and httpx.HTTPError
+    when the download fails; no partial file is left behind.
+    """
+    async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
+        async with client.stream("GET", file_uri) as response:
+            response.raise_for_status()
+
+            declared_size = int(response.headers.get("content-length") or 0)
+            if declared_size > max_bytes:
+                raise FileTooLargeError(
+                    f"File is {declared_size} bytes, the limit is {max_bytes}"
+                )
+
+            return await spool_to_storage(
+                response.aiter_bytes(DOWNLOAD_CHUNK_SIZE), suffix, max_bytes
+            )
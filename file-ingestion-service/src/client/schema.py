@@ -0,0 +1,215 @@
+"""Constraints and indexes of the graph, created once at startup.
+
+    python -m src.client.schema [--check]
+
+Every hot query MERGEs or MATCHes on `Document.file_name`, `Chunk.id` or an
+entity `id`; without these the MERGEs are label scans. This service owns the
+schema, bump SCHEMA_VERSION when it changes. chat-rag-services only creates the
+vector index it searches (app/db/schema.py), keep its statement the same as
+`create_vector_index`.
+"""
+
+import argparse
+import json
+import logging
+from datetime import datetime
+from typing import List, Optional
+from dotenv import load_dotenv
+from langchain_community.graphs import Neo4jGraph
+from src.config import ENTITY_LABEL, VECTOR_EMBEDDING_DIMENSION
+
+SCHEMA_VERSION = 1
+SCHEMA_LABEL = "__Schema__"
+VECTOR_INDEX = "vector"
+
+# by name, which is what `check` looks for
+CONSTRAINTS = {
+    "document_file_name": (
+        "CREATE CONSTRAINT document_file_name IF NOT EXISTS "
+        "FOR (d:Document) REQUIRE d.file_name IS UNIQUE"
+    ),
+    "chunk_id": (
+        "CREATE CONSTRAINT chunk_id IF NOT EXISTS FOR (c:Chunk) REQUIRE c.id IS UNIQUE"
+    ),
+    # chat history sessions, merged on their id by Neo4jChatMessageHistory
+    "session_id": (
+        "CREATE CONSTRAINT session_id IF NOT EXISTS "
+        "FOR (s:Session) REQUIRE s.id IS UNIQUE"
+    ),
+}
+INDEXES = {
+    # entities are merged on their own label (see ensure_entity_index), this
+    # one is for lookups across labels
+    "entity_id": (
+        f"CREATE INDEX entity_id IF NOT EXISTS FOR (n:`{ENTITY_LABEL}`) ON (n.id)"
+    ),
+    "keyword": (
+        "CREATE FULLTEXT INDEX keyword IF NOT EXISTS FOR (c:Chunk) ON EACH [c.text]"
+    ),
+    "entities": (
+        f"CREATE FULLTEXT INDEX entities IF NOT EXISTS FOR (n:`{ENTITY_LABEL}`) "
+        "ON EACH [n.id, n.description]"
+    ),
+}
+
+
+class SchemaManager:
+    def __init__(
+        self, graph: Neo4jGraph, vector_dimension: int = VECTOR_EMBEDDING_DIMENSION
+    ):
+        self.graph = graph
+        self.vector_dimension = vector_dimension
+
+    def apply(self, vector_index: bool = True) -> bool:
+        """Creates whatever is missing, unless SCHEMA_VERSION was applied
+        already, and returns whether it did. Raises on the first statement
+        that fails. The vector index is created first and on its own, at every
+        call, so a failing constraint never leaves retrieval without it. The
+        version is only recorded once the vector index exists too, so a bulk
+        load can create the other indexes first and the vector index after the
+        embeddings are loaded."""
+        if vector_index:
+            self.create_vector_index()
+            dimension = self.get_vector_dimension()
+            if dimension != self.vector_dimension:
+                raise Exception(
+                    f"Vector index {VECTOR_INDEX} has {dimension} dimensions, "
+                    f"the embeddings have {self.vector_dimension}"
+                )
+
+        current = self.get_version()
+        if current is not None and current >= SCHEMA_VERSION:
+            logging.info(f"Graph schema version {current} is up to date")
+            return False
+
+        self._drop_conflicting_indexes()
+        for statement in list(CONSTRAINTS.values()) + list(INDEXES.values()):
+            self.graph.query(statement)
+        if not vector_index:
+            return True
+
+        self.graph.query(
+            f"""
+            MERGE (s:{SCHEMA_LABEL})
+            SET s.version = $version, s.applied_at = $applied_at
+            """,
+            {"version": SCHEMA_VERSION, "applied_at": datetime.now()},
+        )
+        logging.info(f"Applied graph schema version {SCHEMA_VERSION}")
+        return True
+
+    def check(self) -> dict:
+        """What `apply` would change, without changing anything."""
+        constraints = {
+            row["name"] for row in self.graph.query("SHOW CONSTRAINTS YIELD name")
+        }
+        indexes = {
+            row["name"]: row
+            for row in self.graph.query("SHOW INDEXES YIELD name, state, options")
+        }
+        expected = list(CONSTRAINTS) + list(INDEXES) + [VECTOR_INDEX]
+        return {
+            "version": self.get_version(),
+            "expected_version": SCHEMA_VERSION,
+            "missing": [
+                name
+                for name in expected
+                if name not in constraints and name not in indexes
+            ],
+            "not_online": [
+                name for name, row in indexes.items() if row["state"] != "ONLINE"
+            ],
+            "vector_dimension": self.get_vector_dimension(),
+            "expected_vector_dimension": self.vector_dimension,
+        }
+
+    def get_version(self) -> Optional[int]:
+        result = self.graph.query(
+            f"MATCH (s:{SCHEMA_LABEL}) RETURN max(s.version) AS version"
+        )
+        return result[0]["version"] if result else None
+
+    def get_vector_dimension(self) -> Optional[int]:
+        for index in self.graph.query("SHOW INDEXES YIELD name, options"):
+            if index["name"] == VECTOR_INDEX:
+                return index["options"]["indexConfig"]["vector.dimensions"]
+        return None
+
+    def create_vector_index(self) -> None:
+        self.graph.query(
+            f"""
+            CREATE VECTOR INDEX {VECTOR_INDEX} IF NOT EXISTS
+            FOR (c:Chunk) ON (c.embedding)
+            OPTIONS {{
+                indexConfig: {{
+                    `vector.dimensions`: $dimension,
+                    `vector.similarity_function`: 'cosine'
+                }}
+            }}
+            """,
+            {"dimension": self.vector_dimension},
+        )
+
+    def _drop_conflicting_indexes(self) -> None:
+        # a uniqueness constraint comes with its own index and can't be
+        # created next to a plain index on the same property, like those
+        # earlier versions created
+        indexes = self.graph.query(
+            """
+            SHOW INDEXES YIELD name, type, labelsOrTypes, properties, owningConstraint
+            WHERE type = 'RANGE' AND owningConstraint IS NULL
+            RETURN name, labelsOrTypes, properties
+            """
+        )
+        constrained = {("Document", "file_name"), ("Chunk", "id"), ("Session", "id")}
+        for index in indexes:
+            schema = list(zip(index["labelsOrTypes"], index["properties"]))
+            if len(index["properties"]) == 1 and schema[0] in constrained:
+                logging.info(f"Dropping index {index['name']} for a constraint")
+                self.graph.query(f"DROP INDEX `{index['name']}` IF EXISTS")
+
+
+def schema_problems(report: dict) -> List[str]:
+    problems = []
+    if report["version"] != report["expected_version"]:
+        problems.append(
+            f"schema version {report['version']}, expected {report['expected_version']}"
+        )
+    if report["missing"]:
+        problems.append(f"missing {', '.join(report['missing'])}")
+    if report["not_online"]:
+        problems.append(f"not online {', '.join(report['not_online'])}")
+    if report["vector_dimension"] != report["expected_vector_dimension"]:
+        problems.append(
+            f"vector index has {report['vector_dimension']} dimensions, "
+            f"expected {report['expected_vector_dimension']}"
+        )
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="report what is missing without changing anything",
+    )
+    args = parser.parse_args()
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    schema = SchemaManager(Neo4jGraph())
+    if not args.check:
+        schema.apply()
+
+    report = schema.check()
+    print(json.dumps(report, indent=2))
+    problems = schema_problems(report)
+    for problem in problems:
+        print(f"schema: {problem}")
+    if problems:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
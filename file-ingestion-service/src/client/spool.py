@@ -0,0 +1,131 @@
+import asyncio
+import hashlib
+import os
+import uuid
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, List, Optional, Tuple
+from src.config import TEMP_STORAGE
+from src.utils import delete_file
+
+
+class FileTooLargeError(Exception):
+    pass
+
+
+@dataclass
+class SpooledFile:
+    file_path: str
+    sha256: str
+    size: int
+
+
+async def spool_to_storage(
+    chunks: AsyncIterator[bytes],
+    suffix: str = ".pdf",
+    max_bytes: Optional[int] = None,
+    storage: str = TEMP_STORAGE,
+) -> SpooledFile:
+    """Writes the incoming bytes to `storage` without blocking the event loop,
+    hashing them on the way. Every upload gets a file of its own, even when
+    the bytes are the same as another's: the job that ingests it deletes it,
+    and must not delete it from under another job.
+    """
+    Path(storage).mkdir(parents=True, exist_ok=True)
+    partial_path = os.path.join(storage, f"{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        with open(partial_path, "wb") as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise FileTooLargeError(
+                        f"File is larger than the limit of {max_bytes} bytes"
+                    )
+                digest.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        delete_file(partial_path)
+        raise
+
+    sha256 = digest.hexdigest()
+    file_path = _spooled_path(storage, sha256, suffix)
+    os.replace(partial_path, file_path)
+    return SpooledFile(file_path=file_path, sha256=sha256, size=size)
+
+
+async def spool_zip_members(
+    zip_path: str,
+    suffixes: Tuple[str, ...] = (".pdf",),
+    max_bytes: Optional[int] = None,
+    storage: str = TEMP_STORAGE,
+) -> List[Tuple[str, SpooledFile]]:
+    """Unpacks the members of the archive with one of `suffixes` into
+    `storage` like `spool_to_storage`, in a thread, and returns them with
+    their path inside the archive. Raises FileTooLargeError when a member
+    unpacks to more than `max_bytes`, without leaving any of them behind.
+    """
+    return await asyncio.to_thread(
+        _spool_zip_members, zip_path, suffixes, max_bytes, storage
+    )
+
+
+def _spool_zip_members(
+    zip_path: str,
+    suffixes: Tuple[str, ...],
+    max_bytes: Optional[int],
+    storage: str,
+) -> List[Tuple[str, SpooledFile]]:
+    Path(storage).mkdir(parents=True, exist_ok=True)
+    spooled = []
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            for member in archive.infolist():
+                if member.is_dir() or not member.filename.lower().endswith(suffixes):
+                    continue
+                spooled_member = _spool_member(archive, member, max_bytes, storage)
+                spooled.append((member.filename, spooled_member))
+    except BaseException:
+        for _, file in spooled:
+            delete_file(file.file_path)
+        raise
+    return spooled
+
+
+def _spool_member(
+    archive: zipfile.ZipFile,
+    member: zipfile.ZipInfo,
+    max_bytes: Optional[int],
+    storage: str,
+) -> SpooledFile:
+    partial_path = os.path.join(storage, f"{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        # the declared size can't be trusted, the bytes are counted as they come
+        with archive.open(member) as source, open(partial_path, "wb") as f:
+            while chunk := source.read(1024 * 1024):
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise FileTooLargeError(
+                        f"{member.filename} is larger than the limit of "
+                        f"{max_bytes} bytes"
+                    )
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        delete_file(partial_path)
+        raise
+
+    sha256 = digest.hexdigest()
+    file_path = _spooled_path(storage, sha256, Path(member.filename).suffix)
+    os.replace(partial_path, file_path)
+    return SpooledFile(file_path=file_path, sha256=sha256, size=size)
+
+
+def _spooled_path(storage: str, sha256: str, suffix: str) -> str:
+    return os.path.join(storage, f"{sha256}_{uuid.uuid4().hex}{suffix}")
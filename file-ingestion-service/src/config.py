@@ -1,13 +1,76 @@
-KNN_MIN_SCORE = 0.94
-CHUNK_BATCH_SIZE = 20
+# SIMILARITY GRAPH
+# SIMILAR relationships are added for the new chunks of every ingested document.
+# "index" queries the vector index for each new chunk (links across the whole
+# corpus); "bulk" scores the new chunks against the other chunks of the same
+# document in-process with NumPy.
+KNN_MODE = "index"
+KNN_MIN_SCORE = 0.94  # vector index score, (1 + cosine) / 2
+KNN_TOP_K = 5
+KNN_BATCH_SIZE = 100  # chunks per vector index query or per similarity block
+# Rows written per transaction when inserting the chunk graph
+CHUNK_BATCH_SIZE = 500
+
+# CHUNKING
+# Chunks are windows of CHUNK_TOKEN_SIZE tokens, CHUNK_TOKEN_OVERLAP of them
+# shared with the previous chunk of the same page
+CHUNK_TOKEN_SIZE = 200
+CHUNK_TOKEN_OVERLAP = 20
+CHUNK_ENCODING = "gpt2"
+CHUNK_PAGES_PER_BATCH = 32  # pages tokenized in one batch
+
+# STREAMING
+# How many chunks flow through the pipeline together, and how many of those
+# batches may be buffered between the parsing and the embedding/LLM stages.
+STREAM_CHUNK_BATCH_SIZE = 100
+STREAM_QUEUE_SIZE = 2
+
+# Batch uploads go through one pipeline run, in batches of
+# BATCH_CHUNK_BATCH_SIZE chunks that span the files of the batch, so their
+# chunk, embedding and entity writes share larger transactions.
+BATCH_CHUNK_BATCH_SIZE = 500
+BATCH_MAX_FILES = 1000  # files per batch upload, after unpacking zip archives
+BATCH_FILE_MAX_BYTES = 200 * 1024 * 1024  # per file, once unpacked
+BATCH_ARCHIVE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # per zip archive
+
+# Only embed and extract the chunks that changed when a document is uploaded again
+INCREMENTAL_REINGESTION = True
 
 # EMBEDDING
-MAX_PARALLEL_EMBEDDING_SIZE = 5
+# Texts per embedding request (the provider accepts up to 250 texts and 20k
+# tokens per request) and how many requests may run at the same time
+MAX_PARALLEL_EMBEDDING_SIZE = 50
 MAX_EMBEDDING_WORKER = 5
+EMBEDDING_RETRY_ATTEMPTS = 3
+EMBEDDING_RETRY_BACKOFF = 1.0  # seconds, doubled on every retry
+EMBEDDING_MODEL = "textembedding-gecko@003"
+EMBEDDING_TASK_TYPE = "RETRIEVAL_QUERY"
+
+# ENTITIES
+# Extracted entities get this label on top of their own, and are written in
+# transactions of ENTITY_BATCH_SIZE rows
+ENTITY_LABEL = "__Entity__"
+ENTITY_BATCH_SIZE = 1000
+
+# GRAPH EXTRACTION
+# Consecutive chunks are packed into extraction requests of up to
+# GRAPH_TOKEN_BUDGET tokens, in as few requests as possible
+GRAPH_TOKEN_BUDGET = 2000
+CHAT_MODEL = "claude-3-5-sonnet@20240620"
 
-# How many chunk to combine to use in the graph generation
-CHUNK_COMBINE_SIZE = 5
-MAX_WORKERS = 5
+# LLM CONCURRENCY
+# Graph extraction calls are asyncio tasks running under an adaptive limit
+# shared by the documents of a worker: it grows by one call per round of
+# successful calls up to LLM_MAX_CONCURRENCY and is multiplied by
+# LLM_CONCURRENCY_BACKOFF on every rate limit or timeout. Failed calls are
+# retried LLM_RETRY_ATTEMPTS times, calls taking longer than
+# GRAPH_CALL_TIMEOUT seconds count as failed.
+LLM_INITIAL_CONCURRENCY = 5
+LLM_MIN_CONCURRENCY = 1
+LLM_MAX_CONCURRENCY = 256
+GRAPH_CALL_TIMEOUT = 120.0
+LLM_CONCURRENCY_BACKOFF = 0.5
+LLM_RETRY_ATTEMPTS = 5
+LLM_RETRY_BACKOFF = 2.0  # seconds, doubled on every retry
 
 VECTOR_EMBEDDING_DIMENSION = 768
 
@@ -15,3 +78,43 @@ FIRST_CHUNK = "FIRST_CHUNK"
 NEXT_CHUNK = "NEXT_CHUNK"
 
 TEMP_STORAGE = "temp_storage"
+UPLOAD_MAX_BYTES = 200 * 1024 * 1024  # per file uploaded to /extract
+
+# REMOTE FILES
+REMOTE_FILE_MAX_BYTES = 200 * 1024 * 1024
+REMOTE_FILE_TIMEOUT = 60.0  # seconds, for connecting and between two reads
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+NOTIFICATION_TIMEOUT = 10.0
+
+# CACHE
+# On-disk caches shared by every ingestion worker on the host
+CACHE_STORAGE = "cache"
+EMBEDDING_CACHE_PATH = f"{CACHE_STORAGE}/embeddings.sqlite3"
+EMBEDDING_CACHE_MAX_ENTRIES = 100_000  # ~3KB per 768-dimension embedding
+GRAPH_CACHE_PATH = f"{CACHE_STORAGE}/graph_documents.sqlite3"
+GRAPH_CACHE_MAX_ENTRIES = 50_000
+
+# JOBS
+JOB_STORAGE = "jobs"
+JOB_QUEUE_PATH = f"{JOB_STORAGE}/jobs.sqlite3"
+INGESTION_WORKERS = 2  # worker processes consuming the job queue
+JOB_POLL_INTERVAL = 1.0  # seconds an idle worker waits before polling again
+JOB_SHUTDOWN_TIMEOUT = 30.0  # seconds to let running jobs finish on shutdown
+# A worker refreshes the heartbeat of its job every JOB_HEARTBEAT_INTERVAL
+# seconds. A running job without one for JOB_HEARTBEAT_TIMEOUT seconds lost its
+# worker and is queued again, or failed once it was started JOB_MAX_ATTEMPTS
+# times (a file that crashes its worker would be retried forever otherwise).
+JOB_HEARTBEAT_INTERVAL = 10.0
+JOB_HEARTBEAT_TIMEOUT = 60.0
+JOB_MAX_ATTEMPTS = 3
+PROGRESS_UPDATE_INTERVAL = 2.0  # at most one progress write per document every N seconds
+
+# CPU STAGES
+# Processes each ingestion worker uses to parse and split PDF pages. 0 shares
+# the available cores between the INGESTION_WORKERS.
+CPU_STAGE_WORKERS = 0
+CPU_STAGE_PAGES_PER_TASK = 8  # pages parsed and split per task
+
+# BULK IMPORT
+BULK_IMPORT_DOCUMENTS = 4  # documents exported at the same time
+BULK_IMPORT_BATCH_SIZE = 10_000  # rows per transaction when loading the CSV files
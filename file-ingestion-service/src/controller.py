@@ -1,13 +1,21 @@
+import threading
+from itertools import chain
 from pathlib import Path
 from langchain.docstore.document import Document
-from langchain_community.graphs import Neo4jGraph
-from typing import List
+from typing import Iterator, List, Optional, Tuple
+from .client.cache import EmbeddingCache, GraphDocumentCache
 from .client.graph_db import GraphDBDataAccess
 from .client.llm import LLMModel
+from .config import BATCH_CHUNK_BATCH_SIZE
+from .models.document import BatchDocument
+from .processor.chunker import TokenChunker
+from .processor.cpu_stage import CPUStageExecutor
 from .processor.embedding import EmbeddingGenerator
 from .processor.graph import GraphGenerator
+from .processor.knn import KNNGraphBuilder
 from .processor.document import DocumentProcessor
-from .utils import load_pdf
+from .processor.progress import ProgressReporter
+from .utils import iter_pdf_pages, load_pdf
 
 
 def extract_pdf_document(
@@ -15,16 +23,129 @@ def extract_pdf_document(
     llm: LLMModel,
     file_path: str,
     file_name: str,
+    progress: Optional[ProgressReporter] = None,
+    content_hash: Optional[str] = None,
+    cpu_executor: Optional[CPUStageExecutor] = None,
+    cancel_event: Optional[threading.Event] = None,
 ):
-    pages = load_documents(file_path)
-    if pages == None or len(pages) == 0:
+    graph_gen = GraphGenerator(
+        llm, cache=GraphDocumentCache(), cancel_event=cancel_event
+    )
+    embed_gen = EmbeddingGenerator(llm, cache=EmbeddingCache())
+    dp = DocumentProcessor(db, graph_gen, embed_gen, knn_builder=KNNGraphBuilder(db))
+    return process_pdf(dp, file_path, file_name, progress, content_hash, cpu_executor)
+
+
+def process_pdf(
+    dp: DocumentProcessor,
+    file_path: str,
+    file_name: str,
+    progress: Optional[ProgressReporter] = None,
+    content_hash: Optional[str] = None,
+    cpu_executor: Optional[CPUStageExecutor] = None,
+):
+    """Runs the PDF through the document processor. With a `cpu_executor`, the
+    pages are parsed and split in its process pool instead of the calling thread."""
+    if cpu_executor is None:
+        pages = stream_documents(file_path)
+        first_page = next(pages, None)
+        if first_page is None:
+            raise Exception(f"File content is not available for file : {file_name}")
+
+        return dp.process_document(
+            file_name, chain([first_page], pages), progress, content_hash
+        )
+
+    if progress is None:
+        progress = ProgressReporter(file_name, dp.db_dao)
+    page_chunks = cpu_executor.iter_chunks(file_path)
+    first_page = next(page_chunks, None)
+    if first_page is None:
         raise Exception(f"File content is not available for file : {file_name}")
 
-    graph_gen = GraphGenerator(llm)
-    embed_gen = EmbeddingGenerator(llm)
-    dp = DocumentProcessor(db, graph_gen, embed_gen)
-    result = dp.process_document(file_name, pages)
-    return result
+    def stream_chunks() -> Iterator[Document]:
+        for total_pages, chunks in chain([first_page], page_chunks):
+            progress.page_read(total_pages)
+            yield from chunks
+
+    return dp.process_chunks(file_name, stream_chunks(), progress, content_hash)
+
+
+def extract_pdf_batch(
+    db: GraphDBDataAccess,
+    llm: LLMModel,
+    files: List[Tuple[str, str, Optional[str]]],
+    progress: Optional[ProgressReporter] = None,
+    cpu_executor: Optional[CPUStageExecutor] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> List[dict]:
+    """Ingests `(file_path, file_name, content_hash)` files in one pipeline run
+    (see `DocumentProcessor.process_batch`) and returns the result of every
+    file, with its error when it failed."""
+    graph_gen = GraphGenerator(
+        llm, cache=GraphDocumentCache(), cancel_event=cancel_event
+    )
+    embed_gen = EmbeddingGenerator(llm, cache=EmbeddingCache())
+    dp = DocumentProcessor(db, graph_gen, embed_gen, knn_builder=KNNGraphBuilder(db))
+    if progress is None:
+        progress = ProgressReporter("batch")
+
+    def read_documents() -> Iterator[BatchDocument]:
+        for file_path, file_name, content_hash in files:
+            document = BatchDocument(file_name, content_hash=content_hash)
+            document.chunks = stream_pdf_chunks(
+                document, file_path, progress, cpu_executor
+            )
+            yield document
+
+    documents = dp.process_batch(read_documents(), progress, BATCH_CHUNK_BATCH_SIZE)
+    results = []
+    for document in documents:
+        if document.error is not None:
+            results.append(
+                {
+                    "file_name": document.file_name,
+                    "status": "Failed",
+                    "error": str(document.error),
+                }
+            )
+        else:
+            results.append(document.result)
+    return results
+
+
+def stream_pdf_chunks(
+    document: BatchDocument,
+    file_path: str,
+    progress: ProgressReporter,
+    cpu_executor: Optional[CPUStageExecutor] = None,
+) -> Iterator[Document]:
+    """The chunks of one PDF of a batch, counting its pages in `document`."""
+    document.pages_read = 0
+    if cpu_executor is None:
+        page_chunks = (
+            (page.metadata.get("total_pages"), [page])
+            for page in stream_documents(file_path)
+        )
+    else:
+        page_chunks = cpu_executor.iter_chunks(file_path)
+
+    def count_pages() -> Iterator[Document]:
+        for total_pages, chunks in page_chunks:
+            if document.pages_read == 0:
+                progress.document_opened(total_pages or 0)
+            document.pages_read += 1
+            progress.page_read()
+            yield from chunks
+
+    if cpu_executor is None:
+        yield from TokenChunker().iter_chunks(count_pages())
+    else:
+        yield from count_pages()
+    if document.pages_read == 0:
+        raise Exception(
+            f"File content is not available for file : {document.file_name}"
+        )
 
 
 def load_documents(file_path: str) -> List[Document]:
@@ -36,3 +157,14 @@ def load_documents(file_path: str) -> List[Document]:
     else:
         raise Exception(f"File {Path(file_path).name} does not exist")
     return pages
+
+
+def stream_documents(file_path: str) -> Iterator[Document]:
+    """Like `load_documents`, but yields the pages one at a time as they are parsed."""
+    if not Path(file_path).exists():
+        raise Exception(f"File {Path(file_path).name} does not exist")
+
+    try:
+        yield from iter_pdf_pages(file_path)
+    except Exception as e:
+        raise Exception("Error while reading the file content or metadata")
@@ -0,0 +1,112 @@
+"""Prometheus metrics of the ingestion pipeline, served on /metrics.
+
+The API process, the ingestion workers and their CPU stage processes all
+record them. With PROMETHEUS_MULTIPROC_DIR set, every process writes its values
+to files there and a scrape adds them up. The variable has to be set, and the
+directory emptied, once before the service starts (see run_server.sh and the
+Dockerfile): prometheus_client reads it on import, and the files of processes
+still running must not be removed.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from src.client.job_queue import JobQueue
+from src.models.job import JOB_QUEUED, JOB_RUNNING
+
+# stages that only exist as metrics, the others are those of ProgressReporter
+STAGE_PDF_LOAD = "pdf_load"
+STAGE_CLEAN_SPLIT = "clean_split"
+
+LLM_CALL_SUCCESS = "success"
+LLM_CALL_THROTTLED = "throttled"
+LLM_CALL_ERROR = "error"
+
+STAGE_SECONDS = Histogram(
+    "ingestion_stage_seconds",
+    "Time spent on one batch of a pipeline stage",
+    ["stage"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+CHUNKS = Counter("ingestion_chunks", "Chunks read from the ingested documents")
+LLM_CALLS = Counter(
+    "ingestion_llm_calls", "Graph extraction calls, by outcome", ["outcome"]
+)
+LLM_RETRIES = Counter("ingestion_llm_retries", "Graph extraction calls retried")
+GRAPH_CACHE_REQUESTS = Counter(
+    "ingestion_graph_cache_requests",
+    "Lookups in the graph extraction cache, by result",
+    ["result"],
+)
+LLM_IN_FLIGHT = Gauge(
+    "ingestion_llm_calls_in_flight",
+    "Graph extraction calls waiting for the LLM",
+    multiprocess_mode="livesum",
+)
+GRAPH_DOCUMENTS_DROPPED = Counter(
+    "ingestion_graph_documents_dropped",
+    "Combined chunks that gave no graph: failed after the retries, or empty",
+    ["reason"],
+)
+NEO4J_QUERIES = Counter(
+    "ingestion_neo4j_queries", "Neo4j queries, by GraphDBDataAccess method", ["method"]
+)
+NEO4J_QUERY_SECONDS = Counter(
+    "ingestion_neo4j_query_seconds",
+    "Time spent in Neo4j queries, by GraphDBDataAccess method",
+    ["method"],
+)
+
+
+@contextmanager
+def time_stage(stage: str):
+    started = time.perf_counter()
+    yield
+    STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started)
+
+
+class JobQueueCollector:
+    """Queue depth, read from the job queue on every scrape."""
+
+    def __init__(self, job_queue: JobQueue):
+        self.job_queue = job_queue
+
+    def collect(self):
+        counts = self.job_queue.count_by_status()
+        jobs = GaugeMetricFamily(
+            "ingestion_jobs", "Jobs in the job queue, by status", labels=["status"]
+        )
+        for status in [JOB_QUEUED, JOB_RUNNING]:
+            jobs.add_metric([status], counts.get(status, 0))
+        yield jobs
+
+
+def render_metrics(job_queue: JobQueue) -> bytes:
+    registry = CollectorRegistry()
+    registry.register(JobQueueCollector(job_queue))
+    if not is_multiprocess():
+        return generate_latest(REGISTRY) + generate_latest(registry)
+
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+def process_exited(pid: int) -> None:
+    """Drops the in-flight values of a process that stopped."""
+    if is_multiprocess():
+        multiprocess.mark_process_dead(pid)
+
+
+def is_multiprocess() -> bool:
+    return "PROMETHEUS_MULTIPROC_DIR" in os.environ
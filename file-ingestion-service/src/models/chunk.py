@@ -1,7 +1,6 @@
 from dataclasses import dataclass, asdict
 from typing import Optional
 from langchain.docstore.document import Document
-from langchain_community.graphs.graph_document import GraphDocument
 
 
 @dataclass
@@ -21,16 +20,40 @@ class ChunkNode:
         return asdict(self)
 
 
+@dataclass
+class TextChunk:
+    text: str
+    start_index: int  # character offset of the chunk in its page
+    token_count: int
+
+
 @dataclass
 class ChunkRelationship:
     type: str
     previous_chunk_id: str
     current_chunk_id: str
+    file_name: Optional[str] = None
 
     def to_dict(self):
         return asdict(self)
 
 
+@dataclass
+class StoredChunk:
+    """A chunk as it is currently stored for a document, used to diff a
+    re-uploaded document against what is already in the database.
+    """
+
+    id: str
+    position: int
+    content_offset: int
+    page_number: Optional[int] = None
+    previous_id: Optional[str] = None
+    is_first: bool = False
+    embedded: bool = False
+    extracted: bool = False
+
+
 @dataclass
 class ChunkDocument:
     chunk_id: str
@@ -54,9 +77,10 @@ class ChunkEntityRelationship:
 
 
 @dataclass
-class ChunkGraphDocumentPair:
-    chunk_id: str
-    graph_document: GraphDocument
+class ChunkSimilarity:
+    source_id: str
+    target_id: str
+    score: float
 
     def to_dict(self):
         return asdict(self)
@@ -1,6 +1,8 @@
 from datetime import datetime
 from dataclasses import dataclass, field, asdict
 from datetime import datetime
+from typing import Iterable, Optional
+from langchain.docstore.document import Document
 
 
 @dataclass
@@ -18,6 +20,7 @@ class DocumentNode:
     total_pages: int = 0
     total_chunks: int = 0
     processed_chunk: int = 0
+    content_hash: str = None
 
     def to_dict(self):
         return asdict(self)
@@ -33,3 +36,18 @@ class DocumentNode:
         if self.created_at == self.updated_at:
             self.created_at = None
         return {k: v for k, v in asdict(self).items() if v not in [None, "", 0]}
+
+
+@dataclass(eq=False)
+class BatchDocument:
+    """A document to process in a batch: its chunks, usually a lazy iterator,
+    and the pages read so far, counted by whoever produces the chunks.
+    """
+
+    file_name: str
+    chunks: Iterable[Document] = ()
+    content_hash: Optional[str] = None
+    pages_read: Optional[int] = None
+    # set once the document is processed
+    result: Optional[dict] = None
+    error: Optional[Exception] = None
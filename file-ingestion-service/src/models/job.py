@@ -0,0 +1,39 @@
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+# a document job ingests the file at `file_path`, a batch job the files listed
+# in the JSON manifest at `file_path`
+JOB_KIND_DOCUMENT = "document"
+JOB_KIND_BATCH = "batch"
+
+
+@dataclass
+class Job:
+    """An ingestion job as stored in the job queue."""
+
+    id: str
+    status: str
+    file_name: str
+    file_path: str
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    attempts: int = 0
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    progress: Optional[dict] = None
+    notification_callback: Optional[str] = None
+    content_hash: Optional[str] = None
+    kind: str = JOB_KIND_DOCUMENT
+    # "<host>:<pid>" of the worker running the job, and its last sign of life
+    worker_id: Optional[str] = None
+    heartbeat_at: Optional[float] = None
+
+    def to_dict(self):
+        return asdict(self)
@@ -0,0 +1,155 @@
+from typing import Iterable, Iterator, List, Optional
+import tiktoken
+from langchain.docstore.document import Document
+from src.config import (
+    CHUNK_ENCODING,
+    CHUNK_PAGES_PER_BATCH,
+    CHUNK_TOKEN_OVERLAP,
+    CHUNK_TOKEN_SIZE,
+)
+from src.metrics import STAGE_CLEAN_SPLIT, STAGE_PDF_LOAD, time_stage
+from src.models.chunk import TextChunk
+from src.utils import available_cpus, batch, clean_text
+
+
+class TokenChunker:
+    """Splits pages into token windows the same way TokenTextSplitter does (so
+    chunk texts, and therefore chunk ids, are identical), but tokenizes and
+    decodes whole batches of pages at once and slices the windows straight
+    from the token arrays.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = CHUNK_TOKEN_SIZE,
+        chunk_overlap: int = CHUNK_TOKEN_OVERLAP,
+        encoding_name: str = CHUNK_ENCODING,
+        pages_per_batch: int = CHUNK_PAGES_PER_BATCH,
+        num_threads: Optional[int] = None,
+    ):
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.pages_per_batch = pages_per_batch
+        self.num_threads = num_threads or min(8, available_cpus())
+        self._encoding = tiktoken.get_encoding(encoding_name)
+
+    def split_texts(self, texts: List[str]) -> List[List[TextChunk]]:
+        """Returns the chunks of every text, with their character offset in it."""
+        token_lists = self._encode(texts)
+
+        step = self.chunk_size - self.chunk_overlap
+        windows = []
+        for tokens in token_lists:
+            starts = []
+            for start in range(0, len(tokens), step):
+                starts.append(start)
+                if start + self.chunk_size >= len(tokens):
+                    break
+            windows.append(starts)
+
+        windows_tokens = [
+            tokens[start : start + self.chunk_size]
+            for tokens, starts in zip(token_lists, windows)
+            for start in starts
+        ]
+        chunk_texts = iter(self._decode(windows_tokens))
+        # bytes between two window starts, to locate the windows in the text
+        # without decoding token by token
+        step_sizes = iter(
+            len(segment)
+            for segment in self._decode_bytes(
+                [
+                    tokens[start : start + step]
+                    for tokens, starts in zip(token_lists, windows)
+                    for start in starts[:-1]
+                ]
+            )
+        )
+
+        results = []
+        for text, tokens, starts in zip(texts, token_lists, windows):
+            byte_offset = 0
+            byte_offsets = []
+            for i in range(len(starts)):
+                byte_offsets.append(byte_offset)
+                if i < len(starts) - 1:
+                    byte_offset += next(step_sizes)
+
+            results.append(
+                [
+                    TextChunk(
+                        text=next(chunk_texts),
+                        start_index=_char_offset(text, byte_offset),
+                        token_count=min(self.chunk_size, len(tokens) - start),
+                    )
+                    for start, byte_offset in zip(starts, byte_offsets)
+                ]
+            )
+        return results
+
+    # tiktoken's batch methods hand every text to a thread pool, which only
+    # pays off when there are cores to spare
+    def _encode(self, texts: List[str]) -> List[List[int]]:
+        if self.num_threads > 1:
+            return self._encoding.encode_batch(
+                texts,
+                num_threads=self.num_threads,
+                allowed_special=set(),
+                disallowed_special="all",
+            )
+        return [
+            self._encoding.encode(text, allowed_special=set(), disallowed_special="all")
+            for text in texts
+        ]
+
+    def _decode(self, token_lists: List[List[int]]) -> List[str]:
+        if self.num_threads > 1:
+            return self._encoding.decode_batch(token_lists, num_threads=self.num_threads)
+        return [self._encoding.decode(tokens) for tokens in token_lists]
+
+    def _decode_bytes(self, token_lists: List[List[int]]) -> List[bytes]:
+        if self.num_threads > 1:
+            return self._encoding.decode_bytes_batch(
+                token_lists, num_threads=self.num_threads
+            )
+        return [self._encoding.decode_bytes(tokens) for tokens in token_lists]
+
+    def iter_chunks(self, pages: Iterable[Document]) -> Iterator[Document]:
+        """Cleans and splits the pages, a batch of pages at a time. Same output
+        as `iter_chunks(iter_clean_documents(pages))` from utils, plus the
+        `start_index` and `token_count` of every chunk in its metadata.
+        """
+        page_batches = batch(pages, self.pages_per_batch)
+        while True:
+            # pulling the pages is what loads them when they are parsed lazily
+            with time_stage(STAGE_PDF_LOAD):
+                page_batch = next(page_batches, None)
+            if page_batch is None:
+                break
+            start, _, page_batch = page_batch
+            with time_stage(STAGE_CLEAN_SPLIT):
+                texts = [clean_text(page.page_content) for page in page_batch]
+                page_chunks = self.split_texts(texts)
+            for i, (page, chunks) in enumerate(zip(page_batch, page_chunks)):
+                if "page" in page.metadata:
+                    metadata = {"page_number": start + i + 1}
+                else:
+                    metadata = page.metadata
+                for chunk in chunks:
+                    yield Document(
+                        page_content=chunk.text,
+                        metadata=dict(
+                            metadata,
+                            start_index=chunk.start_index,
+                            token_count=chunk.token_count,
+                        ),
+                    )
+
+
+def _char_offset(text: str, byte_offset: int) -> int:
+    """Index of the character the UTF-8 `byte_offset` of `text` falls in."""
+    if text.isascii():
+        return byte_offset
+    return len(text.encode()[:byte_offset].decode(errors="ignore"))
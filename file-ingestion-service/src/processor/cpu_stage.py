@@ -0,0 +1,122 @@
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+import fitz
+from langchain.docstore.document import Document
+from src.config import CPU_STAGE_PAGES_PER_TASK, CPU_STAGE_WORKERS, INGESTION_WORKERS
+from src.metrics import STAGE_CLEAN_SPLIT, STAGE_PDF_LOAD, time_stage
+from src.utils import available_cpus, clean_text
+from src.models.chunk import TextChunk
+from src.processor.chunker import TokenChunker
+
+
+# (page_number, total_pages, chunks of the page)
+PageChunks = Tuple[int, int, List[TextChunk]]
+
+
+class CPUStageExecutor:
+    """Runs the CPU-bound stages (PDF parsing, cleaning and token splitting) in
+    a pool of processes, a range of pages per task, and streams the chunks
+    back in page order. At most `max_pending` tasks are in flight, so a large
+    document is never parsed far ahead of the stages consuming it.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = CPU_STAGE_WORKERS,
+        pages_per_task: int = CPU_STAGE_PAGES_PER_TASK,
+        max_pending: Optional[int] = None,
+    ):
+        if not max_workers:
+            max_workers = max(1, available_cpus() // INGESTION_WORKERS)
+        self.max_workers = max_workers
+        self.pages_per_task = pages_per_task
+        self.max_pending = max_pending or max_workers * 2
+        self._executor = ProcessPoolExecutor(
+            max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def iter_chunks(self, file_path: str) -> Iterator[Tuple[int, List[Document]]]:
+        """Yields `(total_pages, chunks)` for every page of the PDF, in order."""
+        for page_number, total_pages, chunks in self.iter_page_chunks(file_path):
+            yield total_pages, [
+                Document(
+                    page_content=chunk.text,
+                    metadata={
+                        "page_number": page_number,
+                        "start_index": chunk.start_index,
+                        "token_count": chunk.token_count,
+                    },
+                )
+                for chunk in chunks
+            ]
+
+    def iter_page_chunks(self, file_path: str) -> Iterator[PageChunks]:
+        if not Path(file_path).exists():
+            raise Exception(f"File {Path(file_path).name} does not exist")
+
+        try:
+            with fitz.open(file_path) as doc:
+                total_pages = len(doc)
+        except Exception as e:
+            raise Exception("Error while reading the file content or metadata") from e
+
+        page_ranges = (
+            (start, min(start + self.pages_per_task, total_pages))
+            for start in range(0, total_pages, self.pages_per_task)
+        )
+
+        pending = deque()
+        try:
+            for start, end in page_ranges:
+                pending.append(
+                    self._executor.submit(_split_page_range, file_path, start, end)
+                )
+                if len(pending) >= self.max_pending:
+                    yield from self._result(pending.popleft())
+            while pending:
+                yield from self._result(pending.popleft())
+        finally:
+            for future in pending:
+                future.cancel()
+
+    @staticmethod
+    def _result(future) -> List[PageChunks]:
+        try:
+            return future.result()
+        except Exception as e:
+            logging.error(f"Error while parsing pages: {str(e)}")
+            raise Exception("Error while reading the file content or metadata")
+
+
+# Runs in the pool processes; the chunker (and its tokenizer) is loaded once
+# per process. The pool already uses every core, so it tokenizes on one thread.
+_chunker = None
+
+
+def _split_page_range(file_path: str, start: int, end: int) -> List[PageChunks]:
+    global _chunker
+    if _chunker is None:
+        _chunker = TokenChunker(num_threads=1)
+
+    with time_stage(STAGE_PDF_LOAD), fitz.open(file_path) as doc:
+        total_pages = len(doc)
+        texts = [doc[i].get_text() for i in range(start, end)]
+    with time_stage(STAGE_CLEAN_SPLIT):
+        chunks = _chunker.split_texts([clean_text(text) for text in texts])
+    return [
+        (start + i + 1, total_pages, page_chunks)
+        for i, page_chunks in enumerate(chunks)
+    ]
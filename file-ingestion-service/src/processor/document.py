@@ -1,27 +1,44 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
 from datetime import datetime
+from functools import partial
+from itertools import groupby
+from operator import itemgetter
 import hashlib
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Optional
 from src.config import (
-    CHUNK_BATCH_SIZE,
     FIRST_CHUNK,
+    INCREMENTAL_REINGESTION,
     NEXT_CHUNK,
-    VECTOR_EMBEDDING_DIMENSION,
+    STREAM_CHUNK_BATCH_SIZE,
+    STREAM_QUEUE_SIZE,
 )
 from src.client.graph_db import GraphDBDataAccess
 from src.models.chunk import (
     ChunkDocument,
-    ChunkGraphDocumentPair,
     ChunkNode,
     ChunkRelationship,
+    StoredChunk,
 )
-from src.models.document import DocumentNode
+from src.models.document import BatchDocument, DocumentNode
+from src.processor.chunker import TokenChunker
 from src.processor.embedding import (
     EmbeddingGenerator,
 )
+from src.processor.entity import EntityLinker
 from src.processor.graph import GraphGenerator
-from src.utils import clean_documents, split_file_into_chunks
+from src.processor.knn import KNNGraphBuilder
+from src.processor.progress import (
+    STAGE_CHUNK_WRITE,
+    STAGE_EMBEDDING,
+    STAGE_ENTITY_LINKING,
+    STAGE_GRAPH_EXTRACTION,
+    STAGE_SIMILARITY,
+    ProgressReporter,
+)
+from src.processor.scheduler import StageScheduler
+from src.utils import batch, prefetch
 from langchain.docstore.document import Document
-from langchain_community.graphs.graph_document import GraphDocument
 
 
 class DocumentProcessor:
@@ -30,111 +47,360 @@ class DocumentProcessor:
         db_dao: GraphDBDataAccess,
         graph_generator: GraphGenerator,
         embedding_generator: EmbeddingGenerator,
+        incremental: bool = INCREMENTAL_REINGESTION,
+        knn_builder: Optional[KNNGraphBuilder] = None,
     ):
         self.db_dao = db_dao
         self.graph_generator = graph_generator
         self.embedding_generator = embedding_generator
+        self.incremental = incremental
+        self.knn_builder = knn_builder
+        self.entity_linker = EntityLinker(db_dao)
+
+    def process_document(
+        self,
+        file_name: str,
+        pages: Iterable[Document],
+        progress: Optional[ProgressReporter] = None,
+        content_hash: Optional[str] = None,
+    ) -> dict:
+        """Streams the pages through load -> clean -> split -> chunk graph write
+        -> embed -> graph extraction, one batch of chunks at a time, so pages can
+        be a lazy iterator and memory stays flat regardless of the document size.
+
+        When the document was ingested before (and incremental mode is on), only
+        chunks without their embedding are embedded and only chunks without
+        their entities are graph-extracted, chunks that disappeared are removed
+        and the chunk links are only rewritten where the sequence changed.
+
+        Per-stage progress is published through `progress` (by default only to
+        the Document node) while the batches go through. `content_hash` is
+        recorded on the Document once it is completed, so identical uploads can
+        be recognised later.
+        """
+        if progress is None:
+            progress = ProgressReporter(file_name, self.db_dao)
+
+        def count_pages(pages: Iterable[Document]) -> Iterator[Document]:
+            for page in pages:
+                progress.page_read(page.metadata.get("total_pages"))
+                yield page
 
-    def process_document(self, file_name: str, pages: List[Document]) -> dict:
+        # prepare the document lazily
+        chunks = TokenChunker().iter_chunks(count_pages(pages))
+        return self.process_chunks(file_name, chunks, progress, content_hash)
+
+    def process_chunks(
+        self,
+        file_name: str,
+        chunks: Iterable[Document],
+        progress: Optional[ProgressReporter] = None,
+        content_hash: Optional[str] = None,
+    ) -> dict:
+        """Same as `process_document`, for pages that were already cleaned and
+        split (e.g. by a CPUStageExecutor). Pages read are reported by the caller.
+        """
         # check if the document is already processed or processing by other worker
         # document = self.db_dao.get_document(file_name)
         # if document[0].status in ["Processing", "Completed"]:
         #     return
 
-        # Create the document node
-        source_node = DocumentNode(
-            file_name=file_name,
-            status="Processing",
-        )
-        self.db_dao.add_document(source_node)
+        if progress is None:
+            progress = ProgressReporter(file_name, self.db_dao)
 
-        # prepare the document
-        pages = clean_documents(pages)
-        chunks = split_file_into_chunks(pages)
+        document = BatchDocument(file_name, chunks, content_hash)
+        self.process_batch([document], progress)
+        if document.error is not None:
+            raise document.error
+        return document.result
 
-        # build a graph that represents the chunked document
-        chunk_nodes, chunk_relationships, chunk_documents = (
-            _build_chunk_graph_structure(chunks, file_name)
-        )
-        self.db_dao.insert_chunk_graph(chunk_nodes, chunk_relationships)
+    def process_batch(
+        self,
+        documents: Iterable[BatchDocument],
+        progress: Optional[ProgressReporter] = None,
+        batch_size: int = STREAM_CHUNK_BATCH_SIZE,
+    ) -> List[BatchDocument]:
+        """Processes several documents in one run: their chunks are streamed
+        one after the other, in batches of `batch_size` chunks that span
+        document boundaries, so the chunk graph, the embedding requests and the
+        entity writes of many small documents are shared (an LLM call never
+        mixes two documents).
+
+        Every document gets its `result`, or its `error` when reading it
+        failed, without stopping the others. A failing stage fails the whole
+        run. `progress` covers the whole run.
+        """
+        if progress is None:
+            progress = ProgressReporter("batch")
 
-        count_nodes, count_relationships = self._process_chunks(
-            file_name,
-            chunk_documents,
+        runs: Dict[str, _DocumentRun] = {}
+
+        def read_documents() -> Iterator[tuple["_DocumentRun", Document]]:
+            for document in documents:
+                # Create the document node
+                self.db_dao.add_document(
+                    DocumentNode(file_name=document.file_name, status="Processing")
+                )
+                run = _DocumentRun(document)
+                if self.incremental:
+                    run.stored_chunks = self.db_dao.get_document_chunks(
+                        document.file_name
+                    )
+                runs[document.file_name] = run
+                try:
+                    for chunk in document.chunks:
+                        chunk.metadata["file_name"] = document.file_name
+                        yield run, chunk
+                except Exception as e:
+                    document.error = e
+
+        # the chunk graph of the next batch is built and written in the
+        # background while the current batch is embedded and graph-extracted
+        chunk_batches = prefetch(
+            self._write_chunk_graph(read_documents(), batch_size, progress),
+            STREAM_QUEUE_SIZE,
         )
 
+        def batch_completed(batch_size: int, results: dict):
+            for file_name, chunk_ids in results[STAGE_EMBEDDING].items():
+                runs[file_name].embedded_chunk_ids.extend(chunk_ids)
+            for file_name, (nodes, relationships) in results[
+                STAGE_GRAPH_EXTRACTION
+            ].items():
+                runs[file_name].distinct_nodes.update(nodes)
+                runs[file_name].relationship_count += relationships
+            progress.batch_completed(batch_size)
+
+        # embedding and graph extraction are independent, so a batch goes
+        # through both side by side and each writes its results to the
+        # database as soon as they are ready
+        stages = {
+            STAGE_EMBEDDING: lambda docs: self._embed_chunks(
+                docs[STAGE_EMBEDDING], progress
+            ),
+            STAGE_GRAPH_EXTRACTION: lambda docs: self._extract_graph(
+                docs[STAGE_GRAPH_EXTRACTION], progress
+            ),
+        }
+        try:
+            with StageScheduler(stages) as scheduler:
+                for batch_size, chunk_documents in chunk_batches:
+                    scheduler.submit(
+                        chunk_documents, partial(batch_completed, batch_size)
+                    )
+                scheduler.join()
+        except Exception:
+            for run in runs.values():
+                self.db_dao.update_document(
+                    DocumentNode(file_name=run.document.file_name, status="Failed")
+                )
+            raise
+
+        for run in runs.values():
+            self._complete_document(run, progress)
+        return [run.document for run in runs.values()]
+
+    def _complete_document(self, run: "_DocumentRun", progress: ProgressReporter):
+        document = run.document
+        try:
+            if document.error is not None:
+                raise document.error
+
+            # link the newly embedded chunks to the similar ones
+            if self.knn_builder is not None:
+                with progress.stage(STAGE_SIMILARITY, len(run.embedded_chunk_ids)):
+                    self.knn_builder.update(document.file_name, run.embedded_chunk_ids)
+        except Exception as e:
+            document.error = e
+            self.db_dao.update_document(
+                DocumentNode(file_name=document.file_name, status="Failed")
+            )
+            return
+
+        count_nodes = len(run.distinct_nodes)
+        count_relationships = run.relationship_count
+        if run.stored_chunks:
+            removed_chunk_ids = list(run.stored_chunks.keys() - run.seen_chunk_ids)
+            if removed_chunk_ids:
+                self.db_dao.delete_chunks(document.file_name, removed_chunk_ids)
+            count_nodes, count_relationships = self.db_dao.get_document_graph_counts(
+                document.file_name
+            )
+
         source_node = DocumentNode(
-            file_name=file_name,
+            file_name=document.file_name,
             updated_at=datetime.now(),
             node_count=count_nodes,
-            processed_chunk=len(chunks),
+            processed_chunk=len(run.seen_chunk_ids),
             relationship_count=count_relationships,
-            total_chunks=len(chunks),
-            total_pages=len(pages),
+            total_chunks=len(run.seen_chunk_ids),
+            total_pages=(
+                progress.pages_read
+                if document.pages_read is None
+                else document.pages_read
+            ),
             status="Completed",
+            content_hash=document.content_hash,
         )
+        progress.publish(force=True)
         self.db_dao.update_document(source_node)
 
-        return {
-            "file_name": file_name,
+        document.result = {
+            "file_name": document.file_name,
             "node_count": count_nodes,
             "relationship_count": count_relationships,
             "status": "Completed",
         }
 
-    def _process_chunks(
+    def _write_chunk_graph(
         self,
-        file_name: str,
-        chunk_documents: List[ChunkDocument],
-    ) -> tuple[int, int]:
+        chunks: Iterable[tuple["_DocumentRun", Document]],
+        batch_size: int,
+        progress: ProgressReporter,
+    ) -> Iterator[tuple[int, Dict[str, List[ChunkDocument]]]]:
+        """Writes the chunk graph batch by batch and yields the size of each
+        batch with, by stage, those of its chunks that still need to be
+        embedded or graph-extracted.
+        """
+        for _, _, chunk_batch in batch(chunks, batch_size):
+            chunk_nodes = []
+            chunk_relationships = []
+            chunk_documents = {STAGE_EMBEDDING: [], STAGE_GRAPH_EXTRACTION: []}
+            unlinks = []
+            # the batch holds consecutive runs of chunks of the same document
+            for run, items in groupby(chunk_batch, key=itemgetter(0)):
+                document_chunks = [chunk for _, chunk in items]
+                nodes, relationships, documents = _build_chunk_graph_structure(
+                    document_chunks, run.document.file_name, run.previous_chunk
+                )
+                run.previous_chunk = nodes[-1]
+                run.seen_chunk_ids.update(node.id for node in nodes)
+
+                to_embed = to_extract = documents
+                if run.stored_chunks:
+                    nodes, relationships, to_embed, to_extract = _diff_chunk_graph(
+                        run.stored_chunks, nodes, relationships, documents
+                    )
+                    if relationships:
+                        unlinks.append((run.document.file_name, relationships))
+                chunk_nodes.extend(nodes)
+                chunk_relationships.extend(relationships)
+                chunk_documents[STAGE_EMBEDDING].extend(to_embed)
+                chunk_documents[STAGE_GRAPH_EXTRACTION].extend(to_extract)
+            progress.chunks_read_in_batch(len(chunk_batch))
 
-        self.db_dao.create_vector_index(VECTOR_EMBEDDING_DIMENSION)
+            with progress.stage(STAGE_CHUNK_WRITE, len(chunk_batch)):
+                for file_name, relationships in unlinks:
+                    self.db_dao.unlink_chunks(file_name, relationships)
+                if chunk_nodes or chunk_relationships:
+                    self.db_dao.insert_chunk_graph(chunk_nodes, chunk_relationships)
+            yield len(chunk_batch), chunk_documents
+
+    def _embed_chunks(
+        self,
+        chunk_documents: List[ChunkDocument],
+        progress: ProgressReporter,
+    ) -> Dict[str, List[str]]:
+        """Returns the ids of the embedded chunks by file name."""
+        if not chunk_documents:
+            return {}
 
         # create and add embeddings to the database
-        embedding = self.embedding_generator.generate_embeddings(chunk_documents)
-        self.db_dao.insert_chunk_embeddings(file_name, embedding)
+        with progress.stage(STAGE_EMBEDDING, len(chunk_documents)):
+            embedding = self.embedding_generator.generate_embeddings(chunk_documents)
+            embeddings = defaultdict(list)
+            for document, chunk_embedding in zip(chunk_documents, embedding):
+                embeddings[_file_name(document)].append(chunk_embedding)
+            self.db_dao.insert_chunk_embeddings(embeddings)
+        return {
+            file_name: [chunk.chunk_id for chunk in embedding]
+            for file_name, embedding in embeddings.items()
+        }
+
+    def _extract_graph(
+        self,
+        chunk_documents: List[ChunkDocument],
+        progress: ProgressReporter,
+    ) -> Dict[str, tuple[set, int]]:
+        """Returns the distinct nodes and the relationship count by file name."""
+        if not chunk_documents:
+            return {}
 
-        # create and add graph documents to the database
-        graph_documents = self.graph_generator.generate_graph(chunk_documents)
-        self.db_dao.add_graph_documents(graph_documents)
+        # create the graph documents
+        try:
+            with progress.stage(STAGE_GRAPH_EXTRACTION, len(chunk_documents)):
+                graph_documents = self.graph_generator.generate_graph(chunk_documents)
+        finally:
+            progress.llm_updated(self.graph_generator.limiter.stats())
 
-        # connect the chunks to the entities in the graph documents
-        chunks_and_graph_documents = _get_chunk_and_graph_document_pairs(
-            graph_documents
-        )
-        self.db_dao.add_relationships_between_chunk_and_entities(
-            chunks_and_graph_documents
-        )
+        # add the entities to the database and connect the chunks to them, the
+        # chunks are flagged last so a failed write is extracted again
+        file_names = {
+            document.chunk_id: _file_name(document) for document in chunk_documents
+        }
+        with progress.stage(STAGE_ENTITY_LINKING, len(chunk_documents)):
+            self.entity_linker.write(graph_documents)
+            chunk_ids = defaultdict(list)
+            for chunk_id, file_name in file_names.items():
+                chunk_ids[file_name].append(chunk_id)
+            self.db_dao.mark_chunks_extracted(chunk_ids)
 
         # Done, now counting
-        distinct_nodes = {
-            (node.id, node.type)
-            for graph_document in graph_documents
-            for node in graph_document.nodes
-        }
+        counts = defaultdict(lambda: (set(), 0))
+        for graph_document in graph_documents:
+            # a graph document never spans two files
+            chunk_ids = graph_document.source.metadata["combined_chunk_ids"]
+            nodes, relationships = counts[file_names[chunk_ids[0]]]
+            nodes.update((node.id, node.type) for node in graph_document.nodes)
+            counts[file_names[chunk_ids[0]]] = (
+                nodes,
+                relationships + len(graph_document.relationships),
+            )
+        return dict(counts)
+
 
-        relations = [
-            relation.type
-            for graph_document in graph_documents
-            for relation in graph_document.relationships
-        ]
+@dataclass(eq=False)
+class _DocumentRun:
+    """What `process_batch` keeps track of for one of its documents."""
 
-        return len(distinct_nodes), len(relations)
+    document: BatchDocument
+    stored_chunks: Dict[str, StoredChunk] = field(default_factory=dict)
+    seen_chunk_ids: set = field(default_factory=set)
+    previous_chunk: Optional[ChunkNode] = None
+    embedded_chunk_ids: List[str] = field(default_factory=list)
+    distinct_nodes: set = field(default_factory=set)
+    relationship_count: int = 0
+
+
+def _file_name(document: ChunkDocument) -> str:
+    return document.chunk_doc.metadata["file_name"]
 
 
 def _build_chunk_graph_structure(
-    chunks: List[Document], file_name: str
+    chunks: List[Document],
+    file_name: str,
+    previous_chunk: Optional[ChunkNode] = None,
 ) -> tuple[List[ChunkNode], List[ChunkRelationship], List[ChunkDocument]]:
+    """Builds the chunk nodes and their FIRST_CHUNK/NEXT_CHUNK links. When the
+    chunks continue an already built sequence, pass its last node as
+    `previous_chunk` so positions, offsets and links carry on from it.
+    """
     chunk_nodes = []
     chunk_relationships = []
-    current_chunk_id = ""
-    offset = 0
+    if previous_chunk is None:
+        current_chunk_id = ""
+        start_position = 0
+        offset = 0
+    else:
+        current_chunk_id = previous_chunk.id
+        start_position = previous_chunk.position
+        offset = previous_chunk.content_offset + previous_chunk.length
 
     for i, chunk in enumerate(chunks):
         page_content_sha1 = hashlib.sha1(chunk.page_content.encode()).hexdigest()
         previous_chunk_id = current_chunk_id
         current_chunk_id = page_content_sha1
-        position = i + 1
+        position = start_position + i + 1
         offset += len(chunks[i - 1].page_content) if i > 0 else 0
 
         chunk_data = ChunkNode(
@@ -155,9 +421,10 @@ def _build_chunk_graph_structure(
         chunk_nodes.append(chunk_data)
         chunk_relationships.append(
             ChunkRelationship(
-                type=FIRST_CHUNK if i == 0 else NEXT_CHUNK,
+                type=FIRST_CHUNK if position == 1 else NEXT_CHUNK,
                 previous_chunk_id=previous_chunk_id,
                 current_chunk_id=current_chunk_id,
+                file_name=file_name,
             )
         )
 
@@ -169,17 +436,51 @@ def _build_chunk_graph_structure(
     return chunk_nodes, chunk_relationships, chunk_documents
 
 
-def _get_chunk_and_graph_document_pairs(
-    documents: List[GraphDocument],
-) -> List[ChunkGraphDocumentPair]:
-    list_doc_chunkid = []
-    for graph_document in documents:
-        for chunk_id in graph_document.source.metadata["combined_chunk_ids"]:
-            list_doc_chunkid.append(
-                ChunkGraphDocumentPair(
-                    chunk_id=chunk_id,
-                    graph_document=graph_document,
-                )
-            )
+def _diff_chunk_graph(
+    stored_chunks: Dict[str, StoredChunk],
+    chunk_nodes: List[ChunkNode],
+    chunk_relationships: List[ChunkRelationship],
+    chunk_documents: List[ChunkDocument],
+) -> tuple[
+    List[ChunkNode], List[ChunkRelationship], List[ChunkDocument], List[ChunkDocument]
+]:
+    """Drops whatever is already stored unchanged: nodes whose position did not
+    move, links that still connect the same chunks, and returns apart the
+    chunks still to embed and those still to extract the graph from, so a
+    chunk whose extraction failed is extracted again even when it has its
+    embedding.
+    """
+    changed_relationships = []
+    for rel in chunk_relationships:
+        stored = stored_chunks.get(rel.current_chunk_id)
+        if stored is None:
+            changed_relationships.append(rel)
+        elif rel.type == FIRST_CHUNK and not stored.is_first:
+            changed_relationships.append(rel)
+        elif rel.type == NEXT_CHUNK and stored.previous_id != rel.previous_chunk_id:
+            changed_relationships.append(rel)
+    relinked_ids = {rel.current_chunk_id for rel in changed_relationships}
+
+    changed_nodes = []
+    for node in chunk_nodes:
+        stored = stored_chunks.get(node.id)
+        if (
+            stored is None
+            or node.id in relinked_ids
+            or stored.position != node.position
+            or stored.content_offset != node.content_offset
+            or stored.page_number != node.page_number
+        ):
+            changed_nodes.append(node)
+
+    to_embed = []
+    to_extract = []
+    for doc in chunk_documents:
+        stored = stored_chunks.get(doc.chunk_id)
+        if stored is None or not stored.embedded:
+            to_embed.append(doc)
+        if stored is None or not stored.extracted:
+            to_extract.append(doc)
+
+    return changed_nodes, changed_relationships, to_embed, to_extract
 
-    return list_doc_chunkid
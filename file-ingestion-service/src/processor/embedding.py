@@ -1,28 +1,111 @@
-import chunk
-from src.config import MAX_EMBEDDING_WORKER, MAX_PARALLEL_EMBEDDING_SIZE
+import logging
+import time
+from src.config import (
+    EMBEDDING_MODEL,
+    EMBEDDING_RETRY_ATTEMPTS,
+    EMBEDDING_RETRY_BACKOFF,
+    EMBEDDING_TASK_TYPE,
+    MAX_EMBEDDING_WORKER,
+    MAX_PARALLEL_EMBEDDING_SIZE,
+)
 from src.models.chunk import ChunkEmbedding, ChunkDocument
 from src.utils import batch
+from src.client.cache import EmbeddingCache
 from src.client.llm import LLMModel
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List
+from typing import Dict, List, Optional
 
 
 class EmbeddingGenerator:
-    def __init__(self, model: LLMModel):
+    def __init__(
+        self,
+        model: LLMModel,
+        batch_size: int = MAX_PARALLEL_EMBEDDING_SIZE,
+        max_workers: int = MAX_EMBEDDING_WORKER,
+        cache: Optional[EmbeddingCache] = None,
+    ):
         self.model = model
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.cache = cache
+        # chunks per second of the last generate_embeddings call
+        self.throughput = 0.0
 
     def generate_embeddings(
         self, documents: List[ChunkDocument]
     ) -> List[ChunkEmbedding]:
-        embeddings = self.model.get_embedding_model().embed(
-            texts=[doc.chunk_doc.page_content for doc in documents],
-            embeddings_task_type="RETRIEVAL_QUERY",
-        )
+        """Embeds the documents in provider-sized batches on a bounded worker
+        pool, skipping chunks already in the cache. The returned embeddings are
+        in the same order as the documents.
+        """
+        if not documents:
+            return []
 
-        chunk_embeddings = []
-        for doc, emb in zip(documents, embeddings):
-            chunk_embeddings.append(
-                ChunkEmbedding(chunk_id=doc.chunk_id, embedding=emb)
+        started = time.perf_counter()
+        chunk_ids = [doc.chunk_id for doc in documents]
+        embeddings = {}
+        if self.cache is not None:
+            embeddings = self.cache.get_many(
+                EMBEDDING_MODEL, EMBEDDING_TASK_TYPE, chunk_ids
             )
 
-        return chunk_embeddings
+        missing = [doc for doc in documents if doc.chunk_id not in embeddings]
+        computed = self._embed_documents(missing)
+        if self.cache is not None:
+            self.cache.put_many(EMBEDDING_MODEL, EMBEDDING_TASK_TYPE, computed)
+        embeddings.update(computed)
+
+        elapsed = time.perf_counter() - started
+        self.throughput = len(documents) / elapsed if elapsed > 0 else 0.0
+        logging.info(
+            f"Embedded {len(documents)} chunks ({len(documents) - len(missing)} cached) "
+            f"in {elapsed:.2f}s ({self.throughput:.1f} chunks/s)"
+        )
+
+        return [
+            ChunkEmbedding(chunk_id=chunk_id, embedding=embeddings[chunk_id])
+            for chunk_id in chunk_ids
+        ]
+
+    def _embed_documents(
+        self, documents: List[ChunkDocument]
+    ) -> Dict[str, List[float]]:
+        texts = [doc.chunk_doc.page_content for doc in documents]
+        embeddings = [None] * len(texts)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self._embed_batch, texts_batch): start_index
+                for start_index, _, texts_batch in batch(texts, self.batch_size)
+            }
+
+            try:
+                for future in as_completed(futures):
+                    start_index = futures[future]
+                    result = future.result()
+                    embeddings[start_index : start_index + len(result)] = result
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        return {doc.chunk_id: emb for doc, emb in zip(documents, embeddings)}
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        for attempt in range(1, EMBEDDING_RETRY_ATTEMPTS + 1):
+            try:
+                return self.model.get_embedding_model().embed(
+                    texts=texts,
+                    batch_size=len(texts),
+                    embeddings_task_type=EMBEDDING_TASK_TYPE,
+                )
+            except Exception as e:
+                if attempt == EMBEDDING_RETRY_ATTEMPTS:
+                    raise
+                delay = EMBEDDING_RETRY_BACKOFF * 2 ** (attempt - 1)
+                logging.warning(
+                    f"Embedding batch of {len(texts)} failed "
+                    f"(attempt {attempt}/{EMBEDDING_RETRY_ATTEMPTS}), "
+                    f"retrying in {delay:.1f}s: {e}"
+                )
+                time.sleep(delay)
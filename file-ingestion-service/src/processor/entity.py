@@ -0,0 +1,110 @@
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+from langchain_community.graphs.graph_document import GraphDocument, Node
+from src.config import ENTITY_BATCH_SIZE
+from src.client.graph_db import GraphDBDataAccess
+from src.utils import batch
+
+
+class EntityLinker:
+    """Writes the extracted entities, their relationships and the HAS_ENTITY
+    links from the chunks they were extracted from.
+
+    Everything is deduplicated first (a combined graph document is shared by
+    all of its chunks, and entities repeat across documents), then grouped by
+    label (or by relationship type and end labels) so every group is written
+    with a static-label UNWIND ... MERGE, `batch_size` rows per transaction.
+    """
+
+    def __init__(self, db_dao: GraphDBDataAccess, batch_size: int = ENTITY_BATCH_SIZE):
+        self.db_dao = db_dao
+        self.batch_size = batch_size
+
+    def write(self, graph_documents: List[GraphDocument]) -> None:
+        started = time.perf_counter()
+        entities, relationships, links = group_graph_documents(graph_documents)
+
+        # entities first, the relationships and links match them
+        for label, rows in entities.items():
+            for _, _, rows_batch in batch(rows.values(), self.batch_size):
+                self.db_dao.merge_entities(label, rows_batch)
+        for (source_label, type, target_label), rows in relationships.items():
+            for _, _, rows_batch in batch(rows.values(), self.batch_size):
+                self.db_dao.merge_entity_relationships(
+                    source_label, type, target_label, rows_batch
+                )
+        for label, rows in links.items():
+            for _, _, rows_batch in batch(rows, self.batch_size):
+                self.db_dao.link_chunks_to_entities(label, rows_batch)
+
+        count = sum(
+            len(rows)
+            for groups in (entities, relationships, links)
+            for rows in groups.values()
+        )
+        elapsed = time.perf_counter() - started
+        logging.info(
+            f"Wrote {count} entity rows in {len(entities)} labels in {elapsed:.2f}s"
+            f" ({count / elapsed if elapsed else 0:.0f} rows/s)"
+        )
+
+
+def group_graph_documents(
+    graph_documents: List[GraphDocument],
+) -> Tuple[Dict[str, dict], Dict[tuple, dict], Dict[str, list]]:
+    """Returns the unique entities by label, the unique relationships by
+    (source label, type, target label) and the unique chunk-entity links by
+    label. The first properties seen for an entity or relationship win, like
+    the ON CREATE of the write.
+    """
+    entities = defaultdict(dict)
+    relationships = defaultdict(dict)
+    links = defaultdict(set)
+
+    def add_entity(node: Node) -> str:
+        label = _label(node.type)
+        if label and node.id not in entities[label]:
+            entities[label][node.id] = {"id": node.id, "properties": node.properties}
+        return label
+
+    for graph_document in graph_documents:
+        chunk_ids = graph_document.source.metadata.get("combined_chunk_ids", [])
+        for node in graph_document.nodes:
+            label = add_entity(node)
+            if not label:
+                logging.warning(f"Skipping entity {node.id} without a type")
+                continue
+            for chunk_id in chunk_ids:
+                links[label].add((chunk_id, node.id))
+
+        for rel in graph_document.relationships:
+            # the ends of a relationship are not always listed as nodes
+            source_label = add_entity(rel.source)
+            target_label = add_entity(rel.target)
+            type = _label(rel.type.replace(" ", "_").upper())
+            if not (source_label and target_label and type):
+                continue
+            key = (rel.source.id, rel.target.id)
+            group = relationships[(source_label, type, target_label)]
+            if key not in group:
+                group[key] = {
+                    "source": rel.source.id,
+                    "target": rel.target.id,
+                    "properties": rel.properties,
+                }
+
+    return (
+        entities,
+        relationships,
+        {
+            label: [{"chunk_id": chunk_id, "id": id} for chunk_id, id in sorted(pairs)]
+            for label, pairs in links.items()
+        },
+    )
+
+
+def _label(text: str) -> str:
+    # labels and types are interpolated in the queries between backticks
+    return text.replace("`", "").strip() if text else ""
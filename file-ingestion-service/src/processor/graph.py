@@ -1,13 +1,56 @@
-from concurrent.futures import ThreadPoolExecutor
 from langchain_experimental.graph_transformers import LLMGraphTransformer
 from langchain.docstore.document import Document
 from langchain_community.graphs.graph_document import GraphDocument
-from typing import List
-import concurrent
-from src.config import CHUNK_COMBINE_SIZE, MAX_WORKERS
+from typing import List, Optional
+import asyncio
+import logging
+import random
+import threading
+from src.config import (
+    CHAT_MODEL,
+    CHUNK_TOKEN_SIZE,
+    GRAPH_CALL_TIMEOUT,
+    GRAPH_TOKEN_BUDGET,
+    LLM_RETRY_ATTEMPTS,
+    LLM_RETRY_BACKOFF,
+)
+from src.client.cache import GraphDocumentCache
 from src.client.llm import LLMModel
+from src.metrics import (
+    GRAPH_DOCUMENTS_DROPPED,
+    LLM_CALL_ERROR,
+    LLM_CALL_SUCCESS,
+    LLM_CALL_THROTTLED,
+    LLM_CALLS,
+    LLM_IN_FLIGHT,
+    LLM_RETRIES,
+)
 from src.models.chunk import ChunkDocument
-from src.utils import batch
+from src.processor.limiter import AdaptiveConcurrencyLimiter, is_throttling_error
+
+NODE_PROPERTIES = ["description"]
+# how often a blocked generate_graph checks whether it was cancelled
+CANCEL_POLL_INTERVAL = 0.5
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+class ExtractionCancelledError(Exception):
+    pass
+
+
+def extraction_loop() -> asyncio.AbstractEventLoop:
+    """The event loop, running in a thread of its own, that the LLM calls of
+    the synchronous `generate_graph` are made on, one per process."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="graph-extraction", daemon=True
+            ).start()
+    return _loop
 
 
 class GraphGenerator:
@@ -16,51 +59,208 @@ class GraphGenerator:
         llm_model: LLMModel,
         allowed_nodes: List[str] = [],
         allowed_relationships: List[str] = [],
+        cache: Optional[GraphDocumentCache] = None,
+        limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+        token_budget: int = GRAPH_TOKEN_BUDGET,
+        timeout: float = GRAPH_CALL_TIMEOUT,
+        cancel_event: Optional[threading.Event] = None,
     ):
         self.llm_model = llm_model
+        self.cache = cache
+        self.token_budget = token_budget
+        self.timeout = timeout
+        self.cancel_event = cancel_event
+        self.limiter = limiter or AdaptiveConcurrencyLimiter.shared()
         self.transformer = LLMGraphTransformer(
             llm=llm_model.get_chat_model(),
-            node_properties=["description"],
+            node_properties=NODE_PROPERTIES,
             allowed_nodes=allowed_nodes,
             allowed_relationships=allowed_relationships,
         )
+        self.extraction_config = {
+            "model_name": CHAT_MODEL,
+            "allowed_nodes": list(allowed_nodes),
+            "allowed_relationships": list(allowed_relationships),
+            "node_properties": NODE_PROPERTIES,
+        }
 
     def generate_graph(
         self, chunk_documents: List[ChunkDocument]
     ) -> List[GraphDocument]:
-        """Accepts a list of ChunkDocuments and returns a list of Documents (with nodes and relationships properties inside it)"""
-        combined_chunk_document_list = self._combine_chunks(chunk_documents)
-        graph_document_list = []
-
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            futures = [
-                executor.submit(self.transformer.convert_to_graph_documents, [doc])
-                for doc in combined_chunk_document_list  # note: the old code is remaking the Documents by encoding it in utf-8
-            ]
-
-            for future in concurrent.futures.as_completed(futures):
-                try:
-                    graph_document = future.result()
-                    graph_document_list.append(graph_document[0])
-                except Exception as e:
-                    print(f"An error occurred when generating a graph document: {e}")
+        """Accepts a list of ChunkDocuments and returns a list of Documents (with nodes and relationships properties inside it)
+
+        Blocks until `agenerate_graph` is done on the extraction loop. When the
+        `cancel_event` is set meanwhile, the calls in flight are cancelled and
+        ExtractionCancelledError is raised.
+        """
+        if self._cancelled():
+            raise ExtractionCancelledError("Graph extraction cancelled")
+
+        future = asyncio.run_coroutine_threadsafe(
+            self.agenerate_graph(chunk_documents), extraction_loop()
+        )
+        # the future raises the builtin TimeoutError, which
+        # concurrent.futures.TimeoutError is an alias of since 3.11
+        while True:
+            try:
+                return future.result(timeout=CANCEL_POLL_INTERVAL)
+            except TimeoutError:
+                if self._cancelled():
+                    future.cancel()
+                    raise ExtractionCancelledError("Graph extraction cancelled")
+
+    async def agenerate_graph(
+        self, chunk_documents: List[ChunkDocument]
+    ) -> List[GraphDocument]:
+        """Same as `generate_graph`, on the caller's event loop. Every call is
+        a task waiting on the limiter, so there can be as many in flight as
+        the limiter allows, and cancelling this cancels all of them."""
+        combined_chunk_document_list = pack_chunks(chunk_documents, self.token_budget)
+        cached = await asyncio.to_thread(
+            lambda: [self._get_cached(doc) for doc in combined_chunk_document_list]
+        )
+        graph_document_list = [doc for doc in cached if doc is not None]
+        pending = [
+            doc
+            for doc, cached_doc in zip(combined_chunk_document_list, cached)
+            if cached_doc is None
+        ]
+
+        results = await asyncio.gather(
+            *(self._aconvert(doc) for doc in pending), return_exceptions=True
+        )
+        extracted = [
+            (doc, result)
+            for doc, result in zip(pending, results)
+            if not isinstance(result, BaseException)
+        ]
+        failed = [result for result in results if isinstance(result, BaseException)]
+        await asyncio.to_thread(
+            lambda: [self._put_cached(doc, result) for doc, result in extracted]
+        )
+        graph_document_list.extend(result for _, result in extracted)
+
+        logging.info(f"Graph extraction concurrency: {self.limiter.stats()}")
+        if failed:
+            # the document fails instead of silently missing part of its graph,
+            # the extracted parts are cached for the next attempt
+            raise Exception(
+                f"Graph extraction failed for {len(failed)} of {len(pending)} "
+                f"combined chunks: {failed[0]!r}"
+            ) from failed[0]
+
+        if self.cache is not None:
+            logging.info(f"Graph extraction cache: {self.cache.stats()}")
 
         return graph_document_list
 
-    @staticmethod
-    def _combine_chunks(chunkDocuments: List[ChunkDocument]) -> List[Document]:
-        combined_chunk_document_list = []
-
-        for _, _, chunk in batch(chunkDocuments, CHUNK_COMBINE_SIZE):
-            combined_page_content = "".join(
-                document.chunk_doc.page_content for document in chunk
-            )
-            combined_ids = [document.chunk_id for document in chunk]
-            combined_chunk_document_list.append(
-                Document(
-                    page_content=combined_page_content,
-                    metadata={"combined_chunk_ids": combined_ids},
+    async def _aconvert(self, doc: Document) -> GraphDocument:
+        for attempt in range(1, LLM_RETRY_ATTEMPTS + 1):
+            try:
+                async with self.limiter.slot():
+                    with LLM_IN_FLIGHT.track_inprogress():
+                        graph_document = await asyncio.wait_for(
+                            self.transformer.aprocess_response(doc), self.timeout
+                        )
+                LLM_CALLS.labels(LLM_CALL_SUCCESS).inc()
+                if not graph_document.nodes:
+                    GRAPH_DOCUMENTS_DROPPED.labels("empty").inc()
+                return graph_document
+            except Exception as e:
+                LLM_CALLS.labels(
+                    LLM_CALL_THROTTLED if is_throttling_error(e) else LLM_CALL_ERROR
+                ).inc()
+                if attempt == LLM_RETRY_ATTEMPTS:
+                    self.limiter.record_failure()
+                    GRAPH_DOCUMENTS_DROPPED.labels("failed").inc()
+                    raise
+                self.limiter.record_retry()
+                LLM_RETRIES.inc()
+                # jittered, so the calls throttled together don't retry together
+                delay = LLM_RETRY_BACKOFF * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+                logging.warning(
+                    f"Graph extraction of {len(doc.metadata['combined_chunk_ids'])} "
+                    f"chunks failed (attempt {attempt}/{LLM_RETRY_ATTEMPTS}, "
+                    f"{'throttled' if is_throttling_error(e) else 'error'}), "
+                    f"retrying in {delay:.1f}s: {e!r}"
                 )
-            )
+                await asyncio.sleep(delay)
+
+    def _cancelled(self) -> bool:
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def _cache_key(self, doc: Document) -> str:
+        return GraphDocumentCache.key(
+            doc.metadata["combined_chunk_ids"], self.extraction_config
+        )
+
+    def _get_cached(self, doc: Document) -> Optional[GraphDocument]:
+        if self.cache is None:
+            return None
+        return self.cache.get(self._cache_key(doc), doc)
+
+    def _put_cached(self, doc: Document, graph_document: GraphDocument) -> None:
+        if self.cache is not None:
+            self.cache.put(self._cache_key(doc), graph_document)
 
-        return combined_chunk_document_list
+
+def pack_chunks(
+    chunk_documents: List[ChunkDocument],
+    token_budget: int = GRAPH_TOKEN_BUDGET,
+) -> List[Document]:
+    """Concatenates consecutive chunks into documents of at most `token_budget`
+    tokens (a longer chunk gets one of its own), so short chunks don't cost a
+    call each.
+
+    The chunks are split into the fewest documents possible and, among the
+    ways to do that, the one with the most of its splits at page breaks, so
+    the LLM sees whole pages where it costs no extra call. Chunks of different
+    files (by their `file_name` metadata) never share a document. The ids of
+    the chunks of every document are in its `combined_chunk_ids`.
+    """
+    count = len(chunk_documents)
+    tokens = [
+        doc.chunk_doc.metadata.get("token_count", CHUNK_TOKEN_SIZE)
+        for doc in chunk_documents
+    ]
+    # a page is only the same page within the same file
+    pages = [
+        (
+            doc.chunk_doc.metadata.get("file_name"),
+            doc.chunk_doc.metadata.get("page_number"),
+        )
+        for doc in chunk_documents
+    ]
+    files = [file_name for file_name, _ in pages]
+
+    # best[i]: (documents, splits inside a page) to pack the first i chunks,
+    # start[i]: where the last of those documents starts
+    best = [(0, 0)] + [None] * count
+    start = [0] * (count + 1)
+    for end in range(1, count + 1):
+        inside_page = int(end < count and pages[end] == pages[end - 1])
+        total = 0
+        for first in range(end - 1, -1, -1):
+            if files[first] != files[end - 1]:
+                break
+            total += tokens[first]
+            if total > token_budget and first < end - 1:
+                break
+            cost = (best[first][0] + 1, best[first][1] + inside_page)
+            if best[end] is None or cost < best[end]:
+                best[end] = cost
+                start[end] = first
+
+    packs = []
+    end = count
+    while end > 0:
+        packs.append(chunk_documents[start[end] : end])
+        end = start[end]
+
+    return [
+        Document(
+            page_content="".join(document.chunk_doc.page_content for document in pack),
+            metadata={"combined_chunk_ids": [document.chunk_id for document in pack]},
+        )
+        for pack in reversed(packs)
+    ]
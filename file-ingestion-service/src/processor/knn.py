@@ -0,0 +1,113 @@
+import logging
+import time
+from typing import List
+import numpy as np
+from src.config import KNN_BATCH_SIZE, KNN_MIN_SCORE, KNN_MODE, KNN_TOP_K
+from src.client.graph_db import GraphDBDataAccess
+from src.models.chunk import ChunkSimilarity
+from src.utils import batch
+
+KNN_MODE_INDEX = "index"
+KNN_MODE_BULK = "bulk"
+
+
+class KNNGraphBuilder:
+    """Adds SIMILAR relationships for the chunks a document ingestion just
+    embedded, so the work grows with the new chunks instead of the corpus.
+
+    In "index" mode every new chunk queries the vector index (in batches of
+    `batch_size` chunks per query) and is linked to its `top_k` nearest chunks
+    of any document. In "bulk" mode the scores between the new chunks and all
+    chunks of the same document are computed in-process, `batch_size` rows of
+    the similarity matrix at a time, and written with batched UNWINDs.
+    """
+
+    def __init__(
+        self,
+        db_dao: GraphDBDataAccess,
+        mode: str = KNN_MODE,
+        top_k: int = KNN_TOP_K,
+        min_score: float = KNN_MIN_SCORE,
+        batch_size: int = KNN_BATCH_SIZE,
+    ):
+        if mode not in [KNN_MODE_INDEX, KNN_MODE_BULK]:
+            raise ValueError(f"Unknown KNN mode: {mode}")
+        self.db_dao = db_dao
+        self.mode = mode
+        self.top_k = top_k
+        self.min_score = min_score
+        self.batch_size = batch_size
+
+    def update(self, file_name: str, chunk_ids: List[str]) -> int:
+        """Links the given chunks of the document, returns the number of
+        SIMILAR relationships written."""
+        if not chunk_ids:
+            return 0
+
+        start = time.perf_counter()
+        if self.mode == KNN_MODE_BULK:
+            count = self._update_bulk(file_name, chunk_ids)
+        else:
+            count = self._update_index(chunk_ids)
+        logging.info(
+            f"KNN graph ({self.mode}) for {len(chunk_ids)} chunks of {file_name}: "
+            f"{count} relationships in {time.perf_counter() - start:.2f}s"
+        )
+        return count
+
+    def _update_index(self, chunk_ids: List[str]) -> int:
+        return sum(
+            self.db_dao.update_chunks_knn(ids, self.top_k, self.min_score)
+            for _, _, ids in batch(chunk_ids, self.batch_size)
+        )
+
+    def _update_bulk(self, file_name: str, chunk_ids: List[str]) -> int:
+        ids, embeddings = self.db_dao.get_document_chunk_embeddings(file_name)
+        similarities = find_similar_chunks(
+            chunk_ids, ids, embeddings, self.top_k, self.min_score, self.batch_size
+        )
+        self.db_dao.insert_similar_relationships(similarities)
+        return len(similarities)
+
+
+def find_similar_chunks(
+    query_ids: List[str],
+    ids: List[str],
+    embeddings: List[List[float]],
+    top_k: int,
+    min_score: float,
+    block_size: int = KNN_BATCH_SIZE,
+) -> List[ChunkSimilarity]:
+    """Top `top_k` neighbours among `ids` of each of `query_ids`, scored like
+    the cosine vector index ((1 + cosine) / 2) so the same `min_score` applies.
+    Pairs found from both ends are returned once.
+    """
+    top_k = min(top_k, len(ids) - 1)
+    positions = {chunk_id: i for i, chunk_id in enumerate(ids)}
+    rows = np.array([positions[i] for i in query_ids if i in positions], dtype=np.int64)
+    if top_k <= 0 or len(rows) == 0:
+        return []
+
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    matrix /= norms
+
+    pairs = {}
+    for start in range(0, len(rows), block_size):
+        block = rows[start : start + block_size]
+        scores = (1 + matrix[block] @ matrix.T) / 2
+        scores[np.arange(len(block)), block] = -np.inf
+
+        neighbours = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        neighbour_scores = np.take_along_axis(scores, neighbours, axis=1)
+        hits = neighbour_scores >= min_score
+        sources = np.broadcast_to(block[:, None], neighbours.shape)[hits]
+        for a, b, score in zip(
+            np.minimum(sources, neighbours[hits]).tolist(),
+            np.maximum(sources, neighbours[hits]).tolist(),
+            neighbour_scores[hits].tolist(),
+        ):
+            pairs[(a, b)] = score
+
+    return [ChunkSimilarity(ids[a], ids[b], score) for (a, b), score in pairs.items()]
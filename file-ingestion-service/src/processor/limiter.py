@@ -0,0 +1,162 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from src.config import (
+    LLM_CONCURRENCY_BACKOFF,
+    LLM_INITIAL_CONCURRENCY,
+    LLM_MAX_CONCURRENCY,
+    LLM_MIN_CONCURRENCY,
+)
+
+# exception class names the providers and their HTTP clients use for rate
+# limits, overload and timeouts
+THROTTLING_ERRORS = {
+    "RateLimitError",
+    "OverloadedError",
+    "APITimeoutError",
+    "ResourceExhausted",
+    "TooManyRequests",
+    "ServiceUnavailable",
+    "DeadlineExceeded",
+    "TimeoutException",
+}
+
+
+def is_throttling_error(error: BaseException) -> bool:
+    """Whether the error means the provider wants fewer calls (429, 503 or a
+    timeout), as opposed to a failure of this particular call."""
+    if isinstance(error, TimeoutError):
+        return True
+    if any(cls.__name__ in THROTTLING_ERRORS for cls in type(error).__mro__):
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return status in [429, 503]
+
+
+class AdaptiveConcurrencyLimiter:
+    """An asyncio semaphore for a rate limited provider whose size is found by
+    AIMD: every call that succeeds while the limit is in use adds 1/limit (so
+    one more call per round of successful calls), every throttling error
+    multiplies it by `backoff`. Errors of calls started before the last
+    decrease don't decrease it again, one burst of 429s halves the limit once.
+
+    Waiting callers are woken in order, from whichever event loop they wait
+    on, so one limiter (see `shared`) covers every call to the provider made
+    by the process.
+    """
+
+    _instance = None
+
+    def __init__(
+        self,
+        initial: int = LLM_INITIAL_CONCURRENCY,
+        minimum: int = LLM_MIN_CONCURRENCY,
+        maximum: int = LLM_MAX_CONCURRENCY,
+        backoff: float = LLM_CONCURRENCY_BACKOFF,
+    ):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.in_flight = 0
+        self.successes = 0
+        self.throttled = 0
+        self.retries = 0
+        self.failures = 0
+        self._last_decrease = 0.0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> "AdaptiveConcurrencyLimiter":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @asynccontextmanager
+    async def slot(self):
+        """Waits for a free slot and holds it for one call."""
+        await self._acquire()
+        started = time.monotonic()
+
+        try:
+            yield
+        except BaseException as e:
+            with self._lock:
+                self.in_flight -= 1
+                if is_throttling_error(e):
+                    self._decrease(started)
+                self._wake()
+            raise
+
+        with self._lock:
+            # the limit only grows while it is what holds the calls back
+            if self.in_flight >= int(self.limit):
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.in_flight -= 1
+            self.successes += 1
+            self._wake()
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "concurrency": int(self.limit),
+                "in_flight": self.in_flight,
+                "waiting": len(self._waiters),
+                "successes": self.successes,
+                "throttled": self.throttled,
+                "retries": self.retries,
+                "failures": self.failures,
+            }
+
+    async def _acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if not self._waiters and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return
+            waiter = [loop, loop.create_future(), False]
+            self._waiters.append(waiter)
+
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter[2]:
+                    # cancelled after the slot was handed over, give it back
+                    self.in_flight -= 1
+                    self._wake()
+                else:
+                    self._waiters.remove(waiter)
+            raise
+
+    def _wake(self) -> None:
+        # called with the lock held, hands the free slots to the oldest waiters
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            waiter[2] = True
+            self.in_flight += 1
+            loop, future = waiter[0], waiter[1]
+            loop.call_soon_threadsafe(_set_result, future)
+
+    def _decrease(self, started: float) -> None:
+        self.throttled += 1
+        if started < self._last_decrease:
+            return
+        self.limit = max(self.minimum, self.limit * self.backoff)
+        self._last_decrease = time.monotonic()
+
+
+def _set_result(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,150 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+from src.config import PROGRESS_UPDATE_INTERVAL
+from src.client.graph_db import GraphDBDataAccess
+from src.client.job_queue import JobQueue
+from src.metrics import CHUNKS, STAGE_SECONDS
+from src.models.document import DocumentNode
+
+STAGE_CHUNK_WRITE = "chunk_write"
+STAGE_EMBEDDING = "embedding"
+STAGE_GRAPH_EXTRACTION = "graph_extraction"
+STAGE_ENTITY_LINKING = "entity_linking"
+STAGE_SIMILARITY = "similarity"
+STAGES = [
+    STAGE_CHUNK_WRITE,
+    STAGE_EMBEDDING,
+    STAGE_GRAPH_EXTRACTION,
+    STAGE_ENTITY_LINKING,
+    STAGE_SIMILARITY,
+]
+
+
+class ProgressReporter:
+    """Collects per-stage counts and timings while a document is processed and
+    publishes them to the Document node and, when the document is processed
+    for a job, to the job queue. Publishing is throttled to once every
+    `min_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        file_name: str,
+        db_dao: Optional[GraphDBDataAccess] = None,
+        job_queue: Optional[JobQueue] = None,
+        job_id: Optional[str] = None,
+        min_interval: float = PROGRESS_UPDATE_INTERVAL,
+    ):
+        self.file_name = file_name
+        self.db_dao = db_dao
+        self.job_queue = job_queue
+        self.job_id = job_id
+        self.min_interval = min_interval
+
+        self.stages = {
+            stage: {"count": 0, "batches": 0, "seconds": 0.0} for stage in STAGES
+        }
+        self.total_pages = 0
+        self.pages_read = 0
+        self.chunks_read = 0
+        self.chunks_completed = 0
+        # concurrency and retry counts of the LLM calls
+        self.llm = None
+        self.started_at = time.time()
+        self._last_publish = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, count: int):
+        """Times one batch of a stage and records it once the batch succeeds."""
+        started = time.perf_counter()
+        yield
+        self.advance(name, count, time.perf_counter() - started)
+
+    def advance(self, name: str, count: int, seconds: float) -> None:
+        STAGE_SECONDS.labels(name).observe(seconds)
+        with self._lock:
+            stage = self.stages[name]
+            stage["count"] += count
+            stage["batches"] += 1
+            stage["seconds"] += seconds
+        self.publish()
+
+    def page_read(self, total_pages: Optional[int] = None) -> None:
+        with self._lock:
+            self.pages_read += 1
+            if total_pages:
+                self.total_pages = total_pages
+
+    def document_opened(self, total_pages: int) -> None:
+        """For a run over several documents, adds the pages of the next one."""
+        with self._lock:
+            self.total_pages += total_pages
+
+    def chunks_read_in_batch(self, count: int) -> None:
+        CHUNKS.inc(count)
+        with self._lock:
+            self.chunks_read += count
+
+    def llm_updated(self, stats: dict) -> None:
+        with self._lock:
+            self.llm = stats
+
+    def batch_completed(self, count: int) -> None:
+        with self._lock:
+            self.chunks_completed += count
+        self.publish()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            elapsed = time.time() - self.started_at
+            return {
+                "stages": {
+                    name: {
+                        **stage,
+                        "per_second": (
+                            stage["count"] / stage["seconds"] if stage["seconds"] else 0.0
+                        ),
+                    }
+                    for name, stage in self.stages.items()
+                },
+                "total_pages": self.total_pages,
+                "pages_read": self.pages_read,
+                "chunks_read": self.chunks_read,
+                "chunks_completed": self.chunks_completed,
+                "llm": self.llm,
+                "elapsed_seconds": elapsed,
+                "eta_seconds": self._eta(elapsed),
+                "updated_at": time.time(),
+            }
+
+    def _eta(self, elapsed: float) -> Optional[float]:
+        if not self.total_pages or not self.chunks_read or not self.chunks_completed:
+            return None
+        # share of the pages read so far, scaled by how much of it is done
+        fraction = (self.pages_read / self.total_pages) * (
+            self.chunks_completed / self.chunks_read
+        )
+        return elapsed * (1 - fraction) / fraction if fraction else None
+
+    def publish(self, force: bool = False) -> None:
+        with self._lock:
+            now = time.time()
+            if not force and now - self._last_publish < self.min_interval:
+                return
+            self._last_publish = now
+
+        if self.db_dao is not None:
+            self.db_dao.update_document(
+                DocumentNode(
+                    file_name=self.file_name,
+                    status="Processing",
+                    processed_chunk=self.chunks_completed,
+                    total_chunks=self.chunks_read,
+                    total_pages=self.total_pages,
+                )
+            )
+        if self.job_queue is not None and self.job_id is not None:
+            self.job_queue.update_progress(self.job_id, self.snapshot())
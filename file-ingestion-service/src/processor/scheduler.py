@@ -0,0 +1,107 @@
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from src.config import STREAM_QUEUE_SIZE
+
+
+class StageError(Exception):
+    def __init__(self, stage: str, error: BaseException):
+        super().__init__(f"Stage {stage} failed: {error}")
+        self.stage = stage
+        self.error = error
+
+
+class StageScheduler:
+    """Runs independent stages side by side over a stream of items.
+
+    Every stage gets its own thread and handles the items in the order they
+    were submitted, so a fast stage moves on to the next item while a slow one
+    is still busy, up to `max_pending` items ahead. `on_complete` is called in
+    the submitting thread, in submission order, with the results of every
+    stage once an item went through all of them.
+
+    The first failing stage cancels whatever has not started yet and is
+    raised as a StageError from `submit` or `join`.
+    """
+
+    def __init__(
+        self,
+        stages: Dict[str, Callable[[Any], Any]],
+        max_pending: int = STREAM_QUEUE_SIZE,
+    ):
+        self.stages = stages
+        self.max_pending = max_pending
+        self._executors = {
+            name: ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+            for name in stages
+        }
+        self._pending = deque()
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        self.shutdown(cancel=exc_type is not None)
+
+    def submit(
+        self,
+        item: Any,
+        on_complete: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> None:
+        self._raise_failure()
+        futures = {}
+        for name, stage in self.stages.items():
+            future = self._executors[name].submit(stage, item)
+            future.add_done_callback(self._notify)
+            futures[name] = future
+        self._pending.append((futures, on_complete))
+
+        while len(self._pending) > self.max_pending:
+            self._complete_oldest()
+
+    def join(self) -> None:
+        """Waits until every submitted item went through all the stages."""
+        while self._pending:
+            self._complete_oldest()
+
+    def shutdown(self, cancel: bool = False) -> None:
+        for executor in self._executors.values():
+            executor.shutdown(wait=True, cancel_futures=cancel)
+
+    def _notify(self, future: Future) -> None:
+        with self._condition:
+            self._condition.notify_all()
+
+    def _complete_oldest(self) -> None:
+        futures, on_complete = self._pending[0]
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._failure() is not None
+                or all(future.done() for future in futures.values())
+            )
+        self._raise_failure()
+
+        self._pending.popleft()
+        if on_complete is not None:
+            on_complete({name: future.result() for name, future in futures.items()})
+
+    def _failure(self) -> Optional[tuple]:
+        for futures, _ in self._pending:
+            for name, future in futures.items():
+                if future.done() and not future.cancelled() and future.exception():
+                    return name, future.exception()
+        return None
+
+    def _raise_failure(self) -> None:
+        failure = self._failure()
+        if failure is None:
+            return
+
+        name, error = failure
+        for futures, _ in self._pending:
+            for future in futures.values():
+                future.cancel()
+        self._pending.clear()
+        raise StageError(name, error) from error
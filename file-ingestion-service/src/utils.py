@@ -1,39 +1,66 @@
-from typing import List
+import os
+import queue
+import shutil
+import threading
+from typing import Iterable, Iterator, List
 from pathlib import Path
 from itertools import islice
 from langchain_text_splitters import TokenTextSplitter
 from langchain_community.document_loaders import PyMuPDFLoader
 from langchain.docstore.document import Document
+from src.config import CHUNK_ENCODING, CHUNK_TOKEN_OVERLAP, CHUNK_TOKEN_SIZE
 
 
 def split_file_into_chunks(pages: List[Document]) -> List[Document]:
-    text_splitter = TokenTextSplitter(chunk_size=200, chunk_overlap=20)
-    chunks = []
-    if "page" in pages[0].metadata:
-        for i, document in enumerate(pages):
-            page_number = i + 1
-            for chunk in text_splitter.split_documents([document]):
-                chunks.append(
-                    Document(
-                        page_content=chunk.page_content,
-                        metadata={"page_number": page_number},
-                    )
-                )
-    else:
-        chunks = text_splitter.split_documents(pages)
-    return chunks
+    return list(iter_chunks(pages))
 
 
-def clean_documents(pages: List[Document]) -> List[Document]:
-    translation_table = str.maketrans({'"': "", "'": "", "\n": " "})
+def get_text_splitter() -> TokenTextSplitter:
+    return TokenTextSplitter(
+        encoding_name=CHUNK_ENCODING,
+        chunk_size=CHUNK_TOKEN_SIZE,
+        chunk_overlap=CHUNK_TOKEN_OVERLAP,
+    )
+
+
+def iter_chunks(pages: Iterable[Document]) -> Iterator[Document]:
+    text_splitter = get_text_splitter()
+    for i, document in enumerate(pages):
+        if "page" not in document.metadata:
+            yield from text_splitter.split_documents([document])
+            continue
+
+        page_number = i + 1
+        for chunk in text_splitter.split_documents([document]):
+            yield Document(
+                page_content=chunk.page_content,
+                metadata={"page_number": page_number},
+            )
 
+
+def clean_documents(pages: List[Document]) -> List[Document]:
     for i in range(len(pages)):
-        text = pages[i].page_content.translate(translation_table)
-        pages[i] = Document(page_content=text, metadata=pages[i].metadata)
+        pages[i] = clean_document(pages[i])
 
     return pages
 
 
+def iter_clean_documents(pages: Iterable[Document]) -> Iterator[Document]:
+    for page in pages:
+        yield clean_document(page)
+
+
+_CLEAN_TRANSLATION_TABLE = str.maketrans({'"': "", "'": "", "\n": " "})
+
+
+def clean_document(page: Document) -> Document:
+    return Document(page_content=clean_text(page.page_content), metadata=page.metadata)
+
+
+def clean_text(text: str) -> str:
+    return text.translate(_CLEAN_TRANSLATION_TABLE)
+
+
 def batch(iterable, batch_size: int):
     it = iter(iterable)
     start_index = 0
@@ -46,12 +73,69 @@ def batch(iterable, batch_size: int):
         start_index += batch_size
 
 
+def prefetch(iterable: Iterable, maxsize: int) -> Iterator:
+    """Consume `iterable` in a background thread, keeping at most `maxsize`
+    items buffered ahead of the caller. Exceptions raised by the producer are
+    re-raised in the consuming thread.
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    end = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((end, None))
+        except BaseException as e:
+            put((end, e))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if error is not None:
+                raise error
+            if item is end:
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def available_cpus() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
 def delete_file(file_path: str):
     file_path = Path(file_path)
     if file_path.exists():
         file_path.unlink()
 
 
+def delete_directory(dir_path: str):
+    shutil.rmtree(dir_path, ignore_errors=True)
+
+
 def load_pdf(file_path: str) -> List[Document]:
     loader = PyMuPDFLoader(file_path)
     return loader.load()
+
+
+def iter_pdf_pages(file_path: str) -> Iterator[Document]:
+    loader = PyMuPDFLoader(file_path)
+    return loader.lazy_load()
@@ -0,0 +1,221 @@
+import fcntl
+import logging
+import multiprocessing
+import threading
+import time
+import httpx
+from pathlib import Path
+from typing import Optional
+from dotenv import load_dotenv
+from langchain_community.graphs import Neo4jGraph
+from src import controller
+from src.config import (
+    INGESTION_WORKERS,
+    JOB_HEARTBEAT_INTERVAL,
+    JOB_POLL_INTERVAL,
+    JOB_QUEUE_PATH,
+    JOB_SHUTDOWN_TIMEOUT,
+    NOTIFICATION_TIMEOUT,
+)
+from src.client.graph_db import GraphDBDataAccess
+from src.client.job_queue import JobQueue, read_batch_manifest
+from src.client.llm import LLMModel
+from src.metrics import process_exited
+from src.models.job import JOB_KIND_BATCH, Job
+from src.processor.cpu_stage import CPUStageExecutor
+from src.processor.progress import ProgressReporter
+from src.utils import delete_directory, delete_file
+
+
+class WorkerPool:
+    """A fixed number of worker processes pulling ingestion jobs from the
+    job queue, so extraction never runs inside the API process.
+
+    There is one pool per queue database: with several API processes (uvicorn
+    workers) sharing it, the first to start holds a lock on the queue and
+    starts the pool, the others serve the API only. The workers find each
+    other's stale jobs by their heartbeats either way.
+    """
+
+    def __init__(self, size: int = INGESTION_WORKERS, queue_path: str = JOB_QUEUE_PATH):
+        self.size = size
+        self.queue_path = queue_path
+        # spawn instead of fork: the API process runs threads and an event loop
+        self._context = multiprocessing.get_context("spawn")
+        self._stop_event = self._context.Event()
+        self._processes = []
+        self._lock_file = None
+
+    def start(self) -> None:
+        Path(self.queue_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock_file = open(f"{self.queue_path}.workers.lock", "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logging.info("Another process runs the ingestion workers of this queue")
+            self._lock_file.close()
+            self._lock_file = None
+            return
+
+        for i in range(self.size):
+            # not daemonic, the workers start process pools of their own
+            process = self._context.Process(
+                target=run_worker,
+                args=(self._stop_event, self.queue_path),
+                name=f"ingestion-worker-{i}",
+            )
+            process.start()
+            self._processes.append(process)
+
+    def stop(self, timeout: float = JOB_SHUTDOWN_TIMEOUT) -> None:
+        self._stop_event.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                # its job is requeued once its heartbeat is late
+                process.terminate()
+                process.join()
+            process_exited(process.pid)
+        self._processes = []
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+def run_worker(
+    stop_event,
+    queue_path: str = JOB_QUEUE_PATH,
+    poll_interval: float = JOB_POLL_INTERVAL,
+) -> None:
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    db = GraphDBDataAccess(Neo4jGraph())
+    llm_model = LLMModel()
+    queue = JobQueue(queue_path)
+
+    with CPUStageExecutor() as cpu_executor:
+        while not stop_event.is_set():
+            for job in queue.requeue_stale():
+                logging.error(f"Job {job.id} failed: {job.error}")
+                delete_job_files(job)
+                if job.notification_callback:
+                    notify(job.notification_callback, job)
+
+            job = queue.claim()
+            if job is None:
+                stop_event.wait(poll_interval)
+                continue
+            run_job(queue, db, llm_model, job, cpu_executor)
+
+
+def run_job(
+    queue: JobQueue,
+    db: GraphDBDataAccess,
+    llm_model: LLMModel,
+    job: Job,
+    cpu_executor: Optional[CPUStageExecutor] = None,
+):
+    logging.info(f"Starting job {job.id} for {job.file_name}")
+    cancel_event = threading.Event()
+    finished = threading.Event()
+    threading.Thread(
+        target=watch_job,
+        args=(queue, job, cancel_event, finished),
+        name=f"watch-{job.id}",
+        daemon=True,
+    ).start()
+    try:
+        if job.kind == JOB_KIND_BATCH:
+            # the Document nodes get their own status, the progress of the
+            # whole batch only goes to the job
+            progress = ProgressReporter(job.file_name, job_queue=queue, job_id=job.id)
+            files = read_batch_manifest(job.file_path)
+            result = {
+                "files": controller.extract_pdf_batch(
+                    db,
+                    llm_model,
+                    [
+                        (file["file_path"], file["file_name"], file["content_hash"])
+                        for file in files
+                    ],
+                    progress,
+                    cpu_executor,
+                    cancel_event,
+                )
+            }
+        else:
+            progress = ProgressReporter(
+                job.file_name, db, job_queue=queue, job_id=job.id
+            )
+            result = controller.extract_pdf_document(
+                db,
+                llm_model,
+                job.file_path,
+                job.file_name,
+                progress,
+                job.content_hash,
+                cpu_executor,
+                cancel_event,
+            )
+        queue.complete(job, result)
+        logging.info(f"Job {job.id} done")
+    except Exception as e:
+        if cancel_event.is_set():
+            logging.info(f"Job {job.id} cancelled")
+        else:
+            logging.exception(f"Job {job.id} failed")
+            queue.fail(job, str(e))
+    finally:
+        finished.set()
+
+    current = queue.get(job.id)
+    if current.worker_id != job.worker_id:
+        # requeued while it ran, its files are the next worker's now
+        return
+    delete_job_files(job)
+    if job.notification_callback:
+        notify(job.notification_callback, current)
+
+
+def delete_job_files(job: Job) -> None:
+    if job.kind == JOB_KIND_BATCH:
+        # the directory holding the manifest and the files of the batch
+        delete_directory(str(Path(job.file_path).parent))
+    else:
+        delete_file(job.file_path)
+
+
+def watch_job(
+    queue: JobQueue,
+    job: Job,
+    cancel_event: threading.Event,
+    finished: threading.Event,
+    poll_interval: float = JOB_POLL_INTERVAL,
+    heartbeat_interval: float = JOB_HEARTBEAT_INTERVAL,
+) -> None:
+    """Sends the heartbeats of the running job, and sets `cancel_event` once
+    it is cancelled through the API or was requeued after a late heartbeat
+    (another worker may be running it by now)."""
+    last_heartbeat = time.monotonic()
+    while not finished.wait(poll_interval):
+        if queue.is_cancelled(job.id):
+            cancel_event.set()
+            return
+        if time.monotonic() - last_heartbeat >= heartbeat_interval:
+            last_heartbeat = time.monotonic()
+            if not queue.heartbeat(job):
+                logging.warning(f"Job {job.id} is not running on this worker anymore")
+                cancel_event.set()
+                return
+
+
+def notify(callback_url: str, job: Job) -> None:
+    """Posts the finished job to the callback given when it was submitted."""
+    try:
+        response = httpx.post(
+            callback_url, json=job.to_dict(), timeout=NOTIFICATION_TIMEOUT
+        )
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        logging.error(f"Failed to notify {callback_url} about job {job.id}: {e}")
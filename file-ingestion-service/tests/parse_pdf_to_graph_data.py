@@ -1,20 +1,23 @@
+"""Ingests the sample book into the configured Neo4j with the live models.
+
+    python -m tests.parse_pdf_to_graph_data
+
+For an offline run with stand-ins for both, see `benchmarks.ingestion`.
+"""
+
 from dotenv import load_dotenv
-from src.models import SourceNode
-from graph_db import GraphDBDataAccess
-from controller import extract_graph
 from langchain_community.graphs import Neo4jGraph
+from src.client.graph_db import GraphDBDataAccess
+from src.client.llm import LLMModel
+from src.controller import extract_pdf_document
 
 load_dotenv()
 
-obj_source_node = SourceNode()
-obj_source_node.file_name = "The King in Yellow.pdf"
-
-graph = Neo4jGraph()
-
-data_access = GraphDBDataAccess(graph)
-data_access.add_document(obj_source_node)
+data_access = GraphDBDataAccess(Neo4jGraph())
 
-file_path = "data/The King in Yellow.pdf"
-local_file_result = extract_graph(graph, file_path, "The King in Yellow.pdf")
+file_path = "tests/data/The King in Yellow.pdf"
+local_file_result = extract_pdf_document(
+    data_access, LLMModel(), file_path, "The King in Yellow.pdf"
+)
 
 print(local_file_result)
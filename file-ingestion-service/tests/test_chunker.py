@@ -0,0 +1,93 @@
+import fitz
+import pytest
+from langchain.docstore.document import Document
+from langchain_text_splitters import TokenTextSplitter
+from src.config import CHUNK_ENCODING
+from src.processor.chunker import TokenChunker
+from src.utils import clean_text, iter_chunks, iter_clean_documents
+
+SAMPLE_PDF = "tests/data/The King in Yellow.pdf"
+
+TEXTS = [
+    "",
+    "short",
+    "   leading and trailing spaces   ",
+    'Quotes "like" these and \'those\' are cleaned,\nand so are newlines.\n',
+    "The King in Yellow. " * 120,
+    "Ünïcödé çhäräctërs, ëmöjï 🎭🏰 and 中文字符 split across token windows. " * 15,
+    "word " * 999,
+]
+
+
+def load_pages(file_path: str):
+    with fitz.open(file_path) as doc:
+        return [
+            Document(
+                page_content=page.get_text(),
+                metadata={"page": i, "total_pages": len(doc)},
+            )
+            for i, page in enumerate(doc)
+        ]
+
+
+def chunk_tuples(chunks):
+    return [(chunk.page_content, chunk.metadata["page_number"]) for chunk in chunks]
+
+
+@pytest.mark.parametrize("num_threads", [1, 4])
+def test_same_chunks_as_token_text_splitter_on_the_sample_book(num_threads):
+    pages = load_pages(SAMPLE_PDF)
+    # a small batch size so pages cross several batches
+    chunker = TokenChunker(pages_per_batch=7, num_threads=num_threads)
+
+    expected = chunk_tuples(iter_chunks(iter_clean_documents(pages)))
+    actual = chunk_tuples(chunker.iter_chunks(pages))
+
+    assert actual == expected
+
+
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(200, 20), (16, 5), (7, 0)])
+def test_same_texts_as_token_text_splitter(chunk_size, chunk_overlap):
+    splitter = TokenTextSplitter(
+        encoding_name=CHUNK_ENCODING,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+    )
+    chunker = TokenChunker(chunk_size, chunk_overlap, num_threads=1)
+    texts = [clean_text(text) for text in TEXTS]
+
+    actual = [[chunk.text for chunk in chunks] for chunks in chunker.split_texts(texts)]
+
+    assert actual == [splitter.split_text(text) for text in texts]
+
+
+def test_start_index_locates_the_chunk_in_its_page():
+    texts = [clean_text(text) for text in TEXTS]
+    chunker = TokenChunker(16, 5, num_threads=1)
+
+    for text, chunks in zip(texts, chunker.split_texts(texts)):
+        for chunk in chunks:
+            # a window can start or end in the middle of a multi-byte character
+            if "�" not in chunk.text:
+                assert text[chunk.start_index :].startswith(chunk.text)
+            assert 0 < chunk.token_count <= 16
+
+
+def test_pages_without_a_page_number_keep_their_metadata():
+    pages = [Document(page_content="The King in Yellow. " * 30, metadata={"a": 1})]
+
+    chunks = list(TokenChunker(16, 5, num_threads=1).iter_chunks(pages))
+
+    assert chunks
+    assert all(chunk.metadata["a"] == 1 for chunk in chunks)
+    assert [chunk.page_content for chunk in chunks] == [
+        chunk.page_content
+        for chunk in TokenTextSplitter(
+            encoding_name=CHUNK_ENCODING, chunk_size=16, chunk_overlap=5
+        ).split_documents(pages)
+    ]
+
+
+def test_overlap_must_be_smaller_than_the_chunk_size():
+    with pytest.raises(ValueError):
+        TokenChunker(chunk_size=10, chunk_overlap=10)
@@ -0,0 +1,136 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+import pytest
+from src.client.job_queue import JobQueue
+from src.models.job import (
+    JOB_CANCELLED,
+    JOB_DONE,
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"))
+
+
+def _claim_all(path: str, worker_id: str) -> list:
+    queue = JobQueue(path)
+    claimed = []
+    while (job := queue.claim(worker_id)) is not None:
+        claimed.append(job.id)
+    return claimed
+
+
+def test_claim_takes_the_oldest_queued_job(queue):
+    first = queue.enqueue("a.pdf", "a.pdf")
+    queue.enqueue("b.pdf", "b.pdf")
+
+    job = queue.claim("worker-1")
+
+    assert job.id == first.id
+    assert job.status == JOB_RUNNING
+    assert job.attempts == 1
+    assert job.worker_id == "worker-1"
+    assert queue.get(first.id).worker_id == "worker-1"
+
+
+def test_claim_returns_none_when_nothing_is_queued(queue):
+    assert queue.claim() is None
+
+
+def test_concurrent_workers_never_claim_the_same_job(queue):
+    jobs = {queue.enqueue(f"{i}.pdf", f"{i}.pdf").id for i in range(60)}
+
+    with ProcessPoolExecutor(max_workers=4, mp_context=get_context("spawn")) as pool:
+        results = list(
+            pool.map(_claim_all, [queue.path] * 4, [f"worker-{i}" for i in range(4)])
+        )
+
+    claimed = [job_id for result in results for job_id in result]
+    assert len(claimed) == len(set(claimed))
+    assert set(claimed) == jobs
+    assert queue.count_by_status() == {JOB_RUNNING: len(jobs)}
+
+
+def test_a_worker_only_finishes_its_own_job(queue):
+    queue.enqueue("a.pdf", "a.pdf")
+    job = queue.claim("worker-1")
+    queue.requeue_stale(timeout=0)
+    again = queue.claim("worker-2")
+
+    queue.complete(job, {"stale": True})
+    assert queue.get(job.id).status == JOB_RUNNING
+    assert not queue.heartbeat(job)
+
+    queue.complete(again, {"stale": False})
+    assert queue.get(job.id).status == JOB_DONE
+    assert queue.get(job.id).result == {"stale": False}
+
+
+def test_a_cancelled_job_stays_cancelled(queue):
+    queue.enqueue("a.pdf", "a.pdf")
+    job = queue.claim("worker-1")
+
+    queue.cancel(job.id)
+    queue.fail(job, "stopped")
+
+    assert queue.is_cancelled(job.id)
+    assert queue.get(job.id).status == JOB_CANCELLED
+    assert not queue.heartbeat(job)
+
+
+def test_requeue_stale_leaves_jobs_with_a_recent_heartbeat(queue):
+    queue.enqueue("a.pdf", "a.pdf")
+    job = queue.claim("worker-1")
+
+    assert queue.requeue_stale(timeout=60) == []
+    assert queue.get(job.id).status == JOB_RUNNING
+
+
+def test_requeue_stale_gives_up_after_max_attempts(queue):
+    queued = queue.enqueue("a.pdf", "a.pdf")
+
+    for attempt in range(1, 3):
+        job = queue.claim(f"worker-{attempt}")
+        assert job.attempts == attempt
+        time.sleep(0.01)
+        assert queue.requeue_stale(timeout=0, max_attempts=3) == []
+        assert queue.get(queued.id).status == JOB_QUEUED
+
+    queue.claim("worker-3")
+    failed = queue.requeue_stale(timeout=0, max_attempts=3)
+
+    assert [job.id for job in failed] == [queued.id]
+    assert queue.get(queued.id).status == JOB_FAILED
+    assert "3 attempts" in queue.get(queued.id).error
+
+
+def test_enqueue_unless_active_queues_a_content_once(queue):
+    job, queued = queue.enqueue_unless_active("a.pdf", "a.pdf", "hash-a")
+    again, queued_again = queue.enqueue_unless_active("a2.pdf", "a.pdf", "hash-a")
+
+    assert queued and not queued_again
+    assert again.id == job.id
+
+    queue.complete(queue.claim(), {})
+    _, queued_after = queue.enqueue_unless_active("a3.pdf", "a.pdf", "hash-a")
+    assert queued_after
+
+
+def test_enqueue_batch_skips_contents_already_active(queue, tmp_path):
+    document, _ = queue.enqueue_unless_active("a.pdf", "a.pdf", "hash-a")
+    files = [
+        {"file_path": "a.pdf", "file_name": "a.pdf", "content_hash": "hash-a"},
+        {"file_path": "b.pdf", "file_name": "b.pdf", "content_hash": "hash-b"},
+    ]
+
+    batch, active = queue.enqueue_batch(files, storage=str(tmp_path))
+
+    assert batch.file_name == "batch of 1 files"
+    assert active == {"hash-a": document}
+    assert queue.find_active("hash-b").id == batch.id
+    assert queue.enqueue_batch(files, storage=str(tmp_path))[0] is None
@@ -0,0 +1,83 @@
+from typing import List, Optional
+from langchain.docstore.document import Document
+from src.models.chunk import ChunkDocument
+from src.processor.graph import pack_chunks
+
+
+def make_chunks(
+    tokens: List[int],
+    pages: Optional[List[int]] = None,
+    files: Optional[List[str]] = None,
+) -> List[ChunkDocument]:
+    return [
+        ChunkDocument(
+            chunk_id=f"c{i}",
+            chunk_doc=Document(
+                page_content=f"<{i}>",
+                metadata={
+                    "token_count": count,
+                    "page_number": pages[i] if pages else 1,
+                    "file_name": files[i] if files else "a.pdf",
+                },
+            ),
+        )
+        for i, count in enumerate(tokens)
+    ]
+
+
+def packed_ids(documents: List[Document]) -> List[List[str]]:
+    return [document.metadata["combined_chunk_ids"] for document in documents]
+
+
+def test_chunks_within_the_budget_share_one_document_in_order():
+    documents = pack_chunks(make_chunks([100, 200, 300]), token_budget=600)
+
+    assert packed_ids(documents) == [["c0", "c1", "c2"]]
+    assert documents[0].page_content == "<0><1><2>"
+
+
+def test_no_document_goes_over_the_budget():
+    tokens = [120, 80, 200, 50, 150, 90, 60, 110, 40, 170]
+    chunks = make_chunks(tokens)
+
+    documents = pack_chunks(chunks, token_budget=300)
+
+    by_id = {chunk.chunk_id: count for chunk, count in zip(chunks, tokens)}
+    for ids in packed_ids(documents):
+        assert sum(by_id[chunk_id] for chunk_id in ids) <= 300
+    assert [i for ids in packed_ids(documents) for i in ids] == [
+        chunk.chunk_id for chunk in chunks
+    ]
+
+
+def test_uses_the_fewest_documents():
+    documents = pack_chunks(make_chunks([3, 3, 3, 3, 3]), token_budget=6)
+
+    assert len(documents) == 3
+
+
+def test_a_chunk_over_the_budget_gets_a_document_of_its_own():
+    documents = pack_chunks(make_chunks([50, 500, 50]), token_budget=100)
+
+    assert packed_ids(documents) == [["c0"], ["c1"], ["c2"]]
+
+
+def test_splits_at_page_breaks_when_it_costs_no_extra_document():
+    # [c0 c1 c2] [c3] would also take two documents, but splits page 2
+    chunks = make_chunks([2, 2, 2, 2], pages=[1, 1, 2, 2])
+
+    documents = pack_chunks(chunks, token_budget=6)
+
+    assert packed_ids(documents) == [["c0", "c1"], ["c2", "c3"]]
+
+
+def test_never_mixes_chunks_of_two_files():
+    chunks = make_chunks([10, 10, 10, 10], files=["a.pdf", "a.pdf", "b.pdf", "b.pdf"])
+
+    documents = pack_chunks(chunks, token_budget=1000)
+
+    assert packed_ids(documents) == [["c0", "c1"], ["c2", "c3"]]
+
+
+def test_nothing_to_pack():
+    assert pack_chunks([], token_budget=100) == []